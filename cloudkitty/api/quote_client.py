@@ -0,0 +1,143 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import threading
+
+from oslo_config import cfg
+from oslo_log import log
+import oslo_messaging
+
+from cloudkitty.db import api as db_api
+
+LOG = log.getLogger(__name__)
+
+quote_client_opts = [
+    cfg.BoolOpt('local_quotes',
+                default=False,
+                help='Answer quote requests in the API process instead of '
+                     'sending them to a processor. The API loads the '
+                     'enabled rating modules itself, and loads them again '
+                     'when a module is enabled, disabled or has its '
+                     'priority changed.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(quote_client_opts, group='api')
+
+# NOTE: Version of the rating endpoint in which quote_batch was added
+QUOTE_BATCH_VERSION = '1.1'
+
+_LOCAL_CLIENT = None
+_LOCAL_CLIENT_LOCK = threading.Lock()
+
+
+class LocalQuoteClient(object):
+    """Answers the quote calls of the API in the API process.
+
+    The calls are handled by a RatingEndpoint, as they are by a processor.
+    The version of the modules configuration is checked before each call.
+    When it changed, the rating modules of the endpoint are loaded again if
+    a module was enabled, disabled or had its priority changed. Changes of
+    the rules themselves are detected by the rating modules, through their
+    rules version.
+    """
+
+    methods = ('quote', 'quote_batch')
+
+    def __init__(self):
+        # NOTE: The orchestrator is only needed by the API when quotes are
+        # answered locally.
+        from cloudkitty import orchestrator
+        self._endpoint = orchestrator.RatingEndpoint(None)
+        self._module_db = db_api.get_instance().get_module_info()
+        self._version = None
+        self._modules = None
+        self._lock = threading.Lock()
+
+    def prepare(self, **kwargs):
+        return self
+
+    def _check_modules(self):
+        version = self._module_db.get_modules_version()
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+        modules = [(module['name'], module['state'], module['priority'])
+                   for module in self._module_db.list_modules()]
+        with self._lock:
+            if modules == self._modules:
+                return
+            if self._modules is not None:
+                LOG.info('Rating modules were modified, reloading the '
+                         'modules used for quotes.')
+            self._modules = modules
+        self._endpoint.reload_modules({})
+
+    def call(self, ctxt, method, **kwargs):
+        if method not in self.methods:
+            raise ValueError(
+                "Method '{}' can not be called locally".format(method))
+        self._check_modules()
+        return getattr(self._endpoint, method)(ctxt, **kwargs)
+
+
+def get_client(rpc_client, version=None):
+    """Returns the client quote requests are sent with.
+
+    :param rpc_client: RPC client used when quotes are not answered in the
+                       API process.
+    :param version: Minimal version of the rating endpoint of the processors
+                    the requests are sent to.
+    """
+    global _LOCAL_CLIENT
+    if not CONF.api.local_quotes:
+        if version is None:
+            return rpc_client.prepare(namespace='rating')
+        return rpc_client.prepare(namespace='rating', version=version)
+    with _LOCAL_CLIENT_LOCK:
+        if _LOCAL_CLIENT is None:
+            _LOCAL_CLIENT = LocalQuoteClient()
+        return _LOCAL_CLIENT
+
+
+def _is_unsupported_version(exc):
+    if isinstance(exc, oslo_messaging.UnsupportedVersion):
+        return True
+    return (isinstance(exc, oslo_messaging.RemoteError)
+            and exc.exc_type == 'UnsupportedVersion')
+
+
+def quote_batch(rpc_client, res_data):
+    """Returns the prices of several resource descriptions.
+
+    The descriptions are priced with a single quote_batch call. Processors
+    which do not support it yet get one quote call per description instead.
+
+    :param rpc_client: RPC client used when quotes are not answered in the
+                       API process.
+    :param res_data: List of resource descriptions.
+    :return: List of prices, in the order of the descriptions.
+    """
+    client = get_client(rpc_client, version=QUOTE_BATCH_VERSION)
+    try:
+        return client.call({}, 'quote_batch', res_data=res_data)
+    except (oslo_messaging.UnsupportedVersion,
+            oslo_messaging.RemoteError) as e:
+        if not _is_unsupported_version(e):
+            raise
+        LOG.warning('The processor does not support quote_batch, sending '
+                    'one quote call per resource description.')
+    client = get_client(rpc_client)
+    return [client.call({}, 'quote', res_data=data) for data in res_data]
@@ -21,6 +21,7 @@ from stevedore import extension
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
+from cloudkitty.api import quote_client
 from cloudkitty.api.v1.datamodels import rating as rating_models
 from cloudkitty.common import policy
 from cloudkitty import utils as ck_utils
@@ -197,7 +198,7 @@ class RatingController(rest.RestController):
         """
         policy.authorize(pecan.request.context, 'rating:quote', {})
 
-        client = pecan.request.rpc_client.prepare(namespace='rating')
+        client = quote_client.get_client(pecan.request.rpc_client)
         res_dict = {}
         for res in res_data.resources:
             if res.service not in res_dict:
@@ -27,5 +27,10 @@ def init(app):
             'resource_class': 'RatingModuleList',
             'url': '/modules',
         },
+        {
+            'module': __name__ + '.' + 'quote',
+            'resource_class': 'Quote',
+            'url': '/quote',
+        },
     ])
     return app
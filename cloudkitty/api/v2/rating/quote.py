@@ -0,0 +1,181 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import collections
+import decimal
+import json
+import threading
+import time
+
+import flask
+from oslo_config import cfg
+from oslo_log import log
+import voluptuous
+
+from cloudkitty.api import quote_client
+from cloudkitty.api.v2 import base
+from cloudkitty.api.v2 import utils as api_utils
+from cloudkitty.common import policy
+from cloudkitty.db import api as db_api
+from cloudkitty import messaging
+
+LOG = log.getLogger(__name__)
+
+quote_opts = [
+    cfg.IntOpt('quote_cache_size',
+               default=1000,
+               min=0,
+               help='Maximum number of prices kept in the cache of the v2 '
+                    'quote API. Prices are cached by resource description '
+                    'and by version of the rating rules. Set to 0 to '
+                    'disable the cache.'),
+    cfg.IntOpt('quote_cache_ttl',
+               default=60,
+               min=0,
+               help='Number of seconds a price is kept in the cache of the '
+                    'v2 quote API, so that rules starting or ending after a '
+                    'price was cached are taken into account.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(quote_opts, group='api')
+
+RESOURCE_SCHEMA = {
+    voluptuous.Required('service'): str,
+    voluptuous.Required('qty'): voluptuous.Coerce(decimal.Decimal),
+    voluptuous.Optional('unit', default='undef'): str,
+    voluptuous.Optional('groupby', default={}): dict,
+    voluptuous.Optional('metadata', default={}): dict,
+}
+
+
+class QuoteCache(object):
+    """LRU cache of the prices returned by the v2 quote API.
+
+    Prices are kept for ``quote_cache_ttl`` seconds, and are cached by
+    resource description and by version of the rating rules: the cached
+    prices are not used anymore once a module was enabled, disabled, had
+    its priority changed or its rules modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prices = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                price, timestamp = self._prices[key]
+            except KeyError:
+                return None
+            if time.monotonic() - timestamp > CONF.api.quote_cache_ttl:
+                del self._prices[key]
+                return None
+            self._prices.move_to_end(key)
+            return price
+
+    def set(self, key, price):
+        size = CONF.api.quote_cache_size
+        if size < 1:
+            return
+        with self._lock:
+            self._prices[key] = (price, time.monotonic())
+            self._prices.move_to_end(key)
+            while len(self._prices) > size:
+                self._prices.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._prices.clear()
+
+
+def normalize_resources(resources):
+    """Returns the usage of a resource description in the RPC format.
+
+    Quantities are written in their shortest form and the resources of each
+    service are sorted, so that descriptions of the same resources have the
+    same key in the quote cache.
+    """
+    usage = collections.defaultdict(list)
+    for res in resources:
+        usage[res['service']].append({
+            'vol': {
+                'qty': '{:f}'.format(res['qty'].normalize()),
+                'unit': res['unit'],
+            },
+            'desc': {
+                'groupby': res['groupby'],
+                'metadata': res['metadata'],
+            },
+        })
+    for points in usage.values():
+        points.sort(key=lambda p: json.dumps(p, sort_keys=True))
+    return {'usage': dict(usage)}
+
+
+class Quote(base.BaseResource):
+
+    cache = QuoteCache()
+
+    @classmethod
+    def reload(cls):
+        super(Quote, cls).reload()
+        cls._client = messaging.get_client()
+        cls._module_db = db_api.get_instance().get_module_info()
+
+    def _get_rules_key(self):
+        return tuple(
+            (module['name'], module['state'], module['priority'],
+             module['rules_version'])
+            for module in self._module_db.list_modules())
+
+    @api_utils.add_input_schema('body', {
+        voluptuous.Required('quotes'): [{
+            voluptuous.Required('resources'): [RESOURCE_SCHEMA],
+        }],
+    })
+    @api_utils.add_output_schema({
+        voluptuous.Required('prices'): [decimal.Decimal],
+    })
+    def post(self, quotes=None):
+        policy.authorize(flask.request.context, 'v2_rating:quote', {})
+
+        rules_key = self._get_rules_key()
+        keys = []
+        prices = {}
+        pending = {}
+        for quote in quotes:
+            usage = normalize_resources(quote['resources'])
+            key = (rules_key, json.dumps(usage, sort_keys=True))
+            keys.append(key)
+            if key in prices or key in pending:
+                continue
+            price = self.cache.get(key)
+            if price is None:
+                pending[key] = usage
+            else:
+                prices[key] = price
+
+        if pending:
+            LOG.debug("Calling quote_batch method for %d of %d resource "
+                      "descriptions.", len(pending), len(quotes))
+            results = quote_client.quote_batch(
+                self._client, list(pending.values()))
+            for key, price in zip(pending.keys(), results):
+                prices[key] = price
+                self.cache.set(key, price)
+
+        # NOTE: Prices are returned as decimals, as the v1 quote endpoint
+        # does, so that they are not rounded.
+        return {'prices': [decimal.Decimal(prices[key]) for key in keys]}
@@ -16,6 +16,7 @@
 import abc
 import datetime
 import fractions
+import functools
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -32,7 +33,9 @@ from voluptuous import Required
 from voluptuous import Schema
 
 from cloudkitty.dataframe import DataPoint
+from cloudkitty.dataframe import MappingInterner
 from cloudkitty import utils as ck_utils
+from cloudkitty.utils import tz as tzutils
 
 LOG = logging.getLogger(__name__)
 
@@ -172,10 +175,36 @@ class NoDataCollected(Exception):
         self.resource = resource
 
 
+@functools.lru_cache(maxsize=64)
+def get_calendar_attributes(start):
+    """Returns the calendar groupby attributes of a period as a tuple.
+
+    Results are cached, as every point collected for a given period shares
+    the same attributes.
+
+    :param start: Start of the period
+    :type start: datetime.datetime
+    :rtype: tuple of (str, str)
+    """
+    return (
+        ('week_of_the_year', start.strftime("%U")),
+        ('day_of_the_year', start.strftime("%-j")),
+        ('month', start.strftime("%-m")),
+        ('year', start.strftime("%Y")),
+    )
+
+
 class BaseCollector(object, metaclass=abc.ABCMeta):
     collector_name = None
 
+    # NOTE: Collectors able to collect a metric for all scopes with a single
+    # query should set this to True and override fetch_all_scopes.
+    supports_fleet_collection = False
+
     def __init__(self, **kwargs):
+        # NOTE: points collected in a period share most of their groupby and
+        # metadata mappings, they are deduplicated through this interner.
+        self._interner = MappingInterner()
         try:
             self.period = kwargs['period']
             self.conf = self.check_configuration(kwargs['conf'])
@@ -282,6 +311,139 @@ class BaseCollector(object, metaclass=abc.ABCMeta):
 
         return name, data
 
+    def fetch_all_periods(self, metric_name, start, end, scope_id,
+                          q_filter=None):
+        """Fetches a metric for several consecutive collect periods at once.
+
+        The default implementation issues one fetch_all call per period.
+        Collectors able to fetch a whole window with a single query override
+        it.
+
+        Returns a dict mapping the start of each period to a list of
+        cloudkitty.dataframe.DataPoint objects. Periods without any data are
+        omitted.
+
+        :param metric_name: Name of the metric to fetch
+        :type metric_name: str
+        :param start: start of the first period
+        :type start: datetime.datetime
+        :param end: end of the last period
+        :type end: datetime.datetime
+        :param scope_id: ID of the scope for which data should be collected
+        :type scope_id: str
+        :param q_filter: Optional filters
+        :type q_filter: dict
+        """
+        output = {}
+        for period_start in self._iter_periods(start, end):
+            period_end = tzutils.add_delta(
+                period_start, datetime.timedelta(seconds=self.period))
+            points = self.fetch_all(
+                metric_name, period_start, period_end, scope_id,
+                q_filter=q_filter)
+            if points:
+                output[period_start] = points
+        return output
+
+    def retrieve_periods(self, metric_name, start, end, scope_id,
+                         q_filter=None):
+        """Same as retrieve, for several consecutive periods at once.
+
+        Returns the name of the metric and a dict mapping the start of each
+        period to its DataPoints. Contrary to retrieve, NoDataCollected is
+        not raised.
+        """
+        data = self.fetch_all_periods(
+            metric_name,
+            start,
+            end,
+            scope_id,
+            q_filter=q_filter,
+        )
+
+        name = self.conf[metric_name].get('alt_name', metric_name)
+        return name, data
+
+    def _iter_periods(self, start, end):
+        """Yields the start of each collect period between start and end."""
+        delta = datetime.timedelta(seconds=self.period)
+        period_start = start
+        while period_start < end:
+            yield period_start
+            period_start = tzutils.add_delta(period_start, delta)
+
+    def fetch_all_scopes(self, metric_name, start, end, scope_ids=None,
+                         q_filter=None):
+        """Fetches a metric for several scopes at once.
+
+        The default implementation issues one fetch_all call per scope.
+        Collectors advertising ``supports_fleet_collection`` override it to
+        issue a single query for all scopes.
+
+        Returns a dict mapping scope IDs to lists of
+        cloudkitty.dataframe.DataPoint objects. Scopes without any data are
+        omitted.
+
+        :param metric_name: Name of the metric to fetch
+        :type metric_name: str
+        :param start: start of the period
+        :type start: datetime.datetime
+        :param end: end of the period
+        :type end: datetime.datetime
+        :param scope_ids: IDs of the scopes to collect. All scopes are
+                          collected if None (only supported by collectors
+                          advertising ``supports_fleet_collection``).
+        :type scope_ids: list
+        :param q_filter: Optional filters
+        :type q_filter: dict
+        """
+        if scope_ids is None:
+            raise NotImplementedError(
+                "Collector '{}' can not collect data for all scopes at "
+                "once".format(self.collector_name))
+        output = {}
+        for scope_id in scope_ids:
+            points = self.fetch_all(
+                metric_name, start, end, scope_id, q_filter=q_filter)
+            if points:
+                output[scope_id] = points
+        return output
+
+    def retrieve_all_scopes(self, metric_name, start, end, scope_ids=None,
+                            q_filter=None):
+        """Same as retrieve, for several scopes at once.
+
+        Returns the name of the metric and a dict mapping scope IDs to their
+        DataPoints. Contrary to retrieve, NoDataCollected is not raised.
+        """
+        data = self.fetch_all_scopes(
+            metric_name,
+            start,
+            end,
+            scope_ids=scope_ids,
+            q_filter=q_filter,
+        )
+
+        name = self.conf[metric_name].get('alt_name', metric_name)
+        return name, data
+
+    @staticmethod
+    def _split_points_by_scope(points, scope_ids=None):
+        """Groups DataPoints by the value of their scope_key groupby.
+
+        :param points: (scope_id, DataPoint) tuples
+        :param scope_ids: If set, points of other scopes are dropped.
+        :rtype: dict
+        """
+        if scope_ids is not None:
+            scope_ids = set(scope_ids)
+        output = {}
+        for scope_id, point in points:
+            if scope_ids is not None and scope_id not in scope_ids:
+                continue
+            output.setdefault(scope_id, []).append(point)
+        return output
+
     def _create_data_point(self, metric, qty, price, groupby, metadata, start):
         unit = metric['unit']
         if not start:
@@ -292,20 +454,14 @@ class BaseCollector(object, metaclass=abc.ABCMeta):
                       "the start time for this datapoint.",
                       self.collector_name, unit, qty, price, groupby, metadata)
 
-        week_of_the_year = start.strftime("%U")
-        day_of_the_year = start.strftime("%-j")
-        month_of_the_year = start.strftime("%-m")
-        year = start.strftime("%Y")
-
         if groupby is None:
             groupby = {}
 
-        groupby['week_of_the_year'] = week_of_the_year
-        groupby['day_of_the_year'] = day_of_the_year
-        groupby['month'] = month_of_the_year
-        groupby['year'] = year
+        groupby.update(get_calendar_attributes(start))
 
-        return DataPoint(unit, qty, price, groupby, metadata,
+        return DataPoint(unit, qty, price,
+                         self._interner.intern(groupby),
+                         self._interner.intern(metadata),
                          metric.get('description'))
 
 
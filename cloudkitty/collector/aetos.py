@@ -18,6 +18,7 @@ from oslo_log import log
 
 from cloudkitty.collector import prometheus_base
 from cloudkitty.common import aetos_client
+from cloudkitty.common import custom_session
 
 
 LOG = log.getLogger(__name__)
@@ -37,6 +38,13 @@ collector_aetos_opts = [
         help='Region in Identity service catalog to use for communication '
              'with the OpenStack service.',
     ),
+    cfg.BoolOpt(
+        'response_compression',
+        default=True,
+        help='Ask Aetos for gzip compressed query responses. Compression '
+             'reduces the size of large responses, at the cost of the CPU '
+             'time spent compressing and decompressing them.',
+    ),
 ]
 
 ks_loading.register_session_conf_options(cfg.CONF, COLLECTOR_AETOS_OPTS)
@@ -44,6 +52,7 @@ ks_loading.register_auth_conf_options(cfg.CONF, COLLECTOR_AETOS_OPTS)
 cfg.CONF.register_opts(collector_aetos_opts, COLLECTOR_AETOS_OPTS)
 
 CONF = cfg.CONF
+CONF.import_opt('max_threads', 'cloudkitty.orchestrator', 'orchestrator')
 
 
 class AetosCollector(prometheus_base.PrometheusCollectorBase):
@@ -65,8 +74,13 @@ class AetosCollector(prometheus_base.PrometheusCollectorBase):
             COLLECTOR_AETOS_OPTS,
         )
 
+        # NOTE: The session is shared by the threads of the collector, its
+        # connections are kept alive between queries.
         session = ks_loading.load_session_from_conf_options(
-            CONF, COLLECTOR_AETOS_OPTS, auth=auth_plugin)
+            CONF, COLLECTOR_AETOS_OPTS, auth=auth_plugin,
+            session=custom_session.create_requests_session(
+                CONF.orchestrator.max_threads,
+                compression=CONF.collector_aetos.response_compression))
 
         adapter_options = {
             'interface': CONF.collector_aetos.interface,
@@ -13,8 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import collections
 import copy
 from datetime import timedelta
+import json
+import threading
+
 import requests
 
 from gnocchiclient import auth as gauth
@@ -72,7 +76,30 @@ collector_gnocchi_opts = [
         default=requests.adapters.DEFAULT_POOLSIZE,
         help='If the value is not defined, we use the value defined by '
              'requests.adapters.DEFAULT_POOLSIZE',
-    )
+    ),
+    cfg.IntOpt(
+        'resource_cache_size',
+        default=10000,
+        min=0,
+        help='Maximum number of (resource type, scope) pairs whose '
+             'resources are kept in cache between collect cycles. Cached '
+             'resources are refreshed with the resources modified since '
+             'the previous query. It should be at least the number of '
+             'scopes processed by a processor, multiplied by the number of '
+             'resource types of the metrics configuration: otherwise, the '
+             'least recently used pairs are evicted before the next cycle, '
+             'and all their resources are queried again. Each pair keeps '
+             'the resources of its scope in memory. Set to 0 to query all '
+             'resources on each collect cycle.',
+    ),
+    cfg.IntOpt(
+        'resource_cache_refresh_period',
+        default=86400,
+        min=1,
+        help='Number of seconds after which all the resources of a cached '
+             '(resource type, scope) pair are queried again, so that '
+             'resources deleted from Gnocchi are not kept in cache.',
+    ),
 ]
 
 ks_loading.register_session_conf_options(cfg.CONF, COLLECTOR_GNOCCHI_OPTS)
@@ -143,10 +170,65 @@ class AssociatedResourceNotFound(Exception):
         )
 
 
+class CachedResources(object):
+    """Resources of a resource type and scope, as of the last query.
+
+    :ivar resources: Resources, by ID.
+    :ivar start: Resources ended before this date are not cached.
+    :ivar end: End of the latest timeframe resources were queried for.
+    :ivar synced_at: Date of the last query.
+    :ivar full_synced_at: Date of the last query for all resources.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.start = None
+        self.end = None
+        self.synced_at = None
+        self.full_synced_at = None
+
+
+class ResourceCache(object):
+    """LRU cache of the resources fetched by the Gnocchi collector.
+
+    Resources are cached by resource type, scope and filter, so that they
+    are shared by all the metrics using the same resource type.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """Returns the CachedResources of a key, created if needed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = CachedResources()
+            self._entries.move_to_end(key)
+            while len(self._entries) > (
+                    CONF.collector_gnocchi.resource_cache_size):
+                self._entries.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 class GnocchiCollector(collector.BaseCollector):
 
     collector_name = 'gnocchi'
 
+    # NOTE: scope_key is always part of the aggregates "groupby", so the
+    # measures of all scopes can be fetched with a single query.
+    supports_fleet_collection = True
+
+    # NOTE: Resources modified shortly before the previous query are
+    # queried again, in case the clocks of CloudKitty and Gnocchi differ.
+    RESOURCE_SYNC_MARGIN = timedelta(minutes=5)
+
     def __init__(self, **kwargs):
         super(GnocchiCollector, self).__init__(**kwargs)
 
@@ -177,6 +259,7 @@ class GnocchiCollector(collector.BaseCollector):
                 CONF.collector_gnocchi.http_pool_maxsize),
             adapter_options=adapter_options,
         )
+        self._resource_cache = ResourceCache()
 
     @staticmethod
     def check_configuration(conf):
@@ -260,10 +343,31 @@ class GnocchiCollector(collector.BaseCollector):
             self.gen_filter(cop="<=", started_at=end.isoformat()))
         return time_filter
 
+    def _search_resources(self, resource_type, query_parameters, sort_key):
+        """Returns all the resources matching a query, page by page."""
+        sorts = [sort_key + ':asc']
+        resources = []
+        marker = None
+        while True:
+            resources_chunk = self._conn.resource.search(
+                resource_type=resource_type,
+                query=self.extend_filter(*query_parameters),
+                sorts=sorts,
+                marker=marker)
+            if len(resources_chunk) < 1:
+                break
+            resources += resources_chunk
+            marker = resources_chunk[-1][sort_key]
+        return resources
+
     def _fetch_resources(self, metric_name, start, end,
                          project_id=None, q_filter=None):
         """Get resources during the timeframe.
 
+        Unless the resource cache is disabled, the resources are taken from
+        the cache, which is refreshed with the resources modified since the
+        previous query.
+
         :type metric_name: str
         :param start: Start of the timeframe.
         :param end: End of the timeframe if needed.
@@ -276,9 +380,7 @@ class GnocchiCollector(collector.BaseCollector):
         # Get gnocchi specific conf
         extra_args = self.conf[metric_name]['extra_args']
         resource_type = extra_args['resource_type']
-        scope_key = CONF.collect.scope_key
-
-        # Build query
+        resource_key = extra_args['resource_key']
 
         # FIXME(peschk_l): In order not to miss any resource whose metrics may
         # contain measures after its destruction, we scan resources over three
@@ -286,28 +388,79 @@ class GnocchiCollector(collector.BaseCollector):
         delta = timedelta(seconds=CONF.collect.period)
         start = tzutils.substract_delta(start, delta)
         end = tzutils.add_delta(end, delta)
-        query_parameters = self._generate_time_filter(start, end)
 
+        if CONF.collector_gnocchi.resource_cache_size < 1:
+            query_parameters = self._generate_time_filter(start, end)
+            query_parameters += self._generate_scope_filter(
+                project_id, q_filter)
+            resources = self._search_resources(
+                resource_type, query_parameters, resource_key)
+        else:
+            entry = self._resource_cache.get(
+                (resource_type, project_id,
+                 json.dumps(q_filter, sort_keys=True)))
+            with entry.lock:
+                self._sync_resources(
+                    entry, resource_type, start, end, project_id, q_filter)
+                resources = list(entry.resources.values())
+
+        return {res[resource_key]: res for res in resources}
+
+    def _generate_scope_filter(self, project_id, q_filter):
+        query_parameters = []
         if project_id:
-            kwargs = {scope_key: project_id}
+            kwargs = {CONF.collect.scope_key: project_id}
             query_parameters.append(self.gen_filter(**kwargs))
         if q_filter:
             query_parameters.append(q_filter)
+        return query_parameters
 
-        sorts = [extra_args['resource_key'] + ':asc']
-        resources = []
-        marker = None
-        while True:
-            resources_chunk = self._conn.resource.search(
-                resource_type=resource_type,
-                query=self.extend_filter(*query_parameters),
-                sorts=sorts,
-                marker=marker)
-            if len(resources_chunk) < 1:
-                break
-            resources += resources_chunk
-            marker = resources_chunk[-1][extra_args['resource_key']]
-        return {res[extra_args['resource_key']]: res for res in resources}
+    def _sync_resources(self, entry, resource_type, start, end,
+                        project_id, q_filter):
+        """Refreshes cached resources for a timeframe.
+
+        All resources which did not end before the timeframe are queried
+        the first time, if the timeframe starts before the cached one or
+        once every ``resource_cache_refresh_period`` seconds. Otherwise,
+        only the resources modified or ended since the previous query are.
+        Nothing is queried if the resources were already refreshed for the
+        timeframe.
+        """
+        now = tzutils.localized_now()
+        utc_start = tzutils.local_to_utc(start, naive=True)
+        utc_end = tzutils.local_to_utc(end, naive=True)
+        refresh_period = timedelta(
+            seconds=CONF.collector_gnocchi.resource_cache_refresh_period)
+        if (entry.synced_at is None or utc_start < entry.start
+                or now - entry.full_synced_at >= refresh_period):
+            query_parameters = [self.extend_filter(
+                self.gen_filter(ended_at=None),
+                self.gen_filter(cop=">=", ended_at=start.isoformat()),
+                lop='or')]
+            entry.resources = {}
+            entry.full_synced_at = now
+        elif utc_end <= entry.end:
+            return
+        else:
+            since = (entry.synced_at - self.RESOURCE_SYNC_MARGIN).isoformat()
+            query_parameters = [self.extend_filter(
+                self.gen_filter(cop=">=", revision_start=since),
+                self.gen_filter(cop=">=", ended_at=since),
+                lop='or')]
+        query_parameters += self._generate_scope_filter(project_id, q_filter)
+
+        for res in self._search_resources(
+                resource_type, query_parameters, 'id'):
+            entry.resources[res['id']] = res
+        for res_id, res in list(entry.resources.items()):
+            ended_at = res.get('ended_at')
+            if ended_at and tzutils.local_to_utc(
+                    tzutils.dt_from_iso(ended_at), naive=True) < utc_start:
+                del entry.resources[res_id]
+
+        entry.start = utc_start
+        entry.end = utc_end if entry.end is None else max(utc_end, entry.end)
+        entry.synced_at = now
 
     def _fetch_metric(self, metric_name, start, end,
                       project_id=None, q_filter=None):
@@ -416,10 +569,11 @@ class GnocchiCollector(collector.BaseCollector):
 
         return op
 
-    def _format_data(self, metconf, data, resources_info=None):
+    def _format_data(self, metconf, data, resources_info=None, measure=None):
         """Formats gnocchi data to CK data.
 
-        Returns metadata, groupby and qty
+        Returns metadata, groupby and qty. The quantity is taken from the
+        first aggregated measure, unless a specific measure is given.
 
         """
         groupby = data['group']
@@ -435,7 +589,9 @@ class GnocchiCollector(collector.BaseCollector):
                 raise AssociatedResourceNotFound(resource_key, resource_id)
             for i in metconf['metadata']:
                 metadata[i] = resource.get(i, '')
-        qty = data['measures']['measures']['aggregated'][0][2]
+        if measure is None:
+            measure = data['measures']['measures']['aggregated'][0]
+        qty = measure[2]
         converted_qty = ck_utils.convert_unit(
             qty, metconf['factor'], metconf['offset'])
         mutate_map = metconf.get('mutate_map')
@@ -492,6 +648,79 @@ class GnocchiCollector(collector.BaseCollector):
 
         return formated_resources
 
+    def fetch_all_periods(self, metric_name, start, end, project_id=None,
+                          q_filter=None):
+        """Returns metrics to be valorized for several periods.
+
+        If the metric is aggregated with a granularity of one collect period,
+        the aggregates of the whole window are fetched with a single query
+        and split on the timestamp of their measures. Otherwise, one query
+        per period is issued.
+        """
+        met = self.conf[metric_name]
+        extra_args = met['extra_args']
+        # NOTE: "rate:" re-aggregations need the measure preceding each
+        # period, and filtering resource revisions is done per period.
+        if (extra_args['force_granularity'] != self.period
+                or extra_args['re_aggregation_method'].startswith('rate:')
+                or not extra_args['use_all_resource_revisions']):
+            return super(GnocchiCollector, self).fetch_all_periods(
+                metric_name, start, end, project_id, q_filter=q_filter)
+
+        data = self._fetch_metric(
+            metric_name,
+            start,
+            end,
+            project_id=project_id,
+            q_filter=q_filter,
+        )
+
+        resources_info = None
+        if met['metadata']:
+            resources_info = self._fetch_resources(
+                metric_name,
+                start,
+                end,
+                project_id=project_id,
+                q_filter=q_filter
+            )
+
+        output = {}
+        for d in data:
+            for measure in d['measures']['measures']['aggregated']:
+                period_start = measure[0]
+                if isinstance(period_start, str):
+                    period_start = tzutils.dt_from_iso(period_start)
+                try:
+                    metadata, groupby, qty = self._format_data(
+                        met, d, resources_info, measure=measure)
+                except AssociatedResourceNotFound as e:
+                    LOG.warning(
+                        '[%s] An error occured during data collection '
+                        'between %s and %s: %s',
+                        project_id, start, end, e
+                    )
+                    continue
+                point = self._create_data_point(met, qty, 0, groupby,
+                                                metadata, period_start)
+                output.setdefault(period_start, []).append(point)
+
+        return output
+
+    def fetch_all_scopes(self, metric_name, start, end, scope_ids=None,
+                         q_filter=None):
+        """Returns metrics to be valorized for several scopes.
+
+        Aggregates are fetched once for all scopes, grouped by scope_key,
+        and split per scope.
+        """
+        scope_key = CONF.collect.scope_key
+        points = self.fetch_all(metric_name, start, end, project_id=None,
+                                q_filter=q_filter)
+        return self._split_points_by_scope(
+            ((point.groupby.get(scope_key), point) for point in points),
+            scope_ids)
+
     @staticmethod
     def filter_unecessary_measurements(data, met, metric_name):
         """Filter unecessary measurements if not 'use_all_resource_revisions'
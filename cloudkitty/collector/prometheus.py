@@ -52,10 +52,18 @@ collector_prometheus_opts = [
         min=0,
         help='Timeout value for http requests',
     ),
+    cfg.BoolOpt(
+        'response_compression',
+        default=True,
+        help='Ask Prometheus for gzip compressed query responses. '
+             'Compression reduces the size of large responses, at the cost '
+             'of the CPU time spent compressing and decompressing them.',
+    ),
 ]
 cfg.CONF.register_opts(collector_prometheus_opts, PROMETHEUS_COLLECTOR_OPTS)
 
 CONF = cfg.CONF
+CONF.import_opt('max_threads', 'cloudkitty.orchestrator', 'orchestrator')
 
 
 class PrometheusCollector(prometheus_base.PrometheusCollectorBase):
@@ -78,5 +86,7 @@ class PrometheusCollector(prometheus_base.PrometheusCollectorBase):
             url,
             auth=(user, password) if user and password else None,
             verify=verify,
-            timeout=CONF.collector_prometheus.timeout
+            timeout=CONF.collector_prometheus.timeout,
+            pool_size=CONF.orchestrator.max_threads,
+            compression=CONF.collector_prometheus.response_compression,
         )
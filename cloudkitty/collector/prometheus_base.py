@@ -12,9 +12,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+from datetime import timedelta
 from decimal import Decimal
 from decimal import localcontext
 from decimal import ROUND_HALF_UP
+import itertools
 
 from oslo_config import cfg
 from oslo_log import log
@@ -71,6 +73,10 @@ class PrometheusCollectorBase(collector.BaseCollector):
     # Subclasses must set collector_name and initialize self._conn
     collector_name = None
 
+    # NOTE: scope_key is always part of the "by" clause of the query, so
+    # the results of a query without scope filter can be split per scope.
+    supports_fleet_collection = True
+
     @staticmethod
     def check_configuration(conf):
         conf = collector.BaseCollector.check_configuration(conf)
@@ -84,38 +90,60 @@ class PrometheusCollectorBase(collector.BaseCollector):
 
         return output
 
-    def _format_data(self, metric_name, scope_key, scope_id, start, end, data):
-        """Formats Prometheus data format to Cloudkitty data format.
+    # Number of result items whose quantities are converted at once
+    CONVERT_BATCH_SIZE = 1000
 
-        Returns metadata, groupby, qty
-        """
+    def _format_labels(self, metric_name, scope_key, scope_id, labels):
+        """Returns the metadata and groupby of a Prometheus series."""
         metadata = {}
         for meta in self.conf[metric_name]['metadata']:
-            metadata[meta] = data['metric'].get(meta, '')
+            metadata[meta] = labels.get(meta, '')
 
         groupby = {scope_key: scope_id}
         for meta in self.conf[metric_name]['groupby']:
-            groupby[meta] = data['metric'].get(meta, '')
+            groupby[meta] = labels.get(meta, '')
+
+        return metadata, groupby
+
+    def _convert_quantities(self, metric_name, values):
+        """Converts Prometheus values to quantities.
 
+        All values are converted within the same decimal context.
+        """
+        conf = self.conf[metric_name]
+        mutate_map = conf.get('mutate_map')
         with localcontext() as ctx:
             ctx.prec = 9
             ctx.rounding = ROUND_HALF_UP
 
-            qty = ck_utils.convert_unit(
-                +Decimal(data['value'][1]),
-                self.conf[metric_name]['factor'],
-                self.conf[metric_name]['offset'],
-            )
-            mutate_map = self.conf[metric_name].get('mutate_map')
-            qty = ck_utils.mutate(qty, self.conf[metric_name]['mutate'],
-                                  mutate_map=mutate_map)
+            return [
+                ck_utils.mutate(
+                    ck_utils.convert_unit(
+                        +Decimal(value), conf['factor'], conf['offset']),
+                    conf['mutate'],
+                    mutate_map=mutate_map,
+                )
+                for value in values
+            ]
 
+    def _format_data(self, metric_name, scope_key, scope_id, start, end, data):
+        """Formats Prometheus data format to Cloudkitty data format.
+
+        Returns metadata, groupby, qty
+        """
+        metadata, groupby = self._format_labels(
+            metric_name, scope_key, scope_id, data['metric'])
+        qty = self._convert_quantities(metric_name, [data['value'][1]])[0]
         return metadata, groupby, qty
 
     @staticmethod
     def build_query(conf, metric_name, start, end, scope_key, scope_id,
                     groupby, metadata):
-        """Builds the query for the metrics to be valorized."""
+        """Builds the query for the metrics to be valorized.
+
+        If scope_id is None, the query is not filtered on scope_key and
+        returns the data of all scopes.
+        """
 
         method = conf[metric_name]['extra_args']['aggregation_method']
         query_function = conf[metric_name]['extra_args'].get(
@@ -128,12 +156,15 @@ class PrometheusCollectorBase(collector.BaseCollector):
         period = tzutils.diff_seconds(end, start)
 
         # The metric with the period
-        query = '{0}{{{1}="{2}"}}[{3}s]'.format(
-            query_metric,
-            scope_key,
-            scope_id,
-            period
-        )
+        if scope_id is None:
+            query = '{0}[{1}s]'.format(query_metric, period)
+        else:
+            query = '{0}{{{1}="{2}"}}[{3}s]'.format(
+                query_metric,
+                scope_key,
+                scope_id,
+                period
+            )
         # Applying the aggregation_method or the range_function on
         # a Range Vector
         if range_function is not None:
@@ -175,55 +206,117 @@ class PrometheusCollectorBase(collector.BaseCollector):
 
     def fetch_all(self, metric_name, start, end, scope_id, q_filter=None):
         """Returns metrics to be valorized."""
-        time = end
-        metadata = self.conf[metric_name].get('metadata', [])
-        groupby = self.conf[metric_name].get('groupby', [])
+        return [point for _, point in self._fetch_points(
+            metric_name, start, end, scope_id)]
+
+    def fetch_all_scopes(self, metric_name, start, end, scope_ids=None,
+                         q_filter=None):
+        """Returns metrics to be valorized for several scopes.
+
+        A single query is issued for all scopes, its results are split on
+        the value of the scope_key label.
+        """
+        return self._split_points_by_scope(
+            self._fetch_points(metric_name, start, end), scope_ids)
+
+    def fetch_all_periods(self, metric_name, start, end, scope_id,
+                          q_filter=None):
+        """Returns metrics to be valorized for several periods.
+
+        A single range query is issued, evaluated at the end of every period
+        of the window with a step of one period.
+        """
+        period = timedelta(seconds=self.period)
+        first_end = tzutils.add_delta(start, period)
+        query = self._build_metric_query(
+            metric_name, start, first_end, scope_id)
+
+        LOG.debug("Executing Prometheus range query [%s]", query)
+
+        items = self._iter_query(
+            self._conn.iter_range,
+            query,
+            first_end.isoformat(),
+            end.isoformat(),
+            '{}s'.format(self.period),
+        )
+
         scope_key = CONF.collect.scope_key
+        output = {}
+        for batch in self._iter_batches(items):
+            qtys = iter(self._convert_quantities(
+                metric_name,
+                [value[1] for item in batch
+                 for value in item.get('values', [])]))
+            for item in batch:
+                for value in item.get('values', []):
+                    period_end = tzutils.dt_from_ts(float(value[0]))
+                    period_start = tzutils.substract_delta(period_end, period)
+                    metadata, groupby = self._format_labels(
+                        metric_name, scope_key, scope_id, item['metric'])
+                    point = self._create_data_point(
+                        self.conf[metric_name], next(qtys), 0, groupby,
+                        metadata, period_start)
+                    output.setdefault(period_start, []).append(point)
+
+        return output
 
-        query = self.build_query(
+    def _build_metric_query(self, metric_name, start, end, scope_id):
+        return self.build_query(
             self.conf,
             metric_name,
             start,
             end,
-            scope_key,
+            CONF.collect.scope_key,
             scope_id,
-            groupby,
-            metadata
+            self.conf[metric_name].get('groupby', []),
+            self.conf[metric_name].get('metadata', []),
         )
 
-        LOG.debug("Executing Prometheus query [%s]", query)
-
+    @staticmethod
+    def _iter_query(method, query, *args):
+        """Yields the result items of a query, as they are decoded."""
         try:
-            res = self._conn.get_instant(
-                query,
-                time.isoformat(),
-            )
+            yield from method(query, *args)
         except PrometheusResponseError as e:
             raise CollectError(*e.args)
 
-        if res['status'] == 'error':
-            error_type = res['errorType']
-            error_msg = res['error']
-            raise CollectError("%s: %s" % (error_type, error_msg))
+    def _iter_batches(self, items):
+        items = iter(items)
+        while True:
+            batch = list(itertools.islice(items, self.CONVERT_BATCH_SIZE))
+            if not batch:
+                return
+            yield batch
 
-        # If the query returns an empty dataset,
-        # return an empty list
-        if not res['data']['result']:
-            return []
+    def _fetch_points(self, metric_name, start, end, scope_id=None):
+        """Yields (scope_id, DataPoint) tuples.
 
-        formatted_resources = []
+        DataPoints are yielded as the response of the query is decoded. If
+        scope_id is None, the data of all scopes is fetched.
+        """
+        time = end
+        scope_key = CONF.collect.scope_key
 
-        for item in res['data']['result']:
-            metadata, groupby, qty = self._format_data(
-                metric_name,
-                scope_key,
-                scope_id,
-                start,
-                end,
-                item,
-            )
-            point = self._create_data_point(self.conf[metric_name], qty,
-                                            0, groupby, metadata, start)
-            formatted_resources.append(point)
+        query = self._build_metric_query(metric_name, start, end, scope_id)
+
+        LOG.debug("Executing Prometheus query [%s]", query)
+
+        items = self._iter_query(
+            self._conn.iter_instant,
+            query,
+            time.isoformat(),
+        )
 
-        return formatted_resources
+        for batch in self._iter_batches(items):
+            qtys = self._convert_quantities(
+                metric_name, [item['value'][1] for item in batch])
+            for item, qty in zip(batch, qtys):
+                item_scope_id = scope_id
+                if item_scope_id is None:
+                    item_scope_id = item['metric'].get(scope_key, '')
+                metadata, groupby = self._format_labels(
+                    metric_name, scope_key, item_scope_id, item['metric'])
+                point = self._create_data_point(self.conf[metric_name], qty,
+                                                0, groupby, metadata, start)
+                yield item_scope_id, point
@@ -73,3 +73,27 @@ class AetosClient(prometheus_client_base.PrometheusClientBase):
                 'Could not get a valid json response for '
                 'query {} (error: {})'.format(query, e)
             )
+
+    def get_range(self, query, start, end, step, timeout=None):
+        """Execute range query against Aetos.
+
+        :param query: PromQL query string
+        :param start: Start timestamp (ISO format)
+        :param end: End timestamp (ISO format)
+        :param step: Query resolution step
+        :param timeout: Query timeout
+        :return: JSON response dict
+        :raises: PrometheusResponseError on invalid response
+        """
+        try:
+            res = self._get(
+                self.RANGE_QUERY_ENDPOINT,
+                params={'query': query, 'start': start, 'end': end,
+                        'step': step, 'timeout': timeout},
+            )
+            return res
+        except prometheus_client.PrometheusAPIClientError as e:
+            raise prometheus_client_base.PrometheusResponseError(
+                'Could not get a valid json response for '
+                'query {} (error: {})'.format(query, e)
+            )
@@ -19,6 +19,8 @@ import itertools
 from keystoneauth1 import loading as ks_loading
 
 import cloudkitty.api.app
+import cloudkitty.api.quote_client
+import cloudkitty.api.v2.rating.quote
 import cloudkitty.collector.aetos
 import cloudkitty.collector.gnocchi
 import cloudkitty.collector.prometheus
@@ -29,6 +31,8 @@ import cloudkitty.fetcher.keystone
 import cloudkitty.fetcher.prometheus
 import cloudkitty.fetcher.source
 import cloudkitty.orchestrator
+import cloudkitty.rating.hash
+import cloudkitty.rating.pyscripts.executor
 import cloudkitty.service
 import cloudkitty.storage
 import cloudkitty.storage.v1.hybrid.backends.gnocchi
@@ -42,7 +46,9 @@ __all__ = ['list_opts']
 
 _opts = [
     ('api', list(itertools.chain(
-        cloudkitty.api.app.api_opts,))),
+        cloudkitty.api.app.api_opts,
+        cloudkitty.api.quote_client.quote_client_opts,
+        cloudkitty.api.v2.rating.quote.quote_opts))),
     ('collect', list(itertools.chain(
         cloudkitty.collector.collect_opts))),
     ('collector_aetos', list(itertools.chain(
@@ -70,8 +76,12 @@ _opts = [
         cloudkitty.fetcher.prometheus.fetcher_prometheus_opts))),
     ('fetcher_source', list(itertools.chain(
         cloudkitty.fetcher.source.fetcher_source_opts))),
+    ('hashmap', list(itertools.chain(
+        cloudkitty.rating.hash.hashmap_opts))),
     ('orchestrator', list(itertools.chain(
         cloudkitty.orchestrator.orchestrator_opts))),
+    ('pyscripts', list(itertools.chain(
+        cloudkitty.rating.pyscripts.executor.pyscripts_opts))),
     ('storage', list(itertools.chain(
         cloudkitty.storage.storage_opts))),
     ('storage_influxdb', list(itertools.chain(
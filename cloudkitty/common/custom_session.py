@@ -24,14 +24,25 @@ from oslo_config import cfg
 LOG = logging.getLogger(__name__)
 
 
-def create_custom_session(session_options, pool_size):
+def create_requests_session(pool_size, compression=True):
+    """Returns a requests session keeping its connections alive.
+
+    :param pool_size: Maximum number of connections kept per host. Should
+                      be at least the number of threads using the session.
+    :param compression: Whether gzip compressed responses are accepted.
+    """
     LOG.debug("Using custom connection pool size: %s", pool_size)
     session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip' if compression else 'identity'
     session.adapters['http://'] = ks_session.TCPKeepAliveAdapter(
         pool_maxsize=pool_size)
     session.adapters['https://'] = ks_session.TCPKeepAliveAdapter(
         pool_maxsize=pool_size)
+    return session
 
+
+def create_custom_session(session_options, pool_size):
+    session = create_requests_session(pool_size)
     return ks_session.Session(session=session, **session_options)
 
 
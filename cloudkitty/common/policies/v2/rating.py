@@ -38,6 +38,14 @@ rating_policies = [
         description='Change the state and priority of a module.',
         operations=[{'path': '/v2/rating/modules/{module_id}',
                      'method': 'PUT'}],
+        scope_types=['project']),
+    policy.DocumentedRuleDefault(
+        name='v2_rating:quote',
+        check_str='rule:rating:quote',
+        description='Get the prices of several resource descriptions. '
+                    'Defaults to the rule of the v1 quote endpoint.',
+        operations=[{'path': '/v2/rating/quote',
+                     'method': 'POST'}],
         scope_types=['project'])
 ]
 
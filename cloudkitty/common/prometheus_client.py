@@ -12,27 +12,135 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import codecs
+import contextlib
+import json
+import re
+
 import requests
 
+from cloudkitty.common import custom_session
 from cloudkitty.common import prometheus_client_base
 
+RESULT_START_RE = re.compile(r'"result"\s*:\s*\[')
+RESULT_TYPE_RE = re.compile(r'"resultType"\s*:\s*"([^"]*)"')
+ERROR_STATUS_RE = re.compile(r'"status"\s*:\s*"error"')
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+def iter_result_items(chunks):
+    """Yields the items of the result list of a response, one at a time.
+
+    The response is decoded as its chunks are read, only the item being
+    decoded is kept in memory rather than the whole response.
+
+    :param chunks: Iterable of the bytes of a JSON response.
+    :raises: ValueError on invalid JSON
+    :raises: PrometheusResponseError if the response has an error status,
+             or if its result is not a vector or a matrix
+    """
+    chunks = iter(chunks)
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    decoder = json.JSONDecoder()
+
+    def read(buf):
+        for chunk in chunks:
+            text = text_decoder.decode(chunk)
+            if text:
+                return buf + text
+        return None
+
+    buf = ''
+    while True:
+        match = RESULT_START_RE.search(buf)
+        if match is not None and not ERROR_STATUS_RE.search(
+                buf, 0, match.start()):
+            break
+        more = read(buf)
+        if more is None:
+            # NOTE: Error responses have no result list, they are small
+            # enough to be decoded at once.
+            res = json.loads(buf + text_decoder.decode(b'', final=True))
+            prometheus_client_base.check_response_status(res)
+            raise ValueError('No result list in response')
+        buf = more
+
+    # NOTE: Prometheus writes the result type before the result. Scalar and
+    # string results are lists too, their items must not be yielded.
+    type_match = RESULT_TYPE_RE.search(buf, 0, match.start())
+    if type_match is not None:
+        prometheus_client_base.check_result_type(type_match.group(1))
+
+    pos = match.end()
+    while True:
+        pos = SEPARATOR_RE.match(buf, pos).end()
+        if buf.startswith(']', pos):
+            break
+        try:
+            item, pos = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # The item is not complete yet, the decoded items are dropped
+            # from the buffer before reading the next chunk.
+            more = read(buf[pos:])
+            if more is None:
+                raise
+            buf, pos = more, 0
+            continue
+        if type_match is None and not isinstance(item, dict):
+            prometheus_client_base.check_result_type(None)
+        yield item
+
+    # NOTE: The end of the response is read so that the connection can be
+    # used again by the session.
+    tail = buf[pos:]
+    for chunk in chunks:
+        if type_match is None:
+            tail += text_decoder.decode(chunk)
+    if type_match is None:
+        type_match = RESULT_TYPE_RE.search(tail)
+        prometheus_client_base.check_result_type(
+            type_match.group(1) if type_match else None)
+
 
 class PrometheusClient(prometheus_client_base.PrometheusClientBase):
-    def __init__(self, url, auth=None, verify=True, timeout=60):
+
+    # Size of the chunks in which streamed responses are read
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, url, auth=None, verify=True, timeout=60,
+                 pool_size=requests.adapters.DEFAULT_POOLSIZE,
+                 compression=True):
         self.url = url
         self.auth = auth
         self.verify = verify
         self.timeout = timeout
+        # NOTE: The session is shared by the threads of the collector, its
+        # connections are kept alive between queries.
+        self._session = custom_session.create_requests_session(
+            pool_size, compression=compression)
 
-    def _get(self, endpoint, params):
-        return requests.get(
+    def _get(self, endpoint, params, stream=False):
+        return self._session.get(
             '{}/{}'.format(self.url, endpoint),
             params=params,
             auth=self.auth,
             verify=self.verify,
             timeout=self.timeout,
+            stream=stream,
         )
 
+    def _iter_result(self, endpoint, params):
+        res = self._get(endpoint, params, stream=True)
+        with contextlib.closing(res):
+            try:
+                yield from iter_result_items(
+                    res.iter_content(self.CHUNK_SIZE))
+            except ValueError:
+                raise prometheus_client_base.PrometheusResponseError(
+                    'Could not get a valid json response for '
+                    '{}'.format(res.url)
+                )
+
     def get_instant(self, query, time=None, timeout=None):
         res = self._get(
             self.INSTANT_QUERY_ENDPOINT,
@@ -45,3 +153,30 @@ class PrometheusClient(prometheus_client_base.PrometheusClientBase):
                 'Could not get a valid json response for '
                 '{} (response: {})'.format(res.url, res.text)
             )
+
+    def get_range(self, query, start, end, step, timeout=None):
+        res = self._get(
+            self.RANGE_QUERY_ENDPOINT,
+            params={'query': query, 'start': start, 'end': end,
+                    'step': step, 'timeout': timeout},
+        )
+        try:
+            return res.json()
+        except ValueError:
+            raise prometheus_client_base.PrometheusResponseError(
+                'Could not get a valid json response for '
+                '{} (response: {})'.format(res.url, res.text)
+            )
+
+    def iter_instant(self, query, time=None, timeout=None):
+        return self._iter_result(
+            self.INSTANT_QUERY_ENDPOINT,
+            params={'query': query, 'time': time, 'timeout': timeout},
+        )
+
+    def iter_range(self, query, start, end, step, timeout=None):
+        return self._iter_result(
+            self.RANGE_QUERY_ENDPOINT,
+            params={'query': query, 'start': start, 'end': end,
+                    'step': step, 'timeout': timeout},
+        )
@@ -19,13 +19,37 @@ class PrometheusResponseError(Exception):
     pass
 
 
+# Result types of the queries returning a list of series
+SERIES_RESULT_TYPES = ('vector', 'matrix')
+
+
+def check_response_status(res):
+    """Raises PrometheusResponseError if a response has an error status.
+
+    :param res: JSON response dict
+    """
+    if res.get('status') == 'error':
+        raise PrometheusResponseError('{}: {}'.format(
+            res.get('errorType'), res.get('error')))
+
+
+def check_result_type(result_type):
+    """Raises PrometheusResponseError if a result is not a list of series.
+
+    :param result_type: resultType of a response
+    """
+    if result_type not in SERIES_RESULT_TYPES:
+        raise PrometheusResponseError(
+            'Unsupported result type: {}'.format(result_type))
+
+
 class PrometheusClientBase(metaclass=abc.ABCMeta):
     """Abstract base class for Prometheus-compatible clients.
 
     This class defines the interface that all Prometheus-compatible clients
-    must implement. Subclasses should implement the _get and get_instant
-    methods to handle communication with Prometheus or Prometheus-compatible
-    APIs (such as Aetos).
+    must implement. Subclasses should implement the _get, get_instant and
+    get_range methods to handle communication with Prometheus or
+    Prometheus-compatible APIs (such as Aetos).
     """
 
     INSTANT_QUERY_ENDPOINT = 'query'
@@ -52,3 +76,45 @@ class PrometheusClientBase(metaclass=abc.ABCMeta):
         :raises: PrometheusResponseError on invalid JSON
         """
         pass
+
+    @abc.abstractmethod
+    def get_range(self, query, start, end, step, timeout=None):
+        """Execute range query against Prometheus API.
+
+        :param query: PromQL query string
+        :param start: Start timestamp (ISO format string)
+        :param end: End timestamp (ISO format string)
+        :param step: Query resolution step (duration string or seconds)
+        :param timeout: Query timeout
+        :return: JSON response dict
+        :raises: PrometheusResponseError on invalid JSON
+        """
+        pass
+
+    def iter_instant(self, query, time=None, timeout=None):
+        """Execute instant query, yields the items of its result.
+
+        Takes the same parameters as get_instant. Clients able to decode
+        a response as it is received should override this method.
+
+        :raises: PrometheusResponseError on invalid JSON, if the query
+                 failed or if its result is not a vector or a matrix
+        """
+        res = self.get_instant(query, time=time, timeout=timeout)
+        check_response_status(res)
+        check_result_type(res['data'].get('resultType'))
+        yield from res['data']['result']
+
+    def iter_range(self, query, start, end, step, timeout=None):
+        """Execute range query, yields the items of its result.
+
+        Takes the same parameters as get_range. Clients able to decode a
+        response as it is received should override this method.
+
+        :raises: PrometheusResponseError on invalid JSON, if the query
+                 failed or if its result is not a vector or a matrix
+        """
+        res = self.get_range(query, start, end, step, timeout=timeout)
+        check_response_status(res)
+        check_result_type(res['data'].get('resultType'))
+        yield from res['data']['result']
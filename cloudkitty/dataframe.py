@@ -16,6 +16,7 @@ import collections
 import datetime
 import decimal
 import functools
+import sys
 
 import voluptuous
 from werkzeug import datastructures
@@ -47,6 +48,59 @@ _DataPointBase = collections.namedtuple(
     field_names=("unit", "qty", "price", "groupby", "metadata", "description"))
 
 
+def _as_immutable_dict(mapping):
+    if type(mapping) is datastructures.ImmutableDict:
+        return mapping
+    return datastructures.ImmutableDict(mapping)
+
+
+class MappingInterner(object):
+    """Deduplicates the groupby and metadata mappings of DataPoints.
+
+    Equal mappings are replaced by a single shared ImmutableDict, and the
+    string keys of these mappings are interned. Mappings with unhashable
+    values are not deduplicated.
+
+    :param maxsize: Maximal number of distinct mappings to keep. The cache
+                    is emptied once this size is reached.
+    :type maxsize: int
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._mappings = {}
+
+    def __len__(self):
+        return len(self._mappings)
+
+    def intern(self, mapping):
+        """Returns a shared ImmutableDict equal to the given mapping.
+
+        :param mapping: Mapping to intern. None is considered empty.
+        :type mapping: dict
+        :rtype: werkzeug.datastructures.ImmutableDict
+        """
+        if not mapping:
+            mapping = {}
+        try:
+            # NOTE: value types are part of the key, so that {'a': 1} and
+            # {'a': True} are not merged
+            key = (tuple(mapping.items()),
+                   tuple(type(value) for value in mapping.values()))
+            output = self._mappings.get(key)
+        except TypeError:
+            return _as_immutable_dict(mapping)
+
+        if output is None:
+            if len(self._mappings) >= self.maxsize:
+                self._mappings.clear()
+            output = datastructures.ImmutableDict(
+                (sys.intern(k) if type(k) is str else k, v)
+                for k, v in mapping.items())
+            self._mappings[key] = output
+        return output
+
+
 class DataPoint(_DataPointBase):
 
     def __new__(cls, unit, qty, price, groupby, metadata, description=None):
@@ -56,8 +110,9 @@ class DataPoint(_DataPointBase):
             # NOTE(peschk_l): avoids floating-point issues.
             decimal.Decimal(str(qty) if isinstance(qty, float) else qty),
             decimal.Decimal(str(price) if isinstance(price, float) else price),
-            datastructures.ImmutableDict(groupby),
-            datastructures.ImmutableDict(metadata),
+            # NOTE: ImmutableDicts can safely be shared between DataPoints
+            _as_immutable_dict(groupby),
+            _as_immutable_dict(metadata),
             description
         )
 
@@ -128,19 +183,31 @@ class DataPoint(_DataPointBase):
         return json.dumps(self.as_dict(legacy=legacy, mutable=True))
 
     @classmethod
-    def from_dict(cls, dict_, legacy=False):
+    def from_dict(cls, dict_, legacy=False, validate=True):
         """Returns a new DataPoint instance build from a dict.
 
         :param dict_: Dict to build the DataPoint from
         :type dict_: dict
         :param legacy: Set to true to convert the dict to a the new format
                        before validating it.
+        :param validate: Defaults to True. Set to False to skip the schema
+                         validation. This must only be done for dicts
+                         produced by CloudKitty itself, never for user input.
+        :type validate: bool
         :rtype: DataPoint
         """
         try:
             if legacy:
                 dict_['groupby'] = dict_.pop('desc')
                 dict_['metadata'] = {}
+            if not validate:
+                return cls(
+                    dict_["vol"]["unit"],
+                    dict_["vol"]["qty"],
+                    (dict_.get("rating") or {}).get("price", 0),
+                    dict_["groupby"],
+                    dict_["metadata"],
+                )
             valid = DATAPOINT_SCHEMA(dict_)
             return cls(
                 unit=valid["vol"]["unit"],
@@ -149,7 +216,8 @@ class DataPoint(_DataPointBase):
                 groupby=valid["groupby"],
                 metadata=valid["metadata"],
             )
-        except (voluptuous.Invalid, KeyError) as e:
+        except (voluptuous.Invalid, KeyError, TypeError, ValueError,
+                decimal.InvalidOperation) as e:
             raise ValueError("{} isn't a valid DataPoint: {}".format(dict_, e))
 
     @property
@@ -173,7 +241,7 @@ DATAFRAME_SCHEMA = voluptuous.Schema({
 
 class DataFrame(object):
 
-    __slots__ = ("start", "end", "_usage")
+    __slots__ = ("start", "end", "_usage", "_shared")
 
     def __init__(self, start, end, usage=None):
         if not isinstance(start, datetime.datetime):
@@ -190,6 +258,9 @@ class DataFrame(object):
         self.start = start
         self.end = end
         self._usage = collections.OrderedDict()
+        # NOTE: types whose list of points is shared with another DataFrame
+        # (see DataFrame.copy). These lists are copied before any write.
+        self._shared = set()
         if usage:
             for key in sorted(usage.keys()):
                 self.add_points(usage[key], key)
@@ -208,7 +279,21 @@ class DataFrame(object):
         return json.dumps(self.as_dict(legacy=legacy, mutable=True))
 
     @classmethod
-    def from_dict(cls, dict_, legacy=False):
+    def from_dict(cls, dict_, legacy=False, validate=True):
+        """Returns a new DataFrame instance build from a dict.
+
+        :param dict_: Dict to build the DataFrame from
+        :type dict_: dict
+        :param legacy: Set to true if the points of the dict are in the
+                       legacy format.
+        :param validate: Defaults to True. Set to False to skip the schema
+                         validation. This must only be done for dicts
+                         produced by CloudKitty itself, never for user input.
+        :type validate: bool
+        :rtype: DataFrame
+        """
+        if not validate:
+            return cls._from_trusted_dict(dict_, legacy)
         try:
             schema = DATAFRAME_SCHEMA
             if legacy:
@@ -233,6 +318,46 @@ class DataFrame(object):
         except (voluptuous.error.Invalid, KeyError) as e:
             raise ValueError("{} isn't a valid DataFrame: {}".format(dict_, e))
 
+    @classmethod
+    def _from_trusted_dict(cls, dict_, legacy):
+        try:
+            begin = dict_["period"]["begin"]
+            end = dict_["period"]["end"]
+            usage = {
+                key: [DataPoint.from_dict(point, legacy=legacy,
+                                          validate=False)
+                      for point in points]
+                for key, points in dict_["usage"].items()
+            }
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError("{} isn't a valid DataFrame: {}".format(dict_, e))
+        if not isinstance(begin, datetime.datetime):
+            begin = tzutils.dt_from_iso(begin)
+        if not isinstance(end, datetime.datetime):
+            end = tzutils.dt_from_iso(end)
+        return cls(begin, end, usage=usage)
+
+    def copy(self):
+        """Returns a copy of the DataFrame.
+
+        DataPoints are immutable, so the copy shares them with the original
+        frame. The lists holding them are copied lazily, the first time one
+        of the two frames adds points to a given type.
+
+        :rtype: DataFrame
+        """
+        output = DataFrame(self.start, self.end)
+        output._usage = collections.OrderedDict(self._usage)
+        output._shared = set(self._usage.keys())
+        self._shared.update(self._usage.keys())
+        return output
+
+    def _get_writable_points(self, type_):
+        if type_ in self._shared:
+            self._usage[type_] = list(self._usage[type_])
+            self._shared.discard(type_)
+        return self._usage[type_]
+
     def add_points(self, points, type_):
         """Adds multiple points to the DataFrame
 
@@ -240,7 +365,7 @@ class DataFrame(object):
         :type point: list of DataPoints
         """
         if type_ in self._usage:
-            self._usage[type_] += points
+            self._get_writable_points(type_).extend(points)
         else:
             self._usage[type_] = points
 
@@ -251,10 +376,28 @@ class DataFrame(object):
         :type point: DataPoint
         """
         if type_ in self._usage:
-            self._usage[type_].append(point)
+            self._get_writable_points(type_).append(point)
         else:
             self._usage[type_] = [point]
 
+    def replace_points(self, points, type_):
+        """Replaces all points of the given type
+
+        :param points: DataPoints to set.
+        :type point: list of DataPoints
+        """
+        self._usage[type_] = points
+        self._shared.discard(type_)
+
+    def drop_type(self, type_):
+        """Removes the given type and all its points from the DataFrame
+
+        :param type_: Type to remove.
+        :type type_: str
+        """
+        self._usage.pop(type_, None)
+        self._shared.discard(type_)
+
     def iterpoints(self):
         """Iterates over all datapoints of the dataframe.
 
@@ -101,6 +101,43 @@ class ModuleInfo(object, metaclass=abc.ABCMeta):
         :param value: State of the module
         """
 
+    @abc.abstractmethod
+    def get_rules_version(self, name):
+        """Retrieve the version of the module's rating rules.
+
+        The version is also incremented when the state or the priority of
+        the module are modified.
+
+        :param name: Name of the module
+        :return int: Version of the rules, 0 if they were never modified
+        """
+
+    @abc.abstractmethod
+    def bump_rules_version(self, name):
+        """Increment the version of the module's rating rules.
+
+        :param name: Name of the module
+        :return int: New version of the rules
+        """
+
+    @abc.abstractmethod
+    def get_modules_version(self):
+        """Retrieve the version of the configuration of all the modules.
+
+        The version is incremented when the rules, the state or the priority
+        of a module are modified.
+
+        :return int: Version of the modules configuration
+        """
+
+    @abc.abstractmethod
+    def list_modules(self):
+        """Retrieve the state, priority and rules version of all modules.
+
+        :return list: One dict per module, with the ``name``, ``state``,
+                      ``priority`` and ``rules_version`` keys
+        """
+
 
 class NoSuchMapping(Exception):
     """Raised when the mapping doesn't exist."""
@@ -0,0 +1,34 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Added rules_version to modules_state.
+
+Revision ID: c4b7e2d95a13
+Revises: 385e33fef139
+Create Date: 2026-10-18 09:12:41.318540
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c4b7e2d95a13'
+down_revision = '385e33fef139'
+
+from alembic import op  # noqa: E402
+import sqlalchemy as sa  # noqa: E402
+
+
+def upgrade():
+    op.add_column(
+        'modules_state',
+        sa.Column('rules_version', sa.Integer(), nullable=False,
+                  server_default='0'))
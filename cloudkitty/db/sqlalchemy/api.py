@@ -77,6 +77,12 @@ class State(api.State):
                 session.add(db_state)
 
 
+def _bump_rules_version(db_state):
+    # NOTE: Changes of the state and priority of a module also bump its
+    # version, so that they change the version of the modules configuration.
+    db_state.rules_version = (db_state.rules_version or 0) + 1
+
+
 class ModuleInfo(api.ModuleInfo):
     """Base class for module info management."""
 
@@ -102,10 +108,13 @@ class ModuleInfo(api.ModuleInfo):
                     models.ModuleStateInfo.name == name)
                 q = q.with_for_update()
                 db_state = q.one()
-                db_state.priority = priority
+                if db_state.priority != priority:
+                    db_state.priority = priority
+                    _bump_rules_version(db_state)
             except sqlalchemy.orm.exc.NoResultFound:
                 db_state = models.ModuleStateInfo(name=name,
-                                                  priority=priority)
+                                                  priority=priority,
+                                                  rules_version=1)
                 session.add(db_state)
         return int(db_state.priority)
 
@@ -130,12 +139,59 @@ class ModuleInfo(api.ModuleInfo):
                 q = q.filter(models.ModuleStateInfo.name == name)
                 q = q.with_for_update()
                 db_state = q.one()
-                db_state.state = state
+                if db_state.state != state:
+                    db_state.state = state
+                    _bump_rules_version(db_state)
             except sqlalchemy.orm.exc.NoResultFound:
-                db_state = models.ModuleStateInfo(name=name, state=state)
+                db_state = models.ModuleStateInfo(name=name, state=state,
+                                                  rules_version=1)
                 session.add(db_state)
         return bool(db_state.state)
 
+    def get_rules_version(self, name):
+        with db.session_for_read() as session:
+            q = utils.model_query(
+                models.ModuleStateInfo,
+                session)
+            q = q.filter(models.ModuleStateInfo.name == name)
+            res = q.value(models.ModuleStateInfo.rules_version)
+            return int(res or 0)
+
+    def bump_rules_version(self, name):
+        with db.session_for_write() as session:
+            try:
+                q = utils.model_query(
+                    models.ModuleStateInfo,
+                    session)
+                q = q.filter(models.ModuleStateInfo.name == name)
+                q = q.with_for_update()
+                db_state = q.one()
+                _bump_rules_version(db_state)
+            except sqlalchemy.orm.exc.NoResultFound:
+                db_state = models.ModuleStateInfo(name=name, rules_version=1)
+                session.add(db_state)
+        return int(db_state.rules_version)
+
+    def get_modules_version(self):
+        # NOTE: The version of each module only increases, so does their
+        # sum.
+        with db.session_for_read() as session:
+            q = session.query(
+                sqlalchemy.func.sum(models.ModuleStateInfo.rules_version))
+            return int(q.scalar() or 0)
+
+    def list_modules(self):
+        with db.session_for_read() as session:
+            q = utils.model_query(
+                models.ModuleStateInfo,
+                session)
+            q = q.order_by(models.ModuleStateInfo.name)
+            return [{'name': r.name,
+                     'state': bool(r.state),
+                     'priority': int(r.priority or 1),
+                     'rules_version': int(r.rules_version or 0)}
+                    for r in q]
+
 
 class ServiceToCollectorMapping(object):
     """Base class for service to collector mapping."""
@@ -61,6 +61,11 @@ class ModuleStateInfo(Base, models.ModelBase):
     priority = sqlalchemy.Column(
         sqlalchemy.Integer(),
         default=1)
+    rules_version = sqlalchemy.Column(
+        sqlalchemy.Integer(),
+        nullable=False,
+        default=0,
+        server_default='0')
 
     def __repr__(self):
         return ('<ModuleStateInfo[{name}]: '
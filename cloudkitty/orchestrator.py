@@ -12,17 +12,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
-import copy
-
 from concurrent import futures
 from datetime import timedelta
 
 import decimal
 import functools
 import hashlib
+import heapq
 import multiprocessing
+import os
 import random
 import time
+import types
 
 import cotyledon
 from oslo_concurrency import lockutils
@@ -31,6 +32,7 @@ from oslo_log import log as logging
 import oslo_messaging
 from oslo_utils import uuidutils
 from stevedore import driver
+import tooz
 from tooz import coordination
 
 from cloudkitty import collector
@@ -81,13 +83,54 @@ orchestrator_opts = [
                     'backend. This is useful to avoid persisting entries in '
                     'the storage backend when the QTY is zero, for instance. '
                     'The datapoint being persisted will be available for the '
-                    'expression in a variable called "datapoint". The '
-                    'expression MUST return a True or False value. For '
+                    'expression in a variable called "datapoint", as a dict. '
+                    'The expression MUST return a True or False value. For '
                     'instance, if one wants to skip persisting processed '
                     'datapoints that have QTY as zero, the following '
                     'expression can be used: '
-                    '"datapoint.get(\"vol\", {}).get(\"qty\", 0) == 0".'
+                    '"datapoint.get(\"vol\", {}).get(\"qty\", 0) == 0". '
+                    'The DataPoint object itself is available as "point". '
+                    'Expressions only using "point" (for instance '
+                    '"point.qty == 0") are cheaper to evaluate.'
                ),
+    cfg.BoolOpt('fleet_collection',
+                default=False,
+                help='If enabled, and if the collector supports it, the '
+                     'processor collects each metric for all scopes sharing '
+                     'the same next timestamp with a single query, instead '
+                     'of one query per metric and per scope. Collected data '
+                     'is then split per scope, and each scope is rated, '
+                     'stored and has its state updated independently.'),
+    cfg.IntOpt('fleet_collection_batch_size',
+               default=500,
+               min=1,
+               help='Maximal number of scopes locked and processed together '
+                    'when fleet collection is enabled.'),
+    cfg.BoolOpt('scope_sharding',
+                default=False,
+                help='If enabled, processors join a group on the '
+                     'coordination backend and scopes are distributed among '
+                     'its members with a consistent hash ring. Each '
+                     'processor only processes the scopes it owns, locks '
+                     'being kept as a safety net, and scopes are '
+                     'redistributed when processors join or leave the '
+                     'group. Processors fall back to trying every scope if '
+                     'the coordination backend does not support groups.'),
+    cfg.IntOpt('catch_up_threshold',
+               default=0,
+               min=0,
+               help='Number of periods a scope must be late by to be '
+                    'processed in catch-up mode. In catch-up mode, each '
+                    'metric is collected for a window of several periods at '
+                    'once (with a single range query for Prometheus-based '
+                    'collectors), the rated frames of the window are stored '
+                    'together, and the state of the scope is updated once '
+                    'per window. Set to 0 to disable the catch-up mode.'),
+    cfg.IntOpt('catch_up_max_periods',
+               default=24,
+               min=2,
+               help='Maximal number of periods processed at once in '
+                    'catch-up mode.'),
     cfg.IntOpt('collector_request_timeout',
                default=300,
                min=30,
@@ -118,15 +161,147 @@ def get_lock(coord, tenant_id):
     return name, coord.get_lock(name.encode('ascii'))
 
 
+def _iter_code_names(code):
+    """Yields the names used by a code object and its nested code objects.
+
+    Lambdas and comprehensions of an expression are compiled to code objects
+    of their own, stored in the constants of the expression.
+    """
+    yield from code.co_names
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _iter_code_names(const)
+
+
+class SkipDatapointsPredicate(object):
+    """Compiled form of a ``skip_datapoints_expression``.
+
+    The expression is compiled once. Expressions which do not reference
+    any name (``"False"``, ``"True"``, ``"1 == 0"``...) are evaluated right
+    away, so that callers can skip the filtering loop entirely when the
+    predicate is constant.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self._code = compile(expression, '<skip_datapoints_expression>',
+                             'eval')
+        self._names = frozenset(_iter_code_names(self._code))
+        self.constant = None
+        if not self._names:
+            self.constant = bool(eval(self._code, {}, {}))
+
+    @property
+    def always_false(self):
+        return self.constant is False
+
+    def split(self, datapoints, usage_data_metric_name=None):
+        """Splits the given datapoints into kept and skipped datapoints.
+
+        The expression is evaluated for the whole batch, with the current
+        DataPoint available as ``point`` and its dict representation
+        available as ``datapoint``.
+
+        :param datapoints: Datapoints to evaluate.
+        :type datapoints: list of DataPoint
+        :param usage_data_metric_name: Name of the metric being filtered.
+        :type usage_data_metric_name: str
+        :rtype: tuple (list, list)
+        """
+        if self.constant is not None:
+            if self.constant:
+                return [], list(datapoints)
+            return list(datapoints), []
+
+        kept = []
+        skipped = []
+        code = self._code
+        # NOTE: the dict representation of the datapoint is only built for
+        # expressions using it.
+        legacy = 'datapoint' in self._names
+        # NOTE: a single namespace is used as globals, so that the names are
+        # also visible from the lambdas and comprehensions of the expression.
+        namespace = dict(globals())
+        namespace.update({
+            'excluded_datapoints': skipped,
+            'filtered_datapoints': kept,
+            'skip_datapoint_expression': self.expression,
+            'usage_data_metric_name': usage_data_metric_name,
+        })
+        for datapoint in datapoints:
+            namespace['point'] = datapoint
+            if legacy:
+                namespace['datapoint'] = datapoint.as_dict()
+            if eval(code, namespace):
+                skipped.append(datapoint)
+            else:
+                kept.append(datapoint)
+        return kept, skipped
+
+
+@functools.lru_cache(maxsize=128)
+def get_skip_datapoints_predicate(expression):
+    """Returns the compiled predicate for the given expression text.
+
+    :param expression: skip_datapoints_expression to compile.
+    :type expression: str
+    :rtype: SkipDatapointsPredicate
+    """
+    return SkipDatapointsPredicate(expression)
+
+
+class SchedulerStatistics(object):
+    """Statistics of the last scheduling cycle of a processor.
+
+    ``queue_depth`` is the number of scopes which had periods to process
+    at the beginning of the cycle, ``max_lag`` the age in seconds of the
+    oldest of these periods, and ``cycle_duration`` the duration of the
+    cycle in seconds.
+    """
+
+    def __init__(self):
+        self.cycles = 0
+        self.queue_depth = 0
+        self.max_lag = 0
+        self.cycle_duration = 0.0
+        self.processed_scopes = 0
+        self.failed_scopes = 0
+        self.next_cycle_delay = 0.0
+
+    def start_cycle(self, queue):
+        now = tzutils.localized_now()
+        self.cycles += 1
+        self.queue_depth = len(queue)
+        self.max_lag = tzutils.diff_seconds(now, queue[0][0]) if queue else 0
+        self.processed_scopes = 0
+        self.failed_scopes = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def summary(self):
+        """Returns a human readable summary of the last cycle."""
+        return ('queue depth: {} scopes, max lag: {}s, cycle duration: '
+                '{:.3f}s, processed scopes: {}, failed scopes: {}, next '
+                'cycle in: {:.3f}s'.format(
+                    self.queue_depth, self.max_lag, self.cycle_duration,
+                    self.processed_scopes, self.failed_scopes,
+                    self.next_cycle_delay))
+
+
 class RatingEndpoint(object):
+    # Version history:
+    #   1.0 - Initial version
+    #   1.1 - Add quote_batch
     target = oslo_messaging.Target(namespace='rating',
-                                   version='1.0')
+                                   version='1.1')
 
     def __init__(self, orchestrator):
         self._global_reload = False
         self._pending_reload = []
         self._module_state = {}
         self._orchestrator = orchestrator
+        self._quote_engine = QuoteEngine()
 
     def get_reload_list(self):
         lock = lockutils.lock('module-reload')
@@ -142,13 +317,8 @@ class RatingEndpoint(object):
             self._module_state = {}
             return module_list
 
-    def quote(self, ctxt, res_data):
-        LOG.debug('Received quote request [%s] from RPC.', res_data)
-        worker = APIWorker()
-
-        start = tzutils.localized_now()
-        end = tzutils.add_delta(start, timedelta(seconds=CONF.collect.period))
-
+    @staticmethod
+    def _get_quote_frame(res_data, start, end):
         # Need to prepare data to support the V2 processing format
         usage = {}
         for k in res_data['usage']:
@@ -168,22 +338,48 @@ class RatingEndpoint(object):
                 all_data_points_for_metric.append(data_point)
             usage[k] = all_data_points_for_metric
 
-        frame = dataframe.DataFrame(
+        return dataframe.DataFrame(
             start=start,
             end=end,
             usage=usage,
         )
 
-        quote_result = worker.quote(frame)
+    def quote(self, ctxt, res_data):
+        LOG.debug('Received quote request [%s] from RPC.', res_data)
+
+        start = tzutils.localized_now()
+        end = tzutils.add_delta(start, timedelta(seconds=CONF.collect.period))
+        frame = self._get_quote_frame(res_data, start, end)
+
+        quote_result = self._quote_engine.quote(frame)
         LOG.debug("Quote result [%s] for input data [%s].",
                   quote_result, res_data)
         return str(quote_result)
 
+    def quote_batch(self, ctxt, res_data):
+        """Prices several resource descriptions in one rating pass.
+
+        :param res_data: List of resource descriptions, in the format of the
+                         ``res_data`` parameter of ``quote``.
+        :return: List of prices, in the order of the descriptions.
+        """
+        LOG.debug('Received batch quote request for %d resource '
+                  'descriptions from RPC.', len(res_data))
+
+        start = tzutils.localized_now()
+        end = tzutils.add_delta(start, timedelta(seconds=CONF.collect.period))
+        frames = [self._get_quote_frame(data, start, end)
+                  for data in res_data]
+
+        return [str(price)
+                for price in self._quote_engine.quote_batch(frames)]
+
     def reload_modules(self, ctxt):
         LOG.info('Received reload modules command.')
         lock = lockutils.lock('module-reload')
         with lock:
             self._global_reload = True
+        self._quote_engine.invalidate()
 
     def reload_module(self, ctxt, name):
         LOG.info('Received reload command for module %s.', name)
@@ -191,12 +387,14 @@ class RatingEndpoint(object):
         with lock:
             if name not in self._pending_reload:
                 self._pending_reload.append(name)
+        self._quote_engine.invalidate()
 
     def enable_module(self, ctxt, name):
         LOG.info('Received enable command for module %s.', name)
         lock = lockutils.lock('module-state')
         with lock:
             self._module_state[name] = True
+        self._quote_engine.invalidate()
 
     def disable_module(self, ctxt, name):
         LOG.info('Received disable command for module %s.', name)
@@ -205,6 +403,7 @@ class RatingEndpoint(object):
             self._module_state[name] = False
             if name in self._pending_reload:
                 self._pending_reload.remove(name)
+        self._quote_engine.invalidate()
 
 
 class ScopeEndpoint(object):
@@ -269,6 +468,10 @@ class APIWorker(BaseWorker):
     def __init__(self, tenant_id=None):
         super(APIWorker, self).__init__(tenant_id)
 
+    def refresh_rating_rules(self, start=None):
+        for processor in self._processors:
+            processor.obj.refresh_config(start)
+
     def quote(self, res_data):
         quote_result = res_data
         for processor in self._processors:
@@ -280,6 +483,42 @@ class APIWorker(BaseWorker):
         return price
 
 
+class QuoteEngine(object):
+    """Rating processors kept loaded to answer quote requests.
+
+    The processors are loaded by the first quote, and loaded again after a
+    module was enabled, disabled or reloaded. In the meantime, the rules of
+    a processor are only reloaded if they were modified, so that the cost
+    of a quote does not depend on the number of rules.
+    """
+
+    def __init__(self):
+        self._worker = None
+
+    def invalidate(self):
+        with lockutils.lock('quote-engine'):
+            self._worker = None
+
+    def quote(self, frame):
+        return self.quote_batch([frame])[0]
+
+    def quote_batch(self, frames):
+        """Returns the price of each frame.
+
+        All the frames are rated with the same rules, which are refreshed
+        for the start of the first frame.
+        """
+        if not frames:
+            return []
+        # NOTE: Rating processors keep state while processing a frame,
+        # quotes are answered one at a time.
+        with lockutils.lock('quote-engine'):
+            if self._worker is None:
+                self._worker = APIWorker()
+            self._worker.refresh_rating_rules(frames[0].start)
+            return [self._worker.quote(frame) for frame in frames]
+
+
 def _check_state(obj, period, tenant_id):
     timestamp = obj._state.get_last_processed_timestamp(tenant_id)
     return ck_utils.check_time_state(timestamp,
@@ -287,8 +526,120 @@ def _check_state(obj, period, tenant_id):
                                      CONF.collect.wait_periods)
 
 
+def create_alt_name_map(metrics_conf):
+    """Maps metric definitions by their alternative name.
+
+    :param metrics_conf: Metrics collection configuration
+    :type metrics_conf: dict
+    :rtype: dict
+    """
+    map_metrics_by_alt_name = {}
+    all_metrics = metrics_conf['metrics']
+    all_metrics_keys = list(all_metrics.keys())
+    for metric_key in all_metrics_keys:
+        alt_metric = all_metrics[metric_key]
+        LOG.debug("Processing metric definition for alt name map [%s] for "
+                  "metric key [%s].", alt_metric, metric_key)
+        if isinstance(alt_metric, list):
+            for item in alt_metric:
+                map_metrics_by_alt_name[
+                    item.get('alt_name', metric_key)] = item
+        else:
+            map_metrics_by_alt_name[
+                alt_metric.get('alt_name', metric_key)] = alt_metric
+    return map_metrics_by_alt_name
+
+
+class WorkerContext(object):
+    """Process-level state shared by the workers of a processor.
+
+    The metrics configuration is parsed again only when its file is
+    modified, the thread pool lives as long as the processor, and the
+    rating modules are loaded once per processing cycle. This keeps the
+    construction of a Worker for each scope cheap.
+    """
+
+    def __init__(self, worker_id):
+        self._worker_id = worker_id
+        self._conf = None
+        self._conf_key = None
+        self._map_metric_definition_by_alt_name = {}
+        self._processors = None
+        self.thread_executor = futures.ThreadPoolExecutor(
+            thread_name_prefix='[worker: {}] '.format(worker_id),
+            max_workers=CONF.orchestrator.max_threads)
+
+    def _refresh_conf(self):
+        path = CONF.collect.metrics_conf
+        try:
+            key = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            # NOTE: let load_conf report the error, if any.
+            key = None
+        if self._conf is not None and key is not None \
+                and key == self._conf_key:
+            return
+
+        LOG.debug("Loading metrics configuration from [%s].", path)
+        self._conf = ck_utils.load_conf(path)
+        self._conf_key = key
+        self._map_metric_definition_by_alt_name = create_alt_name_map(
+            self._conf)
+        for metric_definition in \
+                self._map_metric_definition_by_alt_name.values():
+            get_skip_datapoints_predicate(metric_definition.get(
+                "skip_datapoints_expression",
+                CONF.orchestrator.skip_datapoints_expression))
+
+    @property
+    def conf(self):
+        """The metrics configuration, reloaded if its file changed."""
+        self._refresh_conf()
+        return self._conf
+
+    @property
+    def map_metric_definition_by_alt_name(self):
+        self._refresh_conf()
+        return self._map_metric_definition_by_alt_name
+
+    def _load_rating_processors(self):
+        processors = extension_manager.EnabledExtensionManager(
+            PROCESSORS_NAMESPACE,
+            invoke_kwds={'tenant_id': None})
+        self._processors = sorted(
+            processors, key=lambda x: x.obj.priority, reverse=True)
+
+    def get_rating_processors(self, tenant_id):
+        """Returns the enabled rating processors, bound to a scope.
+
+        The processors are shared by all the workers of the process: their
+        rules have to be reloaded with ``reload_config`` before rating the
+        data of a scope, which Worker.refresh_rating_rules does.
+        """
+        if self._processors is None:
+            self._load_rating_processors()
+        for processor in self._processors:
+            processor.obj.bind_scope(tenant_id)
+        return self._processors
+
+    def invalidate_rating_processors(self):
+        """Loads the rating processors again on their next use.
+
+        This allows modules to be enabled, disabled or re-prioritized
+        between two processing cycles.
+        """
+        self._processors = None
+
+    def close(self):
+        self.thread_executor.shutdown(wait=False)
+
+
 class Worker(BaseWorker):
-    def __init__(self, collector, storage, tenant_id, worker_id):
+    def __init__(self, collector, storage, tenant_id, worker_id,
+                 context=None):
+        if context is None:
+            context = WorkerContext(worker_id)
+        self._context = context
         super(Worker, self).__init__(tenant_id)
 
         self._collector = collector
@@ -298,42 +649,32 @@ class Worker(BaseWorker):
         self._worker_id = worker_id
         self._log_prefix = '[scope: {scope}, worker: {worker}] '.format(
             scope=self._tenant_id, worker=self._worker_id)
-        self._conf = ck_utils.load_conf(CONF.collect.metrics_conf)
+        self._conf = context.conf
         self._state = state.StateManager()
         self.next_timestamp_to_process = functools.partial(
             _check_state, self, self._period, self._tenant_id)
 
-        self.map_metric_definition_by_alt_name = self.create_alt_name_map()
+        self.map_metric_definition_by_alt_name = \
+            context.map_metric_definition_by_alt_name
+        self.thread_executor = context.thread_executor
 
-        self.thread_executor = futures.ThreadPoolExecutor(
-            thread_name_prefix=self._log_prefix,
-            max_workers=CONF.orchestrator.max_threads)
+    def _load_rating_processors(self):
+        self._processors = self._context.get_rating_processors(
+            self._tenant_id)
 
     def create_alt_name_map(self):
-        map_metrics_by_alt_name = {}
-        all_metrics = self._conf['metrics']
-        all_metrics_keys = list(all_metrics.keys())
-        for metric_key in all_metrics_keys:
-            alt_metric = all_metrics[metric_key]
-            LOG.debug("Processing metric definition for alt name map [%s] for "
-                      "metric key [%s].", alt_metric, metric_key)
-            if isinstance(alt_metric, list):
-                for item in alt_metric:
-                    map_metrics_by_alt_name[
-                        item.get('alt_name', metric_key)] = item
-            else:
-                map_metrics_by_alt_name[
-                    alt_metric.get('alt_name', metric_key)] = alt_metric
-        return map_metrics_by_alt_name
+        return create_alt_name_map(self._conf)
 
-    def refresh_rating_rules(self):
+    def refresh_rating_rules(self, processing_date=None):
         for processor in self._processors:
-            processing_date = self.next_timestamp_to_process()
-            processor.obj.reload_config(processing_date)
+            if processing_date is None:
+                processing_date = self.next_timestamp_to_process()
+            if not processor.obj.refresh_config(processing_date):
+                continue
             data = getattr(processor.obj, '_entries',
                            getattr(processor.obj, '_script',
                                    None))
-            LOG.debug("Reloading rating rules for processor [%s]"
+            LOG.debug("Reloaded rating rules for processor [%s]"
                       " and scope [%s] at [%s] using rules [%s]",
                       processor.obj.module_name,
                       self._tenant_id, processing_date, data)
@@ -412,9 +753,119 @@ class Worker(BaseWorker):
         else:
             LOG.debug("No need to check if [%s] is de-activated. "
                       "We have never processed it before.")
-        self.do_execute_scope_processing(timestamp)
+        timestamps = self.get_catch_up_timestamps(timestamp)
+        if len(timestamps) > 1:
+            self.do_execute_catch_up_processing(timestamps)
+        else:
+            self.do_execute_scope_processing(timestamp)
         return True
 
+    def is_timestamp_processable(self, timestamp):
+        """Returns True if the period starting at timestamp can be processed.
+
+        This follows the rules of ck_utils.check_time_state.
+        """
+        wait_time = timedelta(seconds=self._wait_time)
+        return tzutils.add_delta(timestamp, wait_time) < \
+            tzutils.localized_now()
+
+    def get_catch_up_timestamps(self, timestamp):
+        """Returns the start of the periods to process together.
+
+        If the scope is late by more than ``catch_up_threshold`` periods, up
+        to ``catch_up_max_periods`` consecutive timestamps are returned.
+        Otherwise, only the given timestamp is returned.
+
+        :param timestamp: Next timestamp to process
+        :type timestamp: datetime.datetime
+        :rtype: list
+        """
+        threshold = CONF.orchestrator.catch_up_threshold
+        if not threshold:
+            return [timestamp]
+
+        max_periods = CONF.orchestrator.catch_up_max_periods
+        delta = timedelta(seconds=self._period)
+        timestamps = [timestamp]
+        next_timestamp = tzutils.add_delta(timestamp, delta)
+        while (len(timestamps) < max(max_periods, threshold + 1)
+               and self.is_timestamp_processable(next_timestamp)):
+            timestamps.append(next_timestamp)
+            next_timestamp = tzutils.add_delta(next_timestamp, delta)
+
+        if len(timestamps) <= threshold:
+            return [timestamp]
+        return timestamps[:max_periods]
+
+    def do_execute_catch_up_processing(self, timestamps):
+        """Collects, rates and stores several consecutive periods at once.
+
+        Every metric is collected once for the whole window. The frames of
+        all periods are pushed to the storage backend together, and the
+        state of the scope is updated once, to the last processed period.
+
+        :param timestamps: Start of the periods to process, in order
+        :type timestamps: list
+        """
+        delta = timedelta(seconds=self._period)
+        start = timestamps[0]
+        end = tzutils.add_delta(timestamps[-1], delta)
+        LOG.info("%sCatching up %s periods, from %s to %s.",
+                 self._log_prefix, len(timestamps), start, end)
+
+        metrics = sorted(self._collector.conf.keys())
+        usage_data_by_period = self._do_catch_up_collection(
+            metrics, start, end)
+
+        frames = []
+        for timestamp in timestamps:
+            usage_data = usage_data_by_period.get(timestamp)
+            if not usage_data:
+                LOG.warning("No usage data for storage scope [%s] on "
+                            "timestamp [%s]. You might want to consider "
+                            "de-activating it.", self._tenant_id, timestamp)
+                continue
+            self.refresh_rating_rules(timestamp)
+            frame = self.execute_measurements_rating(
+                tzutils.add_delta(timestamp, delta), timestamp, usage_data)
+            self.filter_rating_data(frame)
+            frames.append(frame)
+
+        if frames:
+            LOG.debug("Persisting [%s] processed frames for scope [%s] and "
+                      "time [start=%s,end=%s].", len(frames),
+                      self._tenant_id, start, end)
+            self._storage.push(frames, self._tenant_id)
+
+        self.update_scope_processing_state_db(timestamps[-1])
+
+    def _do_catch_up_collection(self, metrics, start, end):
+        """Collects metrics for all periods between start and end.
+
+        :returns: A dict mapping the start of each period to a dict of
+                  DataPoints by metric name
+        """
+
+        def _get_result(metric):
+            try:
+                return self._collector.retrieve_periods(
+                    metric, start, end, self._tenant_id)
+            except Exception as e:
+                LOG.exception('%sError while collecting metric %s '
+                              'between %s and %s: %s. Exiting.',
+                              self._log_prefix, metric, start, end, e)
+                raise e
+
+        results = self.thread_executor.map(
+            _get_result, metrics,
+            timeout=CONF.orchestrator.collector_request_timeout)
+
+        usage_data = {}
+        for name, data in results:
+            for timestamp, points in data.items():
+                usage_data.setdefault(timestamp, {})[name] = points
+        return usage_data
+
     def do_execute_scope_processing(self, timestamp):
         self.refresh_rating_rules()
 
@@ -423,6 +874,16 @@ class Worker(BaseWorker):
         metrics = sorted(metrics)
         usage_data = self._do_collection(metrics, timestamp)
 
+        self.process_usage_data(timestamp, usage_data)
+
+    def process_usage_data(self, timestamp, usage_data):
+        """Rates and stores collected data, and updates the scope state.
+
+        :param timestamp: Start of the processed period
+        :type timestamp: datetime.datetime
+        :param usage_data: Collected DataPoints, by metric name
+        :type usage_data: dict
+        """
         LOG.debug("Usage data [%s] found for storage scope [%s] in "
                   "timestamp [%s].", usage_data, self._tenant_id,
                   timestamp)
@@ -443,68 +904,66 @@ class Worker(BaseWorker):
         self.update_scope_processing_state_db(timestamp)
 
     def persist_rating_data(self, end_time, frame, start_time):
-        frame_dict = frame.as_dict(mutable=True)
         LOG.debug("Preparing to persist processed frames [%s] for scope [%s] "
-                  "and time [start=%s,end=%s]", frame_dict, self._tenant_id,
+                  "and time [start=%s,end=%s]", frame, self._tenant_id,
                   start_time, end_time)
-        usage_data_from_frame = frame_dict['usage']
-        for usage_data_metric_name in list(usage_data_from_frame.keys()):
-            self.execute_datapoints_filtering_for_metric(
-                usage_data_from_frame, usage_data_metric_name)
-        frame = dataframe.DataFrame.from_dict(frame_dict)
+        self.filter_rating_data(frame)
 
-        LOG.debug("Persisting processed frames [%s] for scope [%s] and time "
-                  "[start=%s,end=%s].", frame.as_dict(), self._tenant_id,
-                  start_time, end_time)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Persisting processed frames [%s] for scope [%s] and "
+                      "time [start=%s,end=%s].", frame.as_dict(),
+                      self._tenant_id, start_time, end_time)
 
         self._storage.push([frame], self._tenant_id)
 
-    def execute_datapoints_filtering_for_metric(self, usage_data_from_frame,
-                                                usage_data_metric_name):
-        all_datapoints = usage_data_from_frame[usage_data_metric_name]
+    def filter_rating_data(self, frame):
+        for usage_data_metric_name, datapoints in list(frame.itertypes()):
+            self.execute_datapoints_filtering_for_metric(
+                frame, usage_data_metric_name, datapoints)
+
+    def get_skip_datapoints_predicate(self, metric_name):
+        metric_definition = self.map_metric_definition_by_alt_name.get(
+            metric_name, {})
+        return get_skip_datapoints_predicate(metric_definition.get(
+            "skip_datapoints_expression",
+            CONF.orchestrator.skip_datapoints_expression))
+
+    def execute_datapoints_filtering_for_metric(self, frame,
+                                                usage_data_metric_name,
+                                                all_datapoints):
+        skip_predicate = self.get_skip_datapoints_predicate(
+            usage_data_metric_name)
+        LOG.debug("Retrieved skip_datapoint_expression [%s] for metric [%s].",
+                  skip_predicate.expression, usage_data_metric_name)
+        if skip_predicate.always_false:
+            return
+
         filtered_datapoints = []
         excluded_datapoints = []
-        skip_datapoint_expression = self.map_metric_definition_by_alt_name[
-            usage_data_metric_name].get(
-            "skip_datapoints_expression",
-            CONF.orchestrator.skip_datapoints_expression)
-
-        LOG.debug("Retrieved skip_datapoint_expression [%s] for metric [%s] "
-                  "from map of definitions [%s].", skip_datapoint_expression,
-                  usage_data_metric_name,
-                  self.map_metric_definition_by_alt_name)
-        for datapoint in all_datapoints:
-            self.execute_datapoints_filtering(
-                datapoint, excluded_datapoints, filtered_datapoints,
-                skip_datapoint_expression, usage_data_metric_name)
+        self.execute_datapoints_filtering(
+            all_datapoints, excluded_datapoints, filtered_datapoints,
+            skip_predicate, usage_data_metric_name)
         if not filtered_datapoints:
             LOG.debug("No filtered datapoints for metric [%s] will be "
                       "persisted. Excluded datapoints [%s].",
                       usage_data_metric_name, excluded_datapoints)
-            del usage_data_from_frame[usage_data_metric_name]
-        else:
-            LOG.debug("Datapoints for metric [%s] updated to [%s].",
-                      usage_data_metric_name, filtered_datapoints)
-            usage_data_from_frame[
-                usage_data_metric_name] = filtered_datapoints
-            if excluded_datapoints:
-                LOG.debug("Excluded datapoints [%s] for metric [%s]. ",
-                          excluded_datapoints, usage_data_metric_name)
+            frame.drop_type(usage_data_metric_name)
+        elif excluded_datapoints:
+            LOG.debug("Excluded datapoints [%s] for metric [%s]. ",
+                      excluded_datapoints, usage_data_metric_name)
+            frame.replace_points(filtered_datapoints, usage_data_metric_name)
 
     def execute_datapoints_filtering(
-            self, datapoint, excluded_datapoints, filtered_datapoints,
-            skip_datapoint_expression, usage_data_metric_name):
-        LOG.debug("Evaluating skip_datapoint_expression[%s] for datapoint "
-                  "[%s] under metric [%s].", skip_datapoint_expression,
-                  datapoint, usage_data_metric_name)
-
-        if not eval(skip_datapoint_expression):
-            filtered_datapoints.append(datapoint)
-        else:
-            LOG.debug("Datapoint [%s] will be skipped because of "
-                      "skip_datapoint_expression [%s].", datapoint,
-                      skip_datapoint_expression)
-            excluded_datapoints.append(datapoint)
+            self, datapoints, excluded_datapoints, filtered_datapoints,
+            skip_predicate, usage_data_metric_name):
+        LOG.debug("Evaluating skip_datapoint_expression [%s] for [%s] "
+                  "datapoints under metric [%s].", skip_predicate.expression,
+                  len(datapoints), usage_data_metric_name)
+
+        kept, skipped = skip_predicate.split(datapoints,
+                                             usage_data_metric_name)
+        filtered_datapoints.extend(kept)
+        excluded_datapoints.extend(skipped)
 
     def execute_measurements_rating(self, end_time, start_time, usage_data):
         frame = dataframe.DataFrame(
@@ -513,11 +972,17 @@ class Worker(BaseWorker):
             usage=usage_data,
         )
 
+        # NOTE: snapshots of the frame are only needed for debug tracing.
+        # DataFrame.copy() shares the (immutable) DataPoints with the frame
+        # being rated.
+        trace = LOG.isEnabledFor(logging.DEBUG)
         for processor in self._processors:
-            original_data = copy.deepcopy(frame)
+            original_data = frame.copy() if trace else None
             frame = processor.obj.process(frame)
-            LOG.debug("Results [%s] for processing [%s] of data points [%s].",
-                      frame, processor.obj.process, original_data)
+            if trace:
+                LOG.debug("Results [%s] for processing [%s] of data points "
+                          "[%s].", frame, processor.obj.process,
+                          original_data)
         return frame
 
     def update_scope_processing_state_db(self, timestamp):
@@ -525,12 +990,13 @@ class Worker(BaseWorker):
 
 
 class ReprocessingWorker(Worker):
-    def __init__(self, collector, storage, tenant_id, worker_id):
+    def __init__(self, collector, storage, tenant_id, worker_id,
+                 context=None):
         self.scope = tenant_id
         self.scope_key = None
 
         super(ReprocessingWorker, self).__init__(
-            collector, storage, self.scope.identifier, worker_id)
+            collector, storage, self.scope.identifier, worker_id, context)
 
         self.reprocessing_scheduler_db = state.ReprocessingSchedulerDb()
         self.next_timestamp_to_process = self._next_timestamp_to_process
@@ -587,11 +1053,35 @@ class ReprocessingWorker(Worker):
                       "processed all requested timestamps.", db_item)
             return None
 
+    def is_timestamp_processable(self, timestamp):
+        return tzutils.local_to_utc(timestamp) <= tzutils.local_to_utc(
+            self.scope.end_reprocess_time)
+
+    def do_execute_catch_up_processing(self, timestamps):
+        self.clean_reprocessing_timeframe(timestamps[0])
+
+        LOG.debug("Executing the reprocessing of scope [%s] for "
+                  "timeframe[start=%s, end=%s].", self.scope, timestamps[0],
+                  tzutils.add_delta(timestamps[-1],
+                                    timedelta(seconds=self._period)))
+
+        super(ReprocessingWorker, self).do_execute_catch_up_processing(
+            timestamps)
+
     def do_execute_scope_processing(self, timestamp):
         end_of_this_processing = timestamp + timedelta(seconds=self._period)
 
         end_of_this_processing = tzutils.local_to_utc(end_of_this_processing)
 
+        self.clean_reprocessing_timeframe(timestamp)
+
+        LOG.debug("Executing the reprocessing of scope [%s] for "
+                  "timeframe[start=%s, end=%s].", self.scope, timestamp,
+                  end_of_this_processing)
+
+        super(ReprocessingWorker, self).do_execute_scope_processing(timestamp)
+
+    def clean_reprocessing_timeframe(self, timestamp):
         # If the start_reprocess_time of the reprocessing task equals to
         # the current reprocessing time, it means that we have just started
         # executing it. Therefore, we can clean/erase the old data in the
@@ -614,12 +1104,6 @@ class ReprocessingWorker(Worker):
                       self.scope.start_reprocess_time,
                       self.scope.end_reprocess_time)
 
-        LOG.debug("Executing the reprocessing of scope [%s] for "
-                  "timeframe[start=%s, end=%s].", self.scope, timestamp,
-                  end_of_this_processing)
-
-        super(ReprocessingWorker, self).do_execute_scope_processing(timestamp)
-
     def update_scope_processing_state_db(self, timestamp):
         LOG.debug("After data is persisted in the storage backend [%s], we "
                   "will update the scope [%s] current processing time to "
@@ -632,6 +1116,13 @@ class ReprocessingWorker(Worker):
 
 
 class CloudKittyProcessor(cotyledon.Service):
+    # NOTE: Whether scopes may be collected together when the
+    # fleet_collection option is enabled.
+    supports_fleet_collection = True
+
+    # Name of the coordination group used to shard scopes
+    scopes_group_name = 'processor'
+
     def __init__(self, worker_id):
         self._worker_id = worker_id
         super(CloudKittyProcessor, self).__init__(self._worker_id)
@@ -655,14 +1146,17 @@ class CloudKittyProcessor(cotyledon.Service):
         self._init_messaging()
 
         # DLM
+        self._member_id = uuidutils.generate_uuid().encode('ascii')
         self.coord = coordination.get_coordinator(
-            CONF.orchestrator.coordination_url,
-            uuidutils.generate_uuid().encode('ascii'))
+            CONF.orchestrator.coordination_url, self._member_id)
         self.coord.start(start_heart=True)
         self.next_timestamp_to_process = functools.partial(
             _check_state, self, CONF.collect.period)
+        self.partitioner = self._join_scopes_group()
 
         self.worker_class = Worker
+        self.worker_context = WorkerContext(self._worker_id)
+        self.scheduler_stats = SchedulerStatistics()
         self.log_worker_initiated()
 
     def log_worker_initiated(self):
@@ -694,12 +1188,26 @@ class CloudKittyProcessor(cotyledon.Service):
 
     def terminate(self):
         LOG.debug('Terminating worker %s.', self._worker_id)
+        if self.partitioner is not None:
+            try:
+                self.coord.leave_partitioned_group(self.partitioner)
+            except tooz.ToozError as e:
+                LOG.warning('Could not leave coordination group: %s', e)
         self.coord.stop()
+        self.worker_context.close()
         LOG.debug('Terminated worker %s.', self._worker_id)
 
     def internal_run(self):
+        cycle_start = time.monotonic()
+        self.worker_context.invalidate_rating_processors()
         self.load_scopes_to_process()
-        for tenant_id in self.tenants:
+        self.tenants = self.filter_owned_scopes(self.tenants)
+        if self.is_fleet_collection_enabled():
+            self.process_fleet()
+
+        queue = self.build_scope_queue()
+        self.scheduler_stats.start_cycle(queue)
+        for _, _, tenant_id in self._iter_queue(queue):
             lock_name, lock = get_lock(
                 self.coord, self.generate_lock_base_name(tenant_id))
 
@@ -718,6 +1226,7 @@ class CloudKittyProcessor(cotyledon.Service):
                     self.process_scope(tenant_id)
                 except Exception as e:
                     _success = False
+                    self.scheduler_stats.failed_scopes += 1
                     LOG.error('Error processing scope %s, we will try it again'
                               ' later.', tenant_id)
                     LOG.exception(e)
@@ -725,6 +1234,7 @@ class CloudKittyProcessor(cotyledon.Service):
                     lock.release()
 
                 if _success:
+                    self.scheduler_stats.processed_scopes += 1
                     LOG.debug("Finished processing scope [%s].", tenant_id)
             else:
                 LOG.debug("Could not acquire lock [%s] for processing "
@@ -733,8 +1243,130 @@ class CloudKittyProcessor(cotyledon.Service):
         LOG.debug("Finished processing all storage scopes with worker "
                   "[worker_id=%s, class=%s].",
                   self._worker_id, self.worker_class)
-        # FIXME(sheeprine): We may cause a drift here
-        time.sleep(CONF.collect.period)
+
+        delay = self.get_next_cycle_delay(
+            self.scheduler_stats.processed_scopes > 0)
+        self.scheduler_stats.cycle_duration = time.monotonic() - cycle_start
+        self.scheduler_stats.next_cycle_delay = delay
+        LOG.info("[Worker: %s] Scheduling cycle %s finished, %s.",
+                 self._worker_id, self.scheduler_stats.cycles,
+                 self.scheduler_stats.summary())
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_scopes_group_id(self):
+        return '-'.join((
+            'cloudkitty',
+            self.scopes_group_name,
+            CONF.collect.collector,
+            CONF.fetcher.backend,
+            CONF.collect.scope_key,
+        )).encode('ascii')
+
+    def _join_scopes_group(self):
+        if not CONF.orchestrator.scope_sharding:
+            return None
+        group_id = self.get_scopes_group_id()
+        try:
+            return self.coord.join_partitioned_group(group_id)
+        except (tooz.NotImplemented, tooz.ToozError) as e:
+            LOG.warning('[Worker: %s] Could not join coordination group %s, '
+                        'all scopes will be processed by this worker: %s',
+                        self._worker_id, group_id, e)
+            return None
+
+    def filter_owned_scopes(self, scopes):
+        """Returns the scopes owned by this worker on the hash ring.
+
+        Membership changes of the group are taken into account before
+        filtering, so that scopes are redistributed when workers join or
+        leave. All scopes are returned if scope sharding is disabled.
+        """
+        if self.partitioner is None:
+            return scopes
+        try:
+            self.coord.run_watchers()
+        except tooz.ToozError as e:
+            LOG.warning('[Worker: %s] Could not refresh the members of the '
+                        'coordination group: %s', self._worker_id, e)
+        if self._member_id not in self.partitioner.ring.nodes:
+            # NOTE: the membership of this worker expired (for instance
+            # after missed heartbeats), it would not own any scope anymore.
+            LOG.warning('[Worker: %s] Not a member of the coordination group '
+                        'anymore, joining it again.', self._worker_id)
+            self.partitioner.stop()
+            self.partitioner = self._join_scopes_group()
+            if self.partitioner is None:
+                return scopes
+        owned = [
+            scope for scope in scopes if self.partitioner.belongs_to_self(
+                self.generate_lock_base_name(scope))]
+        LOG.debug('[Worker: %s] Owning [%s] scopes out of [%s].',
+                  self._worker_id, len(owned), len(scopes))
+        return owned
+
+    @staticmethod
+    def _iter_queue(queue):
+        while queue:
+            yield heapq.heappop(queue)
+
+    def build_scope_queue(self):
+        """Returns the scopes having periods to process.
+
+        Scopes are returned as a list of (next timestamp, index, scope)
+        tuples, which is a heap ordered by lag, the most late scope first.
+        The index keeps the (random) order of load_scopes_to_process for
+        scopes with the same lag.
+        """
+        next_timestamps = self.get_scopes_next_timestamps(self.tenants)
+        queue = []
+        for index, scope in enumerate(self.tenants):
+            timestamp = next_timestamps.get(scope)
+            if timestamp:
+                queue.append((timestamp, index, scope))
+        heapq.heapify(queue)
+        return queue
+
+    def get_scopes_next_timestamps(self, scopes):
+        """Returns a dict mapping scopes to their next timestamp to process.
+
+        The state of the scopes is loaded with a single query. Scopes
+        without any state matching the current fetcher, collector and
+        scope_key are looked up one by one. Inactive scopes are omitted.
+        """
+        states = {item.identifier: item for item in self._state.get_all(
+            fetcher=CONF.fetcher.backend,
+            collector=CONF.collect.collector,
+            scope_key=CONF.collect.scope_key,
+            active=None,
+            limit=None,
+        )}
+        output = {}
+        for scope in scopes:
+            item = states.get(scope)
+            if item is None:
+                output[scope] = self.next_timestamp_to_process(scope)
+            elif item.active:
+                output[scope] = ck_utils.check_time_state(
+                    item.last_processed_timestamp,
+                    CONF.collect.period,
+                    CONF.collect.wait_periods)
+        return output
+
+    def get_next_cycle_delay(self, made_progress):
+        """Returns the number of seconds to wait before the next cycle.
+
+        If scopes were processed during the cycle and periods are still
+        pending, the next cycle starts immediately. Otherwise, the processor
+        waits for the next period boundary, where new periods become
+        processable.
+        """
+        if made_progress and self.build_scope_queue():
+            return 0
+        period = CONF.collect.period
+        # NOTE: check_time_state requires the current time to be strictly
+        # after the end of the waiting periods, hence the extra second.
+        return period - (time.time() % period) + 1
 
     def process_scope(self, scope_to_process):
         timestamp = self.next_timestamp_to_process(scope_to_process)
@@ -751,12 +1383,158 @@ class CloudKittyProcessor(cotyledon.Service):
             self.storage,
             scope_to_process,
             self._worker_id,
+            context=self.worker_context,
         )
         worker.run()
 
     def generate_lock_base_name(self, tenant_id):
         return tenant_id
 
+    def is_fleet_collection_enabled(self):
+        return (CONF.orchestrator.fleet_collection
+                and self.supports_fleet_collection
+                and self.collector.supports_fleet_collection)
+
+    def get_fleet_pending_scopes(self, excluded=()):
+        """Returns the scopes to process, grouped by next timestamp.
+
+        :param excluded: Scopes to ignore.
+        :rtype: dict
+        """
+        pending = {}
+        for scope_id in self.tenants:
+            if scope_id in excluded:
+                continue
+            timestamp = self.next_timestamp_to_process(scope_id)
+            # NOTE: scopes late enough to be processed in catch-up mode are
+            # left to the regular per-scope processing.
+            if timestamp and not self.needs_catch_up(timestamp):
+                pending.setdefault(timestamp, []).append(scope_id)
+        return pending
+
+    @staticmethod
+    def needs_catch_up(timestamp):
+        """Returns True if a scope at timestamp will be caught up."""
+        threshold = CONF.orchestrator.catch_up_threshold
+        if not threshold:
+            return False
+        lag = timedelta(seconds=(threshold + CONF.collect.wait_periods)
+                        * CONF.collect.period)
+        return tzutils.add_delta(timestamp, lag) < tzutils.localized_now()
+
+    def process_fleet(self):
+        """Processes all loaded scopes with one query per metric and period.
+
+        Scopes sharing the same next timestamp are processed together, by
+        batches of ``fleet_collection_batch_size``, until no scope is left
+        behind. Scopes for which an error occurred are left to the regular
+        per-scope processing.
+        """
+        skipped = set()
+        pending = self.get_fleet_pending_scopes()
+        while pending:
+            timestamp = min(pending)
+            scopes = pending[timestamp]
+            batch_size = CONF.orchestrator.fleet_collection_batch_size
+            for i in range(0, len(scopes), batch_size):
+                batch = scopes[i:i + batch_size]
+                processed = self.process_fleet_batch(timestamp, batch)
+                skipped.update(set(batch) - set(processed))
+            pending = self.get_fleet_pending_scopes(excluded=skipped)
+
+    def process_fleet_batch(self, timestamp, scopes):
+        """Collects, rates and stores a period for several scopes.
+
+        Each scope is locked during the whole processing, exactly as it is
+        during the regular per-scope processing.
+
+        :returns: The list of successfully processed scopes
+        """
+        locks = []
+        processed = []
+        try:
+            for scope_id in scopes:
+                lock_name, lock = get_lock(
+                    self.coord, self.generate_lock_base_name(scope_id))
+                if lock.acquire(blocking=False):
+                    locks.append(lock)
+                    # NOTE: another processor may have processed the scope
+                    # before the lock was acquired.
+                    if self._should_process_fleet_scope(scope_id, timestamp):
+                        processed.append(scope_id)
+                else:
+                    LOG.debug("Could not acquire lock [%s] for processing "
+                              "scope [%s] with worker [%s].", lock_name,
+                              scope_id, self._worker_id)
+            if not processed:
+                return []
+
+            try:
+                usage_data = self._do_fleet_collection(timestamp, processed)
+            except Exception as e:
+                LOG.error('Error while collecting data for the fleet of %s '
+                          'scopes at timestamp %s, they will be processed '
+                          'separately.', len(processed), timestamp)
+                LOG.exception(e)
+                return []
+
+            for scope_id in list(processed):
+                try:
+                    worker = self.worker_class(
+                        self.collector,
+                        self.storage,
+                        scope_id,
+                        self._worker_id,
+                        context=self.worker_context,
+                    )
+                    worker.refresh_rating_rules()
+                    worker.process_usage_data(
+                        timestamp, usage_data.get(scope_id, {}))
+                except Exception as e:
+                    processed.remove(scope_id)
+                    LOG.error('Error processing scope %s, we will try it '
+                              'again later.', scope_id)
+                    LOG.exception(e)
+            return processed
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _should_process_fleet_scope(self, scope_id, timestamp):
+        if self.next_timestamp_to_process(scope_id) != timestamp:
+            return False
+        if (self._state.get_last_processed_timestamp(scope_id)
+                and not self._state.is_storage_scope_active(scope_id)):
+            LOG.debug("Skipping processing for storage scope [%s] "
+                      "because it is marked as inactive.", scope_id)
+            return False
+        return True
+
+    def _do_fleet_collection(self, timestamp, scope_ids):
+        """Collects all metrics for the given scopes with one query each.
+
+        :returns: A dict mapping scope IDs to {metric name: DataPoints}
+        """
+        end = tzutils.add_delta(
+            timestamp, timedelta(seconds=CONF.collect.period))
+
+        def _get_result(metric):
+            return self.collector.retrieve_all_scopes(
+                metric, timestamp, end, scope_ids=scope_ids)
+
+        results = self.worker_context.thread_executor.map(
+            _get_result, sorted(self.collector.conf.keys()),
+            timeout=CONF.orchestrator.collector_request_timeout)
+
+        usage_data = {}
+        for name, data in results:
+            for scope_id, points in data.items():
+                usage_data.setdefault(scope_id, {})[name] = points
+        LOG.debug("Collected data for [%s] out of [%s] scopes at timestamp "
+                  "[%s] with fleet collection.", len(usage_data),
+                  len(scope_ids), timestamp)
+        return usage_data
+
     def load_scopes_to_process(self):
         self.tenants = self.fetcher.get_tenants()
         random.shuffle(self.tenants)
@@ -766,6 +1544,11 @@ class CloudKittyProcessor(cotyledon.Service):
 
 
 class CloudKittyReprocessor(CloudKittyProcessor):
+    # NOTE: reprocessing tasks have their own boundaries per scope.
+    supports_fleet_collection = False
+
+    scopes_group_name = 'reprocessor'
+
     def __init__(self, worker_id):
         super(CloudKittyReprocessor, self).__init__(worker_id)
 
@@ -778,6 +1561,10 @@ class CloudKittyReprocessor(CloudKittyProcessor):
         LOG.info("Processor worker ID [%s] is initiated as CloudKitty "
                  "rating reprocessor.", self._worker_id)
 
+    def get_scopes_next_timestamps(self, scopes):
+        return {scope: self.next_timestamp_to_process(scope)
+                for scope in scopes}
+
     def _next_timestamp_to_process(self, scope):
         scope_db = self.reprocessing_scheduler_db.get_from_db(
             identifier=scope.identifier,
@@ -14,6 +14,7 @@
 #    under the License.
 #
 import abc
+import bisect
 
 import pecan
 from pecan import rest
@@ -23,6 +24,25 @@ from cloudkitty.db import api as db_api
 from cloudkitty import messaging
 
 
+def get_validity_window(boundaries, date):
+    """Get the period around date during which the same rules are valid.
+
+    :param boundaries: Sorted list of the dates at which the set of valid
+                       rules changes.
+    :param date: Naive datetime.
+    :returns: A (valid_from, valid_until) tuple, None meaning unbounded.
+    """
+    index = bisect.bisect_right(boundaries, date)
+    return (boundaries[index - 1] if index else None,
+            boundaries[index] if index < len(boundaries) else None)
+
+
+def is_in_validity_window(window, date):
+    valid_from, valid_until = window
+    return ((valid_from is None or valid_from <= date)
+            and (valid_until is None or date < valid_until))
+
+
 class RatingProcessorBase(object, metaclass=abc.ABCMeta):
     """Provides the Cloudkitty integration code to the rating processors.
 
@@ -48,6 +68,22 @@ class RatingProcessorBase(object, metaclass=abc.ABCMeta):
 
     def __init__(self, tenant_id=None):
         self._tenant_id = tenant_id
+        # NOTE: (scope, rules version, validity window) of the loaded rules
+        self._loaded_rules = None
+
+    def bind_scope(self, tenant_id):
+        """Bind the processor to another scope.
+
+        The rules loaded for the previous scope, including its tenant
+        specific rules, are dropped: the next refresh_config call reloads
+        them for the new scope.
+
+        :param tenant_id: ID of the scope.
+        """
+        if tenant_id == self._tenant_id:
+            return
+        self._tenant_id = tenant_id
+        self._loaded_rules = None
 
     @property
     def enabled(self):
@@ -128,7 +164,69 @@ class RatingProcessorBase(object, metaclass=abc.ABCMeta):
 
         """
 
+    @property
+    def rules_version(self):
+        """Get the version of the module's rules.
+
+        The version is incremented every time the rules are modified.
+        """
+        api = db_api.get_instance()
+        module_db = api.get_module_info()
+        return module_db.get_rules_version(self.module_name)
+
+    def get_validity_boundaries(self):
+        """Get the dates at which the set of valid rules changes.
+
+        Modules whose rules have a validity period should override this.
+        None means the boundaries are unknown, in which case the rules are
+        reloaded for every processing date.
+
+        :returns: A sorted list of naive datetimes, or None.
+        """
+        return None
+
+    def refresh_config(self, start=None):
+        """Reload the configuration if the loaded one is outdated.
+
+        The configuration is reloaded if the rules were modified since they
+        were loaded, if they were loaded for another scope, or if start is
+        outside of the period during which the loaded rules are valid.
+
+        :param start: The processing date.
+        :returns: True if the configuration was reloaded.
+        """
+        if start is None:
+            self._loaded_rules = None
+            self.reload_config(start)
+            return True
+
+        # NOTE: The dates of the rules are naive, and compared to the
+        # processing date as they are by the database.
+        date = start.replace(tzinfo=None)
+        version = self.rules_version
+        if self._loaded_rules is not None:
+            tenant_id, loaded_version, window = self._loaded_rules
+            if (tenant_id == self._tenant_id
+                    and loaded_version == version
+                    and is_in_validity_window(window, date)):
+                return False
+
+        self.reload_config(start)
+        boundaries = self.get_validity_boundaries()
+        if boundaries is None:
+            self._loaded_rules = None
+        else:
+            self._loaded_rules = (
+                self._tenant_id,
+                version,
+                get_validity_window(boundaries, date))
+        return True
+
     def notify_reload(self):
+        """Notify processors that the module's rules were modified."""
+        api = db_api.get_instance()
+        module_db = api.get_module_info()
+        module_db.bump_rules_version(self.module_name)
         client = messaging.get_client().prepare(namespace='rating',
                                                 fanout=True)
         client.cast({}, 'reload_module', name=self.module_name)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import functools
+
+from cloudkitty.db import api as db_api
+
+
+def bumps_rules_version(module_name):
+    """Decorates a DB API method modifying the rules of a rating module.
+
+    Once the method returned, the version of the module's rules is
+    incremented, so processors know they have to reload them.
+
+    :param module_name: Name of the rating module owning the rules.
+    :type module_name: str
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            res = func(*args, **kwargs)
+            module_db = db_api.get_instance().get_module_info()
+            module_db.bump_rules_version(module_name)
+            return res
+        return wrapper
+    return decorator
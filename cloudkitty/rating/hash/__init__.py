@@ -13,13 +13,74 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import bisect
+import collections
+import datetime
 import decimal
+import threading
+
+from oslo_config import cfg
+from oslo_log import log as logging
 
 from cloudkitty import dataframe
 from cloudkitty import rating
 from cloudkitty.rating.hash.controllers import root as root_api
 from cloudkitty.rating.hash.db import api as hash_db_api
 
+LOG = logging.getLogger(__name__)
+
+hashmap_opts = [
+    cfg.IntOpt('memoization_size',
+               default=10000,
+               min=0,
+               help='Maximal number of point signatures (service, matched '
+                    'field values and reached threshold levels) whose '
+                    'rating is kept by each HashMap instance, from one '
+                    'processed period to another while the rules are '
+                    'unchanged. Set to 0 to disable the memoization.'),
+]
+
+cfg.CONF.register_opts(hashmap_opts, 'hashmap')
+
+
+class GlobalRulesCache(object):
+    """Process-wide cache of the HashMap rules which are global.
+
+    The compiled global rules are shared by all the HashMap instances of a
+    process. They are loaded again when the rules are modified, or for a
+    date at which another set of mappings is active.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cached = None
+
+    def clear(self):
+        with self._lock:
+            self._cached = None
+
+    def get(self, module, start=None):
+        """Get the global rules valid at start.
+
+        :param module: The HashMap instance used to load the rules.
+        :param start: The processing date, now if None.
+        """
+        # NOTE: The dates of the rules are naive, and compared to the
+        # processing date as they are by the database.
+        date = (start or datetime.datetime.now()).replace(tzinfo=None)
+        version = module.rules_version
+        with self._lock:
+            if self._cached is not None:
+                cached_version, window, rules = self._cached
+                if (cached_version == version
+                        and rating.is_in_validity_window(window, date)):
+                    return rules
+            rules = module.load_global_rules(start)
+            window = rating.get_validity_window(
+                module.get_validity_boundaries(), date)
+            self._cached = (version, window, rules)
+            return rules
+
 
 class HashMap(rating.RatingProcessorBase):
     """HashMap rating module.
@@ -35,10 +96,18 @@ class HashMap(rating.RatingProcessorBase):
 
     db_api = hash_db_api.get_instance()
 
+    global_rules = GlobalRulesCache()
+
     def __init__(self, tenant_id=None):
         super(HashMap, self).__init__(tenant_id)
         self._entries = {}
+        self._index = {}
         self._res = {}
+        # Rating results by point signature, for the rules of _memo_index
+        self._memo = collections.OrderedDict()
+        self._memo_index = None
+        self.memo_hits = 0
+        self.memo_misses = 0
         self._load_rates()
 
     def reload_config(self, start=None):
@@ -47,114 +116,197 @@ class HashMap(rating.RatingProcessorBase):
         """
         self._load_rates(start)
 
-    def _load_mappings(self, mappings_uuid_list):
-        hashmap = hash_db_api.get_instance()
-        mappings = {}
-        for mapping_uuid in mappings_uuid_list:
-            mapping_db = hashmap.get_mapping(uuid=mapping_uuid)
-            if mapping_db.group_id:
-                group_name = mapping_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in mappings:
-                mappings[group_name] = {}
-            current_scope = mappings[group_name]
+    def bind_scope(self, tenant_id):
+        if tenant_id != self._tenant_id:
+            # NOTE: memoized ratings may come from the rules of the previous
+            # scope.
+            self._memo.clear()
+            self._memo_index = None
+        super(HashMap, self).bind_scope(tenant_id)
+
+    def get_validity_boundaries(self):
+        return hash_db_api.get_instance().get_validity_boundaries()
 
-            mapping_value = mapping_db.value
+    def _load_mappings(self, mappings):
+        result = {}
+        for mapping in mappings:
+            group_name = mapping.group_name or '_DEFAULT_'
+            current_scope = result.setdefault(group_name, {})
+
+            mapping_value = mapping.value
             if mapping_value:
                 current_scope[mapping_value] = {}
                 current_scope = current_scope[mapping_value]
-            current_scope['type'] = mapping_db.map_type
-            current_scope['cost'] = mapping_db.cost
-        return mappings
+            current_scope['type'] = mapping.map_type
+            current_scope['cost'] = mapping.cost
+        return result
 
-    def _load_thresholds(self, thresholds_uuid_list):
-        hashmap = hash_db_api.get_instance()
-        thresholds = {}
-        for threshold_uuid in thresholds_uuid_list:
-            threshold_db = hashmap.get_threshold(uuid=threshold_uuid)
-            if threshold_db.group_id:
-                group_name = threshold_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in thresholds:
-                thresholds[group_name] = {}
-            current_scope = thresholds[group_name]
+    def _load_thresholds(self, thresholds):
+        result = {}
+        for threshold in thresholds:
+            group_name = threshold.group_name or '_DEFAULT_'
+            current_scope = result.setdefault(group_name, {})
 
-            threshold_level = threshold_db.level
+            threshold_level = threshold.level
             current_scope[threshold_level] = {}
             current_scope = current_scope[threshold_level]
-            current_scope['type'] = threshold_db.map_type
-            current_scope['cost'] = threshold_db.cost
-        return thresholds
-
-    def _update_entries(self,
-                        entry_type,
-                        root,
-                        service_uuid=None,
-                        field_uuid=None,
-                        tenant_uuid=None,
-                        start=None):
+            current_scope['type'] = threshold.map_type
+            current_scope['cost'] = threshold.cost
+        return result
+
+    def _entry_loaders(self):
+        return (('mappings', self._load_mappings),
+                ('thresholds', self._load_thresholds))
+
+    @staticmethod
+    def _group_rows(rows):
+        """Group rule rows by parent, on the service or field primary key."""
+        rows_by_parent = {}
+        for row in rows:
+            if row.field_id is not None:
+                key = ('field', row.field_id)
+            else:
+                key = ('service', row.service_id)
+            rows_by_parent.setdefault(key, []).append(row)
+        return rows_by_parent
+
+    def load_global_rules(self, start=None):
+        """Load and compile the rules which are not specific to a tenant.
+
+        :returns: A dict with the services (name by primary key), fields
+                  ((service name, field name) by primary key), entries and
+                  compiled index.
+        """
         hashmap = hash_db_api.get_instance()
-        list_func = getattr(hashmap, 'list_{}'.format(entry_type))
-        entries_uuid_list = list_func(
-            service_uuid=service_uuid,
-            field_uuid=field_uuid,
-            tenant_uuid=tenant_uuid,
-            is_active=start or True)
-        load_func = getattr(self, '_load_{}'.format(entry_type))
-        entries = load_func(entries_uuid_list)
-        if entry_type in root:
-            res = root[entry_type]
-            for group, values in entries.items():
-                if group in res:
-                    res[group].update(values)
+        rules = hashmap.get_rating_rules(is_active=start or True)
+
+        entries = {}
+        services = {}
+        fields = {}
+        parents = {}
+        for service_id, service_name in rules['services']:
+            services[service_id] = service_name
+            parents[('service', service_id)] = entries[service_name] = {}
+        for field_id, service_id, field_name in rules['fields']:
+            service_name = services[service_id]
+            fields[field_id] = (service_name, field_name)
+            service_fields = entries[service_name].setdefault('fields', {})
+            parents[('field', field_id)] = service_fields[field_name] = {}
+
+        for entry_type, load_func in self._entry_loaders():
+            rows_by_parent = self._group_rows(rules[entry_type])
+            for key, parent in parents.items():
+                parent[entry_type] = load_func(rows_by_parent.get(key, []))
+
+        return {
+            'services': services,
+            'fields': fields,
+            'entries': entries,
+            'index': {service_name: self._compile_service(service_entries)
+                      for service_name, service_entries in entries.items()},
+        }
+
+    def _apply_overlay(self, rules, overlay):
+        """Merge the rules of the tenant with the global ones.
+
+        The global rules are shared with the other instances of the process
+        and must not be modified: only the services having tenant specific
+        rules are copied and compiled again.
+        """
+        entries = dict(self._entries)
+        modified = set()
+        for entry_type, load_func in self._entry_loaders():
+            rows_by_parent = self._group_rows(overlay[entry_type])
+            for (parent_type, parent_id), rows in rows_by_parent.items():
+                if parent_type == 'service':
+                    service_name = rules['services'].get(parent_id)
+                    field_name = None
                 else:
-                    res[group] = values
-        else:
-            root[entry_type] = entries
-
-    def _load_service_entries(self, service_name, service_uuid, start=None):
-        self._entries[service_name] = dict()
-        for entry_type in ('mappings', 'thresholds'):
-            for tenant in (None, self._tenant_id):
-                self._update_entries(
-                    entry_type,
-                    self._entries[service_name],
-                    service_uuid=service_uuid,
-                    tenant_uuid=tenant,
-                    start=start)
-
-    def _load_field_entries(self, service_name, field_name, field_uuid,
-                            start=None):
-        if service_name not in self._entries:
-            self._entries[service_name] = {}
-        if 'fields' not in self._entries[service_name]:
-            self._entries[service_name]['fields'] = {}
-        scope = self._entries[service_name]['fields'][field_name] = {}
-        for entry_type in ('mappings', 'thresholds'):
-            for tenant in (None, self._tenant_id):
-                self._update_entries(
-                    entry_type,
-                    scope,
-                    field_uuid=field_uuid,
-                    tenant_uuid=tenant,
-                    start=start)
+                    service_name, field_name = rules['fields'].get(
+                        parent_id, (None, None))
+                if service_name is None:
+                    # Created after the global rules were loaded, the rules
+                    # version changed and they will be reloaded.
+                    continue
+                if service_name not in modified:
+                    service = entries[service_name] = dict(
+                        entries[service_name])
+                    if 'fields' in service:
+                        service['fields'] = dict(service['fields'])
+                    modified.add(service_name)
+                parent = entries[service_name]
+                if field_name is not None:
+                    service_fields = parent['fields']
+                    parent = service_fields[field_name] = dict(
+                        service_fields[field_name])
+                groups = parent[entry_type] = dict(parent[entry_type])
+                for group_name, values in load_func(rows).items():
+                    groups[group_name] = {**groups.get(group_name, {}),
+                                          **values}
+        if not modified:
+            return
+        self._entries = entries
+        self._index = dict(self._index)
+        for service_name in modified:
+            self._index[service_name] = self._compile_service(
+                entries[service_name])
 
     def _load_rates(self, start=None):
-        self._entries = {}
-        hashmap = hash_db_api.get_instance()
-        services_uuid_list = hashmap.list_services()
-        for service_uuid in services_uuid_list:
-            service_db = hashmap.get_service(uuid=service_uuid)
-            service_name = service_db.name
-            self._load_service_entries(service_name, service_uuid, start)
-            fields_uuid_list = hashmap.list_fields(service_uuid)
-            for field_uuid in fields_uuid_list:
-                field_db = hashmap.get_field(uuid=field_uuid)
-                field_name = field_db.name
-                self._load_field_entries(service_name, field_name, field_uuid,
-                                         start)
+        rules = self.global_rules.get(self, start)
+        self._entries = rules['entries']
+        self._index = rules['index']
+        if self._tenant_id is not None:
+            hashmap = hash_db_api.get_instance()
+            overlay = hashmap.get_tenant_rating_rules(
+                self._tenant_id, is_active=start or True)
+            self._apply_overlay(rules, overlay)
+
+    @staticmethod
+    def _compile_mappings(mapping_groups):
+        """Index field mappings on their value.
+
+        :returns: A dict mapping each value to the list of
+                  (group name, mapping) matching it, in group order.
+        """
+        index = {}
+        for group_name, mappings in mapping_groups.items():
+            for mapping_value, mapping in mappings.items():
+                index.setdefault(mapping_value, []).append(
+                    (group_name, mapping))
+        return index
+
+    @staticmethod
+    def _compile_thresholds(threshold_groups):
+        """Sort the threshold levels of each group.
+
+        :returns: A list of (group name, sorted levels, thresholds by
+                  level), in group order.
+        """
+        return [(group_name, sorted(thresholds), thresholds)
+                for group_name, thresholds in threshold_groups.items()]
+
+    def _compile_service(self, entries):
+        """Build the evaluation index of the rules of a service.
+
+        The index keeps the order in which the rules are evaluated: service
+        rules first, then field rules, groups in their loading order.
+        """
+        return {
+            'mappings': list(entries['mappings'].items()),
+            'thresholds': self._compile_thresholds(entries['thresholds']),
+            'fields': [
+                (field_name,
+                 self._compile_mappings(field_entries['mappings']),
+                 self._compile_thresholds(field_entries['thresholds']))
+                for field_name, field_entries
+                in entries.get('fields', {}).items()],
+        }
+
+    def _compile_entries(self):
+        """Build the evaluation index of the loaded rules."""
+        self._index = {
+            service_name: self._compile_service(entries)
+            for service_name, entries in self._entries.items()}
 
     def add_rating_informations(self, point):
         for entry in self._res.values():
@@ -207,70 +359,130 @@ class HashMap(rating.RatingProcessorBase):
                     self._res[group]['flat'] = new_flat
 
     def process_mappings(self,
-                         mapping_groups,
+                         mappings_index,
                          cmp_value):
-        for group_name, mappings in mapping_groups.items():
-            for mapping_value, mapping in mappings.items():
-                if str(cmp_value) == mapping_value:
-
-                    self.update_result(
-                        group_name,
-                        mapping['type'],
-                        mapping['cost'])
+        for group_name, mapping in mappings_index.get(str(cmp_value), ()):
+            self.update_result(
+                group_name,
+                mapping['type'],
+                mapping['cost'])
 
     def process_thresholds(self,
-                           threshold_groups,
+                           thresholds_index,
                            cmp_level,
                            threshold_type):
-        for group_name, thresholds in threshold_groups.items():
-            for threshold_level, threshold in thresholds.items():
-                if cmp_level >= threshold_level:
-                    self.update_result(
-                        group_name,
-                        threshold['type'],
-                        threshold['cost'],
-                        threshold_level,
-                        True,
-                        threshold_type)
+        for group_name, levels, thresholds in thresholds_index:
+            # NOTE: Only the highest level reached by cmp_level is kept
+            position = bisect.bisect_right(levels, cmp_level)
+            if position:
+                threshold_level = levels[position - 1]
+                threshold = thresholds[threshold_level]
+                self.update_result(
+                    group_name,
+                    threshold['type'],
+                    threshold['cost'],
+                    threshold_level,
+                    True,
+                    threshold_type)
 
     def process_services(self, service_name, point):
-        if service_name not in self._entries:
+        if service_name not in self._index:
             return
-        service_mappings = self._entries[service_name]['mappings']
-        for group_name, mapping in service_mappings.items():
+        service_index = self._index[service_name]
+        for group_name, mapping in service_index['mappings']:
             self.update_result(group_name,
                                mapping['type'],
                                mapping['cost'])
-        service_thresholds = self._entries[service_name]['thresholds']
-        self.process_thresholds(service_thresholds,
+        self.process_thresholds(service_index['thresholds'],
                                 point.qty,
                                 'service')
 
     def process_fields(self, service_name, point):
-        if service_name not in self._entries:
-            return
-        if 'fields' not in self._entries[service_name]:
+        if service_name not in self._index:
             return
         desc_data = point.desc
-        field_mappings = self._entries[service_name]['fields']
-        for field_name, group_mappings in field_mappings.items():
+        for field_name, mappings_index, thresholds_index in \
+                self._index[service_name]['fields']:
             if field_name not in desc_data:
                 continue
             cmp_value = desc_data[field_name]
-            self.process_mappings(group_mappings['mappings'],
-                                  cmp_value)
-            if group_mappings['thresholds']:
-                self.process_thresholds(group_mappings['thresholds'],
+            self.process_mappings(mappings_index, cmp_value)
+            if thresholds_index:
+                self.process_thresholds(thresholds_index,
                                         decimal.Decimal(cmp_value),
                                         'field')
 
+    def get_signature(self, service_name, point):
+        """Get what the rating of a point depends on.
+
+        Points with the same signature get the same rating results: the
+        signature is made of the service, of the value of the fields
+        matching a mapping and of the threshold levels reached.
+
+        :returns: A tuple, or None if no rule applies to the service.
+        """
+        service_index = self._index.get(service_name)
+        if service_index is None:
+            return None
+        signature = [service_name]
+        for group_name, levels, thresholds in service_index['thresholds']:
+            signature.append(bisect.bisect_right(levels, point.qty))
+        desc_data = point.desc
+        for field_name, mappings_index, thresholds_index in \
+                service_index['fields']:
+            if field_name not in desc_data:
+                signature.append(None)
+                continue
+            cmp_value = desc_data[field_name]
+            value = str(cmp_value)
+            signature.append(value if value in mappings_index else False)
+            if thresholds_index:
+                cmp_level = decimal.Decimal(cmp_value)
+                for group_name, levels, thresholds in thresholds_index:
+                    signature.append(bisect.bisect_right(levels, cmp_level))
+        return tuple(signature)
+
+    def _get_result(self, signature, service_name, point):
+        res = self._memo.get(signature)
+        if res is not None:
+            self._memo.move_to_end(signature)
+            self.memo_hits += 1
+            return res
+
+        self.memo_misses += 1
+        self._res = {}
+        self.process_services(service_name, point)
+        self.process_fields(service_name, point)
+        memo_size = cfg.CONF.hashmap.memoization_size
+        if memo_size:
+            self._memo[signature] = self._res
+            if len(self._memo) > memo_size:
+                self._memo.popitem(last=False)
+        return self._res
+
     def process(self, data):
         output = dataframe.DataFrame(start=data.start, end=data.end)
 
+        # NOTE: The memoized results are valid as long as the rules used to
+        # compute them are. A new index is built each time they change.
+        if self._memo_index is not self._index:
+            self._memo.clear()
+            self._memo_index = self._index
+
+        hits, misses = self.memo_hits, self.memo_misses
         for service_name, point in data.iterpoints():
-            self._res = {}
-            self.process_services(service_name, point)
-            self.process_fields(service_name, point)
+            signature = self.get_signature(service_name, point)
+            if signature is None:
+                output.add_point(point, service_name)
+                continue
+            self._res = self._get_result(signature, service_name, point)
             output.add_point(self.add_rating_informations(point), service_name)
 
+        hits = self.memo_hits - hits
+        misses = self.memo_misses - misses
+        if hits or misses:
+            LOG.debug("HashMap memoization: %d hits, %d misses "
+                      "(%.1f%% hit ratio), %d signatures kept.",
+                      hits, misses, 100. * hits / (hits + misses),
+                      len(self._memo))
         return output
@@ -304,6 +304,47 @@ class HashMap(object, metaclass=abc.ABCMeta):
         :return list(str): List of thresholds' UUID.
         """
 
+    @abc.abstractmethod
+    def get_rating_rules(self, tenant_uuid=None, is_active=True):
+        """Return everything needed to rate the data of a tenant.
+
+        Mappings and thresholds are the global ones, followed by the ones
+        specific to the tenant. Each row has the service_id or field_id
+        of its parent, its tenant_id, value (mappings) or level
+        (thresholds), map_type, cost and group_name (None if it has no
+        group).
+
+        :param tenant_uuid: The tenant to get the specific rules of.
+        :param is_active: Only return the mappings active at this date,
+                          or now if True.
+
+        :return dict: Rows by type: services (id, name), fields (id,
+                      service_id, name), mappings and thresholds.
+        """
+
+    @abc.abstractmethod
+    def get_tenant_rating_rules(self, tenant_uuid, is_active=True):
+        """Return the rules specific to a tenant.
+
+        Rows have the same format as the ones of get_rating_rules.
+
+        :param tenant_uuid: The tenant to get the specific rules of.
+        :param is_active: Only return the mappings active at this date,
+                          or now if True.
+
+        :return dict: Rows by type: mappings and thresholds.
+        """
+
+    @abc.abstractmethod
+    def get_validity_boundaries(self):
+        """Return the dates at which the set of active mappings changes.
+
+        These are the start and end dates of every mapping which is not
+        deleted.
+
+        :return list(datetime.datetime): Sorted list of dates.
+        """
+
     @abc.abstractmethod
     def create_service(self, name):
         """Create a new service.
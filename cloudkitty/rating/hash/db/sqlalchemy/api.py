@@ -22,6 +22,7 @@ import sqlalchemy
 
 from cloudkitty import db
 from cloudkitty.rating.common.db.filters import get_filters
+from cloudkitty.rating.common.db import versioning
 from cloudkitty.rating.hash.db import api
 from cloudkitty.rating.hash.db.sqlalchemy import migration
 from cloudkitty.rating.hash.db.sqlalchemy import models
@@ -250,6 +251,87 @@ class HashMap(api.HashMap):
                 models.HashMapThreshold.threshold_id)
             return [uuid[0] for uuid in res]
 
+    @staticmethod
+    def _get_mapping_rows(session, tenants, is_active):
+        q = session.query(
+            models.HashMapMapping.service_id,
+            models.HashMapMapping.field_id,
+            models.HashMapMapping.tenant_id,
+            models.HashMapMapping.value,
+            models.HashMapMapping.map_type,
+            models.HashMapMapping.cost,
+            models.HashMapGroup.name.label('group_name'))
+        q = q.outerjoin(models.HashMapMapping.group)
+        q = q.filter(sqlalchemy.or_(
+            *[models.HashMapMapping.tenant_id == tenant
+              for tenant in tenants]))
+        q = get_filters(q, models.HashMapMapping, is_active=is_active)
+        return q.order_by(models.HashMapMapping.id).all()
+
+    @staticmethod
+    def _get_threshold_rows(session, tenants):
+        q = session.query(
+            models.HashMapThreshold.service_id,
+            models.HashMapThreshold.field_id,
+            models.HashMapThreshold.tenant_id,
+            models.HashMapThreshold.level,
+            models.HashMapThreshold.map_type,
+            models.HashMapThreshold.cost,
+            models.HashMapGroup.name.label('group_name'))
+        q = q.outerjoin(models.HashMapThreshold.group)
+        q = q.filter(sqlalchemy.or_(
+            *[models.HashMapThreshold.tenant_id == tenant
+              for tenant in tenants]))
+        return q.order_by(models.HashMapThreshold.id).all()
+
+    def get_rating_rules(self, tenant_uuid=None, is_active=True):
+        with db.session_for_read() as session:
+            services = session.query(
+                models.HashMapService.id,
+                models.HashMapService.name,
+            ).order_by(models.HashMapService.id).all()
+
+            fields = session.query(
+                models.HashMapField.id,
+                models.HashMapField.service_id,
+                models.HashMapField.name,
+            ).order_by(models.HashMapField.id).all()
+
+            tenants = [None] if tenant_uuid is None else [None, tenant_uuid]
+            mappings = self._get_mapping_rows(session, tenants, is_active)
+            thresholds = self._get_threshold_rows(session, tenants)
+
+        # NOTE: tenant specific rules override the global ones.
+        def _tenant_last(row):
+            return row.tenant_id is not None
+
+        return {
+            'services': services,
+            'fields': fields,
+            'mappings': sorted(mappings, key=_tenant_last),
+            'thresholds': sorted(thresholds, key=_tenant_last),
+        }
+
+    def get_tenant_rating_rules(self, tenant_uuid, is_active=True):
+        with db.session_for_read() as session:
+            return {
+                'mappings': self._get_mapping_rows(
+                    session, [tenant_uuid], is_active),
+                'thresholds': self._get_threshold_rows(
+                    session, [tenant_uuid]),
+            }
+
+    def get_validity_boundaries(self):
+        with db.session_for_read() as session:
+            q = session.query(models.HashMapMapping)
+            q = q.filter(
+                models.HashMapMapping.deleted == sqlalchemy.null())
+            res = q.values(
+                models.HashMapMapping.start,
+                models.HashMapMapping.end)
+            return sorted({date for dates in res for date in dates if date})
+
+    @versioning.bumps_rules_version('hashmap')
     def create_service(self, name):
         try:
             with db.session_for_write() as session:
@@ -263,6 +345,7 @@ class HashMap(api.HashMap):
                 service_db.name,
                 service_db.service_id)
 
+    @versioning.bumps_rules_version('hashmap')
     def create_field(self, service_uuid, name):
         service_db = self.get_service(uuid=service_uuid)
         try:
@@ -281,6 +364,7 @@ class HashMap(api.HashMap):
         else:
             return field_db
 
+    @versioning.bumps_rules_version('hashmap')
     def create_group(self, name):
         try:
             with db.session_for_write() as session:
@@ -293,6 +377,7 @@ class HashMap(api.HashMap):
             group_db = self.get_group(name=name)
             raise api.GroupAlreadyExists(name, group_db.group_id)
 
+    @versioning.bumps_rules_version('hashmap')
     def create_mapping(self,
                        cost,
                        map_type='rate',
@@ -444,6 +529,7 @@ class HashMap(api.HashMap):
         field_map = self.get_mapping(field_map.mapping_id)
         return field_map
 
+    @versioning.bumps_rules_version('hashmap')
     def create_threshold(self,
                          level,
                          cost,
@@ -496,6 +582,7 @@ class HashMap(api.HashMap):
         threshold_db = self.get_threshold(threshold_db.threshold_id)
         return threshold_db
 
+    @versioning.bumps_rules_version('hashmap')
     def update_mapping(self, uuid, **kwargs):
         try:
             with db.session_for_write() as session:
@@ -543,6 +630,7 @@ class HashMap(api.HashMap):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchMapping(uuid)
 
+    @versioning.bumps_rules_version('hashmap')
     def update_threshold(self, uuid, **kwargs):
         try:
             with db.session_for_write() as session:
@@ -583,6 +671,7 @@ class HashMap(api.HashMap):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchThreshold(uuid)
 
+    @versioning.bumps_rules_version('hashmap')
     def delete_service(self, name=None, uuid=None):
         with db.session_for_write() as session:
             q = utils.model_query(
@@ -599,6 +688,7 @@ class HashMap(api.HashMap):
             if not r:
                 raise api.NoSuchService(name, uuid)
 
+    @versioning.bumps_rules_version('hashmap')
     def delete_field(self, uuid):
         with db.session_for_write() as session:
             q = utils.model_query(
@@ -609,6 +699,7 @@ class HashMap(api.HashMap):
             if not r:
                 raise api.NoSuchField(uuid)
 
+    @versioning.bumps_rules_version('hashmap')
     def delete_group(self, uuid, recurse=True):
         with db.session_for_write() as session:
             q = utils.model_query(
@@ -626,6 +717,7 @@ class HashMap(api.HashMap):
                     session.delete(threshold)
             q.delete()
 
+    @versioning.bumps_rules_version('hashmap')
     def delete_mapping(self, uuid, deleted_by=None):
         try:
             with db.session_for_write() as session:
@@ -639,6 +731,7 @@ class HashMap(api.HashMap):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchMapping(uuid)
 
+    @versioning.bumps_rules_version('hashmap')
     def delete_threshold(self, uuid):
         with db.session_for_write() as session:
             q = utils.model_query(
@@ -13,15 +13,54 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
-from cloudkitty import dataframe
+import threading
+
 from cloudkitty import rating
 from cloudkitty.rating.pyscripts.controllers import root as root_api
 from cloudkitty.rating.pyscripts.db import api as pyscripts_db_api
+from cloudkitty.rating.pyscripts import executor
+from cloudkitty.rating.pyscripts import runner
 
+from oslo_config import cfg
 from oslo_log import log as logging
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
+
+class CodeCache(object):
+    """Process-wide cache of the compiled scripts.
+
+    The code is cached on the script uuid and checksum, so that it is shared
+    by all the PyScripts instances of the process and only compiled again
+    when the script is modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._code = {}
+
+    def clear(self):
+        with self._lock:
+            self._code = {}
+
+    def get(self, script_db):
+        key = (script_db.script_id, script_db.checksum)
+        with self._lock:
+            code = self._code.get(key)
+            if code is None:
+                code = compile(
+                    script_db.data,
+                    '<PyScripts: {name}>'.format(name=script_db.name),
+                    'exec')
+                # Previous versions of the script are not needed anymore
+                for cached_key in list(self._code):
+                    if cached_key[0] == script_db.script_id:
+                        del self._code[cached_key]
+                self._code[key] = code
+            return code
+
 
 class PyScripts(rating.RatingProcessorBase):
     """PyScripts rating module.
@@ -37,6 +76,10 @@ class PyScripts(rating.RatingProcessorBase):
 
     db_api = pyscripts_db_api.get_instance()
 
+    code_cache = CodeCache()
+
+    script_executor = executor.ScriptExecutor()
+
     def __init__(self, tenant_id=None):
         # current scripts loaded to memory
         self._scripts = {}
@@ -46,28 +89,22 @@ class PyScripts(rating.RatingProcessorBase):
 
     def load_scripts_in_memory(self, start=None):
         db = pyscripts_db_api.get_instance()
-        scripts_uuid_list = db.list_scripts(is_active=start or True)
-        self.purge_removed_scripts(scripts_uuid_list)
+        scripts_db = db.get_scripts(is_active=start or True)
+        self.purge_removed_scripts(
+            [script_db.script_id for script_db in scripts_db])
 
         # Load or update script
-        for script_uuid in scripts_uuid_list:
-            script_db = db.get_script(uuid=script_uuid)
-            name = script_db.name
-            checksum = script_db.checksum
-            if name not in self._scripts:
-                self._scripts[script_uuid] = {}
-            script = self._scripts[script_uuid]
+        for script_db in scripts_db:
+            script = self._scripts.setdefault(script_db.script_id, {})
             # NOTE(sheeprine): We're doing this the easy way, we might want to
             # store the context and call functions in future
-            if script.get(checksum, '') != checksum:
-                code = compile(
-                    script_db.data,
-                    '<PyScripts: {name}>'.format(name=name),
-                    'exec')
+            if script.get('checksum') != script_db.checksum:
+                code = self.code_cache.get(script_db)
                 script.update({
-                    'name': name,
+                    'name': script_db.name,
                     'code': code,
-                    'checksum': checksum})
+                    'checksum': script_db.checksum,
+                    'contract': runner.get_contract(code)})
 
     def purge_removed_scripts(self, scripts_uuid_list):
         scripts_to_purge = self.get_all_script_to_remove(scripts_uuid_list)
@@ -95,21 +132,17 @@ class PyScripts(rating.RatingProcessorBase):
         self.load_scripts_in_memory(start)
         LOG.debug("Configurations reloaded.")
 
+    def get_validity_boundaries(self):
+        return pyscripts_db_api.get_instance().get_validity_boundaries()
+
     def start_script(self, code, data):
-        context = {'data': data}
-        exec(code, context)  # nosec
-        return context['data']
+        return runner.start_script(code, data)
 
     def process(self, data):
+        use_pool = CONF.pyscripts.executor == 'process'
         for script in self._scripts.values():
-            data_dict = data.as_dict(mutable=True)
-            LOG.debug("Executing pyscript [%s] with data [%s].",
-                      script, data_dict)
-
-            data_output = self.start_script(script['code'], data_dict)
-
-            LOG.debug("Result [%s] for processing with pyscript [%s] with "
-                      "data [%s].", data_output, script, data_dict)
-
-            data = dataframe.DataFrame.from_dict(data_output)
+            if use_pool:
+                data = self.script_executor.run(script, data)
+            else:
+                data = runner.run_script(script, data)
         return data
@@ -78,6 +78,23 @@ class PyScripts(object, metaclass=abc.ABCMeta):
 
         """
 
+    @abc.abstractmethod
+    def get_scripts(self, **kwargs):
+        """Return every script available, with its data.
+
+        Scripts are filtered like in list_scripts.
+        """
+
+    @abc.abstractmethod
+    def get_validity_boundaries(self):
+        """Return the dates at which the set of active scripts changes.
+
+        These are the start and end dates of every script which is not
+        deleted.
+
+        :return list(datetime.datetime): Sorted list of dates.
+        """
+
     @abc.abstractmethod
     def create_script(self, name, data,
                       start=None,
@@ -21,6 +21,7 @@ import sqlalchemy
 
 from cloudkitty import db
 from cloudkitty.rating.common.db.filters import get_filters
+from cloudkitty.rating.common.db import versioning
 from cloudkitty.rating.pyscripts.db import api
 from cloudkitty.rating.pyscripts.db.sqlalchemy import migration
 from cloudkitty.rating.pyscripts.db.sqlalchemy import models
@@ -63,6 +64,23 @@ class PyScripts(api.PyScripts):
                 models.PyScriptsScript.script_id)
             return [uuid[0] for uuid in res]
 
+    def get_scripts(self, **kwargs):
+        with db.session_for_read() as session:
+            q = session.query(models.PyScriptsScript)
+            q = get_filters(q, models.PyScriptsScript, **kwargs)
+            return q.order_by(models.PyScriptsScript.id).all()
+
+    def get_validity_boundaries(self):
+        with db.session_for_read() as session:
+            q = session.query(models.PyScriptsScript)
+            q = q.filter(
+                models.PyScriptsScript.deleted == sqlalchemy.null())
+            res = q.values(
+                models.PyScriptsScript.start,
+                models.PyScriptsScript.end)
+            return sorted({date for dates in res for date in dates if date})
+
+    @versioning.bumps_rules_version('pyscripts')
     def create_script(self, name, data,
                       start=None,
                       end=None,
@@ -102,6 +120,7 @@ class PyScripts(api.PyScripts):
                 script_db.name,
                 script_db.script_id)
 
+    @versioning.bumps_rules_version('pyscripts')
     def update_script(self, uuid, **kwargs):
         try:
             with db.session_for_write() as session:
@@ -128,6 +147,7 @@ class PyScripts(api.PyScripts):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchScript(uuid=uuid)
 
+    @versioning.bumps_rules_version('pyscripts')
     def delete_script(self, name=None, uuid=None, deleted_by=None):
         with db.session_for_write() as session:
             try:
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import functools
+import marshal
+import math
+import multiprocessing
+import pickle
+import resource
+import signal
+import threading
+
+from concurrent import futures
+from concurrent.futures import process
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from cloudkitty.rating.pyscripts import runner
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+
+pyscripts_opts = [
+    cfg.StrOpt('executor',
+               default='inline',
+               choices=['inline', 'process'],
+               help='How scripts are executed. "inline" executes them in '
+                    'the thread processing the scope, "process" in a '
+                    'persistent pool of worker processes, shared by the '
+                    'scopes of the processor.'),
+    cfg.IntOpt('process_workers',
+               default=2,
+               min=1,
+               help='Number of worker processes executing the scripts, '
+                    'with the "process" executor.'),
+    cfg.IntOpt('script_timeout',
+               default=300,
+               min=0,
+               help='Maximal wall-clock time in seconds of a script run, '
+                    'with the "process" executor. The pool is replaced '
+                    'when a worker process does not return in time. Set '
+                    'to 0 for no limit.'),
+    cfg.IntOpt('script_cpu_time',
+               default=60,
+               min=0,
+               help='Maximal CPU time in seconds of a script run, with the '
+                    '"process" executor. Set to 0 for no limit.'),
+    cfg.IntOpt('max_scripts_per_worker',
+               default=1000,
+               min=0,
+               help='Number of script runs after which a worker process is '
+                    'replaced, with the "process" executor. Set to 0 to '
+                    'keep the worker processes forever.'),
+]
+
+CONF.register_opts(pyscripts_opts, 'pyscripts')
+
+
+# NOTE: Delay after the wall-clock limit of a script before its worker
+# process is considered stuck.
+WORKER_TIMEOUT_MARGIN = 5
+
+
+class ScriptTimeout(Exception):
+    """A script exceeded its wall-clock or CPU time."""
+
+
+def _on_cpu_time_exceeded(signum, frame):
+    raise ScriptTimeout('CPU time limit exceeded')
+
+
+def _on_wall_clock_time_exceeded(signum, frame):
+    raise ScriptTimeout('Wall-clock time limit exceeded')
+
+
+def _init_worker():
+    signal.signal(signal.SIGXCPU, _on_cpu_time_exceeded)
+    signal.signal(signal.SIGALRM, _on_wall_clock_time_exceeded)
+
+
+@functools.lru_cache(maxsize=128)
+def _load_code(checksum, marshalled_code):
+    return marshal.loads(marshalled_code)
+
+
+def _run_in_worker(name, checksum, marshalled_code, contract, payload,
+                   cpu_time, timeout):
+    script = {
+        'name': name,
+        'code': _load_code(checksum, marshalled_code),
+        'contract': contract,
+    }
+    data = pickle.loads(payload)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_time:
+        # NOTE: RLIMIT_CPU applies to the whole life of the process, the
+        # limit is set relatively to the CPU time already used.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_time
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        output = runner.run_script(script, data)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cpu_time:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    return pickle.dumps(output, pickle.HIGHEST_PROTOCOL)
+
+
+class ScriptExecutor(object):
+    """Runs scripts in a persistent pool of worker processes.
+
+    Compiled scripts are sent marshalled, and frames pickled, which keeps
+    the groupby and metadata mappings shared by several points deduplicated.
+    The worker processes enforce the time limits of the scripts, and are
+    replaced after max_scripts_per_worker runs. The pool is created on first
+    use, and replaced when a worker process is stuck or dies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = futures.ProcessPoolExecutor(
+                    max_workers=CONF.pyscripts.process_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    max_tasks_per_child=(
+                        CONF.pyscripts.max_scripts_per_worker or None))
+            return self._pool
+
+    def _replace_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # NOTE: The pending scripts of the pool are cancelled, the running
+        # ones complete in the background.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, script, data):
+        args = (script['name'],
+                script['checksum'],
+                marshal.dumps(script['code']),
+                script['contract'],
+                pickle.dumps(data, pickle.HIGHEST_PROTOCOL),
+                CONF.pyscripts.script_cpu_time,
+                CONF.pyscripts.script_timeout)
+        pool = self._get_pool()
+        try:
+            return pool, pool.submit(_run_in_worker, *args)
+        except RuntimeError:
+            # The pool was replaced by another thread in the meantime
+            pool = self._get_pool()
+            return pool, pool.submit(_run_in_worker, *args)
+
+    def run(self, script, data):
+        """Rate a DataFrame with a script, in a worker process.
+
+        :param script: A dict with the name, code, checksum and contract of
+                       the script.
+        :param data: The DataFrame to rate.
+        :returns: The rated DataFrame.
+        """
+        timeout = CONF.pyscripts.script_timeout
+        pool, future = self._submit(script, data)
+        try:
+            output = future.result(
+                timeout=timeout + WORKER_TIMEOUT_MARGIN if timeout else None)
+        except futures.TimeoutError:
+            LOG.warning("The worker process running PyScript [%s] did not "
+                        "return within %d seconds, replacing the worker "
+                        "processes.", script['name'], timeout)
+            self._replace_pool(pool)
+            raise ScriptTimeout(
+                'Script {} did not complete within {} seconds'.format(
+                    script['name'], timeout))
+        except process.BrokenProcessPool:
+            LOG.warning("A PyScripts worker process died while running "
+                        "[%s], replacing the worker processes.",
+                        script['name'])
+            self._replace_pool(pool)
+            raise
+        return pickle.loads(output)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import dis
+import types
+
+from oslo_log import log as logging
+
+from cloudkitty import dataframe
+
+LOG = logging.getLogger(__name__)
+
+# Script contracts
+DATA_CONTRACT = 'data'
+FRAME_CONTRACT = 'frame'
+POINT_CONTRACT = 'point'
+
+_GLOBAL_NAME_OPS = frozenset((
+    'LOAD_NAME', 'STORE_NAME', 'DELETE_NAME',
+    'LOAD_GLOBAL', 'STORE_GLOBAL', 'DELETE_GLOBAL'))
+
+
+def _iter_code(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _iter_code(const)
+
+
+def _uses_global(code, name):
+    # NOTE: Only the accesses to the global variable count, not attributes
+    # or local variables with the same name, like resp.data.
+    return any(instr.opname in _GLOBAL_NAME_OPS and instr.argval == name
+               for nested in _iter_code(code)
+               for instr in dis.get_instructions(nested))
+
+
+def _defines_global(code, name):
+    # NOTE: Functions are defined by storing them in the module namespace,
+    # attributes with the same name, like obj.process, are not.
+    return any(instr.opname in ('STORE_NAME', 'STORE_GLOBAL')
+               and instr.argval == name
+               for instr in dis.get_instructions(code))
+
+
+def get_contract(code):
+    """Detect the contract implemented by a compiled script.
+
+    Scripts using the "data" global get the frame serialized as a dict, and
+    must set "data" to the rated dict. Other scripts may instead define a
+    global process(frame) function, getting and returning a DataFrame, or a
+    global rate_point(metric_type, point) function, getting and returning
+    each DataPoint.
+    """
+    if _uses_global(code, 'data'):
+        return DATA_CONTRACT
+    if _defines_global(code, 'process'):
+        return FRAME_CONTRACT
+    if _defines_global(code, 'rate_point'):
+        return POINT_CONTRACT
+    return DATA_CONTRACT
+
+
+def start_script(code, data):
+    context = {'data': data}
+    exec(code, context)  # nosec
+    return context['data']
+
+
+def _process_data(script, data):
+    data_dict = data.as_dict(mutable=True)
+    LOG.debug("Executing pyscript [%s] with data [%s].",
+              script, data_dict)
+
+    data_output = start_script(script['code'], data_dict)
+
+    LOG.debug("Result [%s] for processing with pyscript [%s] with "
+              "data [%s].", data_output, script, data_dict)
+
+    # NOTE: the frame was serialized by CloudKitty, and scripts are
+    # managed by administrators: the schema validation is skipped.
+    return dataframe.DataFrame.from_dict(data_output, validate=False)
+
+
+def _process_objects(script, data):
+    LOG.debug("Executing pyscript [%s] on frame [%s].", script, data)
+    context = {}
+    exec(script['code'], context)  # nosec
+    if script['contract'] == FRAME_CONTRACT:
+        return context['process'](data)
+
+    rate_point = context['rate_point']
+    output = dataframe.DataFrame(start=data.start, end=data.end)
+    for metric_type, point in data.iterpoints():
+        output.add_point(rate_point(metric_type, point), metric_type)
+    return output
+
+
+def run_script(script, data):
+    """Rate a DataFrame with a loaded script.
+
+    :param script: A dict with the name, code and contract of the script.
+    :param data: The DataFrame to rate.
+    :returns: The rated DataFrame.
+    """
+    if script['contract'] == DATA_CONTRACT:
+        return _process_data(script, data)
+    return _process_objects(script, data)
@@ -109,7 +109,8 @@ class V1StorageAdapter(storage_v2.BaseStorage):
             tzutils.local_to_utc(end, naive=True) if end else None,
             res_type=metric_types,
             tenant_id=tenant_id)
-        frames = [dataframe.DataFrame.from_dict(frame, legacy=True)
+        frames = [dataframe.DataFrame.from_dict(frame, legacy=True,
+                                                validate=False)
                   for frame in frames]
         self._localize_dataframes(frames)
         return {
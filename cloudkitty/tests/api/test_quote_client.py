@@ -0,0 +1,161 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+from unittest import mock
+
+import oslo_messaging
+from stevedore import extension
+
+from cloudkitty.api import quote_client
+from cloudkitty.db import api as ck_db_api
+from cloudkitty import orchestrator
+from cloudkitty import tests
+
+
+class LocalQuoteClientTest(tests.TestCase):
+    QUOTE_DATA = {'usage': {'volume': [
+        {'vol': {'unit': 'GiB', 'qty': 10}}]}}
+
+    def setUp(self):
+        super(LocalQuoteClientTest, self).setUp()
+        self.conf.set_override('local_quotes', True, 'api')
+        self._processor = mock.Mock(priority=1)
+        self._processor.quote.side_effect = self._quote
+        ext_manager_patch = mock.patch.object(
+            orchestrator.extension_manager, 'EnabledExtensionManager',
+            return_value=[extension.Extension(
+                'fake', None, None, self._processor)])
+        self._ext_manager = ext_manager_patch.start()
+        self.addCleanup(ext_manager_patch.stop)
+        client_patch = mock.patch.object(quote_client, '_LOCAL_CLIENT', None)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self._rpc_client = mock.Mock()
+        self._module_db = ck_db_api.get_instance().get_module_info()
+        self._module_db.set_state('fake', True)
+
+    @staticmethod
+    def _quote(frame):
+        for metric_type, points in frame.itertypes():
+            frame.replace_points(
+                [p.set_price(p.qty * 2) for p in points], metric_type)
+        return frame
+
+    def _call(self, method, **kwargs):
+        client = quote_client.get_client(self._rpc_client)
+        return client.call({}, method, **kwargs)
+
+    def test_get_client_rpc(self):
+        self.conf.set_override('local_quotes', False, 'api')
+        self.assertEqual(self._rpc_client.prepare.return_value,
+                         quote_client.get_client(self._rpc_client))
+        self._rpc_client.prepare.assert_called_once_with(namespace='rating')
+
+    def test_get_client_local(self):
+        client = quote_client.get_client(self._rpc_client)
+        self.assertIsInstance(client, quote_client.LocalQuoteClient)
+        self.assertIs(client, quote_client.get_client(self._rpc_client))
+        self._rpc_client.prepare.assert_not_called()
+
+    def test_quote(self):
+        self.assertEqual('20', self._call('quote', res_data=self.QUOTE_DATA))
+        self.assertEqual(
+            ['20', '20'],
+            self._call('quote_batch',
+                       res_data=[self.QUOTE_DATA, self.QUOTE_DATA]))
+        self._ext_manager.assert_called_once()
+        self._rpc_client.prepare.assert_not_called()
+
+    def test_modules_reloaded_on_state_change(self):
+        self._call('quote', res_data=self.QUOTE_DATA)
+        self._module_db.set_state('other', True)
+        self._call('quote', res_data=self.QUOTE_DATA)
+        self._module_db.set_priority('fake', 2)
+        self._call('quote', res_data=self.QUOTE_DATA)
+        self.assertEqual(3, self._ext_manager.call_count)
+
+    def test_modules_not_reloaded_on_rules_change(self):
+        self._call('quote', res_data=self.QUOTE_DATA)
+        self._module_db.bump_rules_version('fake')
+        self._call('quote', res_data=self.QUOTE_DATA)
+        self._ext_manager.assert_called_once()
+        self.assertEqual(2, self._processor.refresh_config.call_count)
+
+    def test_modules_listed_on_version_change(self):
+        module_info = type(self._module_db)
+        with mock.patch.object(module_info, 'list_modules',
+                               autospec=True,
+                               side_effect=module_info.list_modules) as lm:
+            for _ in range(3):
+                self._call('quote', res_data=self.QUOTE_DATA)
+            lm.assert_called_once()
+            self._module_db.bump_rules_version('fake')
+            self._call('quote', res_data=self.QUOTE_DATA)
+            self.assertEqual(2, lm.call_count)
+        self._ext_manager.assert_called_once()
+
+    def test_call_unsupported_method(self):
+        self.assertRaises(ValueError, self._call, 'reload_modules')
+
+
+class QuoteBatchTest(tests.TestCase):
+    QUOTE_DATA = [{'usage': {'volume': [
+        {'vol': {'unit': 'GiB', 'qty': qty}}]}} for qty in (1, 2)]
+
+    def setUp(self):
+        super(QuoteBatchTest, self).setUp()
+        self._rpc_client = mock.Mock()
+        self._rpc_client.prepare.return_value = self._rpc_client
+
+    def _quote(self, ctxt, method, res_data):
+        if method == 'quote_batch':
+            raise oslo_messaging.RemoteError('UnsupportedVersion')
+        return str(res_data['usage']['volume'][0]['vol']['qty'])
+
+    def test_quote_batch(self):
+        self._rpc_client.call.return_value = ['1', '2']
+        self.assertEqual(
+            ['1', '2'],
+            quote_client.quote_batch(self._rpc_client, self.QUOTE_DATA))
+        self._rpc_client.prepare.assert_called_once_with(
+            namespace='rating', version=quote_client.QUOTE_BATCH_VERSION)
+        self._rpc_client.call.assert_called_once_with(
+            {}, 'quote_batch', res_data=self.QUOTE_DATA)
+
+    def test_quote_batch_old_processor(self):
+        self._rpc_client.call.side_effect = self._quote
+        self.assertEqual(
+            ['1', '2'],
+            quote_client.quote_batch(self._rpc_client, self.QUOTE_DATA))
+        self.assertEqual(
+            [mock.call({}, 'quote_batch', res_data=self.QUOTE_DATA),
+             mock.call({}, 'quote', res_data=self.QUOTE_DATA[0]),
+             mock.call({}, 'quote', res_data=self.QUOTE_DATA[1])],
+            self._rpc_client.call.call_args_list)
+        self._rpc_client.prepare.assert_called_with(namespace='rating')
+
+    def test_quote_batch_version_cap(self):
+        self._rpc_client.call.side_effect = [
+            oslo_messaging.UnsupportedVersion('1.1'), '1', '2']
+        self.assertEqual(
+            ['1', '2'],
+            quote_client.quote_batch(self._rpc_client, self.QUOTE_DATA))
+
+    def test_quote_batch_remote_error(self):
+        self._rpc_client.call.side_effect = oslo_messaging.RemoteError(
+            'ValueError')
+        self.assertRaises(
+            oslo_messaging.RemoteError,
+            quote_client.quote_batch, self._rpc_client, self.QUOTE_DATA)
+        self._rpc_client.call.assert_called_once()
@@ -0,0 +1,146 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import decimal
+from unittest import mock
+
+import flask
+
+from cloudkitty.api.v2.rating import quote
+from cloudkitty.db import api as ck_db_api
+from cloudkitty import tests
+
+
+def _prices(*prices):
+    return {'prices': [decimal.Decimal(price) for price in prices]}
+
+
+class TestQuoteEndpoint(tests.TestCase):
+
+    INSTANCE = {'service': 'instance', 'qty': 1,
+                'metadata': {'flavor_name': 'm1.tiny'}}
+    VOLUME = {'service': 'volume', 'qty': '10.0', 'unit': 'GiB'}
+
+    def setUp(self):
+        super(TestQuoteEndpoint, self).setUp()
+        quote.Quote.cache.clear()
+        self.client = mock.Mock()
+        self.client.prepare.return_value = self.client
+        self.client.call.side_effect = self._quote_batch
+        client_patch = mock.patch('cloudkitty.messaging.get_client',
+                                  return_value=self.client)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.endpoint = quote.Quote()
+        self.endpoint._client = self.client
+        self.module_db = ck_db_api.get_instance().get_module_info()
+        self.module_db.set_state('hashmap', True)
+        policy_patch = mock.patch('cloudkitty.common.policy.authorize')
+        policy_patch.start()
+        self.addCleanup(policy_patch.stop)
+        flask.request.context = mock.Mock()
+
+    @staticmethod
+    def _quote_batch(ctxt, method, res_data):
+        prices = []
+        for data in res_data:
+            price = decimal.Decimal(0)
+            for points in data['usage'].values():
+                for point in points:
+                    price += decimal.Decimal(point['vol']['qty'])
+            prices.append(str(price))
+        return prices
+
+    def _post(self, *quotes):
+        body = {'quotes': [{'resources': list(q)} for q in quotes]}
+        with mock.patch('flask.request.get_json', return_value=body):
+            return self.endpoint.post()
+
+    def test_post_prices_all_quotes_in_one_call(self):
+        self.assertEqual(
+            _prices('1', '10', '11'),
+            self._post([self.INSTANCE], [self.VOLUME],
+                       [self.VOLUME, self.INSTANCE]))
+        self.client.call.assert_called_once()
+        res_data = self.client.call.call_args[1]['res_data']
+        self.assertEqual(3, len(res_data))
+        self.assertEqual(
+            {'volume': [{'vol': {'qty': '10', 'unit': 'GiB'},
+                         'desc': {'groupby': {}, 'metadata': {}}}]},
+            res_data[1]['usage'])
+
+    def test_post_identical_quotes_priced_once(self):
+        other_volume = dict(self.VOLUME, qty=10)
+        self.assertEqual(
+            _prices('11', '11', '10'),
+            self._post([self.INSTANCE, self.VOLUME],
+                       [other_volume, self.INSTANCE],
+                       [self.VOLUME]))
+        self.assertEqual(
+            2, len(self.client.call.call_args[1]['res_data']))
+
+    def test_post_prices_not_rounded(self):
+        volume = dict(self.VOLUME, qty='0.1000000000000000055511')
+        prices = self._post([volume], [volume, volume])['prices']
+        self.assertEqual(_prices('0.1000000000000000055511',
+                                 '0.2000000000000000111022'),
+                         {'prices': prices})
+        for price in prices:
+            self.assertIsInstance(price, decimal.Decimal)
+
+    def test_post_cached_prices(self):
+        self._post([self.INSTANCE], [self.VOLUME])
+        self.assertEqual(
+            _prices('10', '1'),
+            self._post([self.VOLUME], [self.INSTANCE]))
+        self.client.call.assert_called_once()
+
+        self._post([self.VOLUME], [self.VOLUME, self.VOLUME])
+        self.assertEqual(2, self.client.call.call_count)
+        self.assertEqual(
+            1, len(self.client.call.call_args[1]['res_data']))
+
+    def test_post_cache_invalidated_on_rules_change(self):
+        self._post([self.INSTANCE])
+        self.module_db.bump_rules_version('hashmap')
+        self._post([self.INSTANCE])
+        self.module_db.set_state('pyscripts', True)
+        self._post([self.INSTANCE])
+        self.module_db.set_priority('hashmap', 2)
+        self._post([self.INSTANCE])
+        self.assertEqual(4, self.client.call.call_count)
+
+    def test_post_cache_expired(self):
+        self.conf.set_override('quote_cache_ttl', 0, 'api')
+        self._post([self.INSTANCE])
+        with mock.patch.object(quote.time, 'monotonic', return_value=1e12):
+            self._post([self.INSTANCE])
+        self.assertEqual(2, self.client.call.call_count)
+
+    def test_post_cache_disabled(self):
+        self.conf.set_override('quote_cache_size', 0, 'api')
+        for _ in range(3):
+            self._post([self.INSTANCE])
+        self.assertEqual(3, self.client.call.call_count)
+
+    def test_cache_lru(self):
+        self.conf.set_override('quote_cache_size', 2, 'api')
+        cache = quote.QuoteCache()
+        cache.set('a', '1')
+        cache.set('b', '2')
+        self.assertEqual('1', cache.get('a'))
+        cache.set('c', '3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('1', cache.get('a'))
+        self.assertEqual('3', cache.get('c'))
@@ -13,6 +13,7 @@
 #    under the License.
 #
 from decimal import Decimal
+import functools
 from unittest import mock
 
 from cloudkitty.collector import aetos
@@ -78,6 +79,7 @@ class AetosCollectorTest(tests.TestCase):
         self.addCleanup(self.mock_aetos_client_patch.stop)
 
         self.collector = aetos.AetosCollector(**args)
+        self._collector_args = args
 
     def test_init(self):
         """Test AetosCollector initialization."""
@@ -93,6 +95,20 @@ class AetosCollectorTest(tests.TestCase):
         # Verify AetosClient was instantiated
         self.assertTrue(self.mock_aetos_client.called)
 
+    def test_init_session_pool(self):
+        session = self.mock_session.call_args[1]['session']
+        for adapter in session.adapters.values():
+            self.assertEqual(self.conf.orchestrator.max_threads,
+                             adapter._pool_maxsize)
+        self.assertEqual('gzip', session.headers['Accept-Encoding'])
+
+    def test_init_session_no_compression(self):
+        self.conf.set_override(
+            'response_compression', False, 'collector_aetos')
+        aetos.AetosCollector(**self._collector_args)
+        session = self.mock_session.call_args[1]['session']
+        self.assertEqual('identity', session.headers['Accept-Encoding'])
+
     def test_fetch_all_build_query(self):
         """Test that fetch_all builds correct query."""
         query = (
@@ -101,12 +117,9 @@ class AetosCollectorTest(tests.TestCase):
             ')) by (foo, bar, project_id, code, instance)'
         )
 
-        # Mock the _conn.get_instant method
+        # Mock the _conn.iter_instant method
         mock_client_instance = self.mock_aetos_client.return_value
-        mock_client_instance.get_instant.return_value = {
-            'status': 'success',
-            'data': {'result': []}
-        }
+        mock_client_instance.iter_instant.return_value = iter([])
 
         # Call fetch_all
         self.collector.fetch_all(
@@ -116,8 +129,8 @@ class AetosCollectorTest(tests.TestCase):
             self._tenant_id,
         )
 
-        # Verify get_instant was called with correct query
-        mock_client_instance.get_instant.assert_called_once_with(
+        # Verify iter_instant was called with correct query
+        mock_client_instance.iter_instant.assert_called_once_with(
             query,
             samples.FIRST_PERIOD_END.isoformat(),
         )
@@ -146,13 +159,17 @@ class AetosCollectorTest(tests.TestCase):
 
     def test_fetch_all_with_error_response(self):
         """Test that fetch_all raises CollectError on Prometheus error."""
-        # Mock the _conn.get_instant to return error response
+        # Mock the _conn.get_instant to return error response, the status
+        # is checked by the base client class
         mock_client_instance = self.mock_aetos_client.return_value
         mock_client_instance.get_instant.return_value = {
             'status': 'error',
             'errorType': 'bad_data',
             'error': 'invalid PromQL'
         }
+        mock_client_instance.iter_instant.side_effect = functools.partial(
+            prometheus_client_base.PrometheusClientBase.iter_instant,
+            mock_client_instance)
 
         # Verify CollectError is raised
         self.assertRaises(
@@ -164,11 +181,31 @@ class AetosCollectorTest(tests.TestCase):
             self._tenant_id,
         )
 
+    def test_fetch_all_with_scalar_response(self):
+        """Test that fetch_all raises CollectError on a scalar result."""
+        mock_client_instance = self.mock_aetos_client.return_value
+        mock_client_instance.get_instant.return_value = {
+            'status': 'success',
+            'data': {'resultType': 'scalar', 'result': [1546300800, '1']},
+        }
+        mock_client_instance.iter_instant.side_effect = functools.partial(
+            prometheus_client_base.PrometheusClientBase.iter_instant,
+            mock_client_instance)
+
+        self.assertRaises(
+            exceptions.CollectError,
+            self.collector.fetch_all,
+            'http_requests_total',
+            samples.FIRST_PERIOD_BEGIN,
+            samples.FIRST_PERIOD_END,
+            self._tenant_id,
+        )
+
     def test_fetch_all_with_client_exception(self):
         """Test that fetch_all raises CollectError on client exception."""
-        # Mock the _conn.get_instant to raise PrometheusResponseError
+        # Mock the _conn.iter_instant to raise PrometheusResponseError
         mock_client_instance = self.mock_aetos_client.return_value
-        mock_client_instance.get_instant.side_effect = \
+        mock_client_instance.iter_instant.side_effect = \
             prometheus_client_base.PrometheusResponseError(
                 'Connection failed'
             )
@@ -187,10 +224,7 @@ class AetosCollectorTest(tests.TestCase):
         """Test that fetch_all returns empty list for empty result."""
         # Mock empty result
         mock_client_instance = self.mock_aetos_client.return_value
-        mock_client_instance.get_instant.return_value = {
-            'status': 'success',
-            'data': {'result': []}
-        }
+        mock_client_instance.iter_instant.return_value = iter([])
 
         result = self.collector.fetch_all(
             'http_requests_total',
@@ -13,14 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import copy
 import datetime
 from unittest import mock
 
 from dateutil import tz
 
 from cloudkitty.collector import gnocchi
+from cloudkitty import dataframe
 from cloudkitty import tests
 from cloudkitty.tests import samples
+from cloudkitty.utils import tz as tzutils
 
 
 class GnocchiCollectorTest(tests.TestCase):
@@ -95,6 +98,227 @@ class GnocchiCollectorTest(tests.TestCase):
                     q_filter=None,
                 )
 
+    def test_fetch_all_scopes(self):
+        points = [
+            dataframe.DataPoint('instance', 1, 0, {'project_id': 'a'}, {}),
+            dataframe.DataPoint('instance', 2, 0, {'project_id': 'b'}, {}),
+            dataframe.DataPoint('instance', 3, 0, {'project_id': 'a'}, {}),
+            dataframe.DataPoint('instance', 4, 0, {'project_id': 'c'}, {}),
+        ]
+
+        with mock.patch.object(self.collector, 'fetch_all',
+                               return_value=points) as fetch_all_mock:
+            actual = self.collector.fetch_all_scopes(
+                'image.size',
+                samples.FIRST_PERIOD_BEGIN,
+                samples.FIRST_PERIOD_END,
+                scope_ids=['a', 'b'],
+            )
+
+        fetch_all_mock.assert_called_once_with(
+            'image.size', samples.FIRST_PERIOD_BEGIN,
+            samples.FIRST_PERIOD_END, project_id=None, q_filter=None)
+        self.assertEqual({'a': [points[0], points[2]], 'b': [points[1]]},
+                         actual)
+
+    def test_fetch_all_periods(self):
+        start = tzutils.dt_from_ts(samples.INITIAL_TIMESTAMP)
+        second = tzutils.add_delta(start, datetime.timedelta(hours=1))
+        end = tzutils.add_delta(start, datetime.timedelta(hours=3))
+        data = [{
+            'group': {'id': 'id-1', 'project_id': samples.TENANT},
+            'measures': {'measures': {'aggregated': [
+                [start.isoformat(), 3600.0, 1048576],
+                [second.isoformat(), 3600.0, 2097152],
+            ]}},
+        }]
+        resources = {'id-1': {'container_format': 'bare',
+                              'disk_format': 'qcow2'}}
+
+        with mock.patch.object(self.collector, '_fetch_metric',
+                               return_value=data) as fetch_metric_mock, \
+                mock.patch.object(self.collector, '_fetch_resources',
+                                  return_value=resources):
+            actual = self.collector.fetch_all_periods(
+                'image.size', start, end, samples.TENANT)
+
+        fetch_metric_mock.assert_called_once_with(
+            'image.size', start, end, project_id=samples.TENANT,
+            q_filter=None)
+        self.assertEqual([start, second], sorted(actual.keys()))
+        self.assertEqual(1, actual[start][0].qty)
+        self.assertEqual(2, actual[second][0].qty)
+        self.assertEqual('qcow2', actual[second][0].metadata['disk_format'])
+
+    def test_fetch_all_periods_resource_not_found(self):
+        start = tzutils.dt_from_ts(samples.INITIAL_TIMESTAMP)
+        second = tzutils.add_delta(start, datetime.timedelta(hours=1))
+        end = tzutils.add_delta(start, datetime.timedelta(hours=2))
+        data = [{
+            'group': {'id': resource_id, 'project_id': samples.TENANT},
+            'measures': {'measures': {'aggregated': [
+                [start.isoformat(), 3600.0, 1048576],
+                [second.isoformat(), 3600.0, 2097152],
+            ]}},
+        } for resource_id in ('id-1', 'id-2')]
+        resources = {'id-2': {'container_format': 'bare',
+                              'disk_format': 'qcow2'}}
+
+        with mock.patch.object(self.collector, '_fetch_metric',
+                               return_value=data), \
+                mock.patch.object(self.collector, '_fetch_resources',
+                                  return_value=resources), \
+                mock.patch.object(gnocchi.LOG, 'warning') as warning_mock:
+            actual = self.collector.fetch_all_periods(
+                'image.size', start, end, samples.TENANT)
+
+        self.assertEqual(2, warning_mock.call_count)
+        for period_start in (start, second):
+            self.assertEqual(
+                ['id-2'],
+                [point.groupby['id'] for point in actual[period_start]])
+
+    def test_fetch_all_periods_other_granularity(self):
+        start = tzutils.dt_from_ts(samples.INITIAL_TIMESTAMP)
+        end = tzutils.add_delta(start, datetime.timedelta(hours=2))
+        self.collector.conf['image.size']['extra_args'][
+            'force_granularity'] = 300
+
+        with mock.patch.object(self.collector, 'fetch_all',
+                               side_effect=[['point'], []]) as fetch_all_mock:
+            actual = self.collector.fetch_all_periods(
+                'image.size', start, end, samples.TENANT)
+
+        second = tzutils.add_delta(start, datetime.timedelta(hours=1))
+        fetch_all_mock.assert_has_calls([
+            mock.call('image.size', start, second, samples.TENANT,
+                      q_filter=None),
+            mock.call('image.size', second, end, samples.TENANT,
+                      q_filter=None),
+        ])
+        self.assertEqual({start: ['point']}, actual)
+
+    def _mock_gnocchi(self, *pages):
+        """Mocks the Gnocchi client, each search returns the next page."""
+        pages = list(pages)
+        self.search_queries = []
+
+        def search(resource_type, query, sorts, marker):
+            self.search_queries.append(query)
+            if marker is None and pages:
+                return pages.pop(0)
+            return []
+
+        conn = mock.Mock()
+        conn.aggregates.fetch.return_value = []
+        conn.resource.search.side_effect = search
+        self.collector._conn = conn
+        self.collector.conf['vcpus'] = copy.deepcopy(
+            self.collector.conf['cpu@#instance'])
+        return conn
+
+    def _collect_cycle(self, start):
+        end = start + datetime.timedelta(seconds=3600)
+        for metric_name in ('cpu@#instance', 'vcpus'):
+            self.collector.fetch_all(metric_name, start, end, samples.TENANT)
+        return self._conn_calls()
+
+    def _conn_calls(self):
+        conn = self.collector._conn
+        calls = (conn.aggregates.fetch.call_count,
+                 conn.resource.search.call_count)
+        conn.reset_mock()
+        return calls
+
+    def test_fetch_resources_cached_across_metrics_and_cycles(self):
+        self._mock_gnocchi(
+            [{'id': 'id-1', 'flavor': 'm1.tiny', 'ended_at': None}])
+
+        self.assertEqual((2, 2), self._collect_cycle(
+            samples.FIRST_PERIOD_BEGIN))
+        self.assertEqual((2, 1), self._collect_cycle(
+            samples.SECOND_PERIOD_BEGIN))
+        query = self.search_queries[-1]
+        self.assertIn({'or': [
+            {'>=': {'revision_start': mock.ANY}},
+            {'>=': {'ended_at': mock.ANY}},
+        ]}, query['and'])
+        self.assertIn({'=': {'project_id': samples.TENANT}}, query['and'])
+        self.assertEqual((2, 0), self._collect_cycle(
+            samples.SECOND_PERIOD_BEGIN))
+
+    def test_fetch_resources_cached_for_many_scopes(self):
+        self._mock_gnocchi()
+        scopes = ['scope-{}'.format(i) for i in range(300)]
+        for start in (samples.FIRST_PERIOD_BEGIN,
+                      samples.SECOND_PERIOD_BEGIN):
+            end = start + datetime.timedelta(seconds=3600)
+            for scope in scopes:
+                for metric_name in ('cpu@#instance', 'vcpus'):
+                    self.collector.fetch_all(metric_name, start, end, scope)
+        self.assertEqual(600, len(self.search_queries))
+        # Only the resources modified since the first cycle are queried
+        for query in self.search_queries[300:]:
+            self.assertIn('revision_start', str(query))
+
+    def test_fetch_resources_cache_disabled(self):
+        self.conf.set_override(
+            'resource_cache_size', 0, 'collector_gnocchi')
+        self._mock_gnocchi()
+
+        self.assertEqual((2, 2), self._collect_cycle(
+            samples.FIRST_PERIOD_BEGIN))
+        self.assertEqual((2, 2), self._collect_cycle(
+            samples.SECOND_PERIOD_BEGIN))
+
+    def test_fetch_resources_incremental_refresh(self):
+        self._mock_gnocchi(
+            [{'id': 'id-1', 'flavor': 'm1.tiny', 'ended_at': None},
+             {'id': 'id-2', 'flavor': 'm1.tiny', 'ended_at': None}],
+            [{'id': 'id-1', 'flavor': 'm1.small', 'ended_at': None},
+             {'id': 'id-2', 'flavor': 'm1.tiny',
+              'ended_at': '2014-12-31T00:00:00+00:00'},
+             {'id': 'id-3', 'flavor': 'm1.tiny', 'ended_at': None}])
+
+        self.collector._fetch_resources(
+            'cpu@#instance', samples.FIRST_PERIOD_BEGIN,
+            samples.FIRST_PERIOD_END)
+        resources = self.collector._fetch_resources(
+            'vcpus', samples.SECOND_PERIOD_BEGIN,
+            samples.SECOND_PERIOD_END)
+
+        self.assertEqual(['id-1', 'id-3'], sorted(resources))
+        self.assertEqual('m1.small', resources['id-1']['flavor'])
+
+    def test_fetch_resources_full_refresh(self):
+        self._mock_gnocchi()
+        for start in (samples.SECOND_PERIOD_BEGIN,
+                      samples.FIRST_PERIOD_BEGIN):
+            end = start + datetime.timedelta(seconds=3600)
+            self.collector._fetch_resources('cpu@#instance', start, end)
+            self.assertNotIn('revision_start', str(self.search_queries[-1]))
+
+        self.conf.set_override(
+            'resource_cache_refresh_period', 3600, 'collector_gnocchi')
+        later = tzutils.add_delta(tzutils.localized_now(),
+                                  datetime.timedelta(hours=1))
+        with mock.patch.object(tzutils, 'localized_now', return_value=later):
+            self.collector._fetch_resources(
+                'cpu@#instance', samples.SECOND_PERIOD_BEGIN,
+                samples.SECOND_PERIOD_END)
+        self.assertNotIn('revision_start', str(self.search_queries[-1]))
+        self.assertEqual((0, 3), self._conn_calls())
+
+    def test_resource_cache_lru(self):
+        self.conf.set_override('resource_cache_size', 2, 'collector_gnocchi')
+        cache = gnocchi.ResourceCache()
+        first = cache.get(('instance', 'a', 'null'))
+        cache.get(('instance', 'b', 'null'))
+        self.assertIs(first, cache.get(('instance', 'a', 'null')))
+        cache.get(('instance', 'c', 'null'))
+        self.assertIs(first, cache.get(('instance', 'a', 'null')))
+        self.assertIsNot(first, cache.get(('instance', 'b', 'null')))
+
     def test_generate_two_fields_filter_different_operations(self):
         actual = self.collector.gen_filter(
             cop='>=',
@@ -13,7 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import datetime
 from decimal import Decimal
+import json
 from unittest import mock
 
 from cloudkitty import collector
@@ -23,6 +25,7 @@ from cloudkitty.common.prometheus_client_base import PrometheusResponseError
 from cloudkitty import dataframe
 from cloudkitty import tests
 from cloudkitty.tests import samples
+from cloudkitty.utils import tz as tzutils
 
 
 class PrometheusCollectorTest(tests.TestCase):
@@ -122,6 +125,7 @@ class PrometheusCollectorTest(tests.TestCase):
             }
         }
         self.collector_mandatory = prometheus.PrometheusCollector(**args)
+        self._collector_args = args
         self.collector_without_range_function = prometheus.PrometheusCollector(
             **args_range_function)
         self.collector_without_query_function = prometheus.PrometheusCollector(
@@ -136,7 +140,7 @@ class PrometheusCollectorTest(tests.TestCase):
         )
 
         with mock.patch.object(
-            prometheus.prometheus_client.PrometheusClient, 'get_instant',
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
         ) as mock_get:
             self.collector_mandatory.fetch_all(
                 'http_requests_total',
@@ -157,7 +161,7 @@ class PrometheusCollectorTest(tests.TestCase):
         )
 
         with mock.patch.object(
-            prometheus.prometheus_client.PrometheusClient, 'get_instant',
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
         ) as mock_get:
             self.collector_without_range_function.fetch_all(
                 'http_requests_total',
@@ -178,7 +182,7 @@ class PrometheusCollectorTest(tests.TestCase):
         )
 
         with mock.patch.object(
-            prometheus.prometheus_client.PrometheusClient, 'get_instant',
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
         ) as mock_get:
             self.collector_without_query_function.fetch_all(
                 'http_requests_total',
@@ -199,7 +203,7 @@ class PrometheusCollectorTest(tests.TestCase):
         )
 
         with mock.patch.object(
-            prometheus.prometheus_client.PrometheusClient, 'get_instant',
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
         ) as mock_get:
             self.collector_all.fetch_all(
                 'http_requests_total',
@@ -212,6 +216,25 @@ class PrometheusCollectorTest(tests.TestCase):
                 samples.FIRST_PERIOD_END.isoformat(),
             )
 
+    def test_fetch_all_scopes_build_query_without_scope(self):
+        query = (
+            'avg(avg_over_time(http_requests_total[3600s]'
+            ')) by (foo, bar, project_id, code, instance)'
+        )
+
+        with mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+        ) as mock_get:
+            self.collector_mandatory.fetch_all_scopes(
+                'http_requests_total',
+                samples.FIRST_PERIOD_BEGIN,
+                samples.FIRST_PERIOD_END,
+            )
+            mock_get.assert_called_once_with(
+                query,
+                samples.FIRST_PERIOD_END.isoformat(),
+            )
+
     def test_format_data_instant_query(self):
         expected = ({
             'code': '200',
@@ -269,9 +292,10 @@ class PrometheusCollectorTest(tests.TestCase):
                 {'code': '200', 'instance': 'localhost:9090'}),
         ]
 
-        no_response = mock.patch(
-            'cloudkitty.common.prometheus_client.PrometheusClient.get_instant',
-            return_value=samples.PROMETHEUS_RESP_INSTANT_QUERY,
+        no_response = mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+            return_value=iter(
+                samples.PROMETHEUS_RESP_INSTANT_QUERY['data']['result']),
         )
 
         with no_response:
@@ -286,10 +310,116 @@ class PrometheusCollectorTest(tests.TestCase):
         self.assertEqual(expected_name, actual_name)
         self.assertEqual(expected_data, actual_data)
 
+    def test_format_retrieve_shares_mappings(self):
+        no_response = mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+            return_value=iter(
+                samples.PROMETHEUS_RESP_INSTANT_QUERY['data']['result']),
+        )
+
+        with no_response, mock.patch.object(
+                collector, 'get_calendar_attributes',
+                wraps=collector.get_calendar_attributes) as calendar_mock:
+            collector.get_calendar_attributes.cache_clear()
+            _, data = self.collector_mandatory.retrieve(
+                metric_name='http_requests_total',
+                start=samples.FIRST_PERIOD_BEGIN,
+                end=samples.FIRST_PERIOD_END,
+                project_id=samples.TENANT,
+                q_filter=None,
+            )
+
+        self.assertEqual(2, calendar_mock.call_count)
+        self.assertEqual(1, calendar_mock.cache_info().misses)
+        self.assertIs(data[0].groupby, data[1].groupby)
+        self.assertIs(data[0].metadata, data[1].metadata)
+
+    def test_format_retrieve_all_scopes(self):
+        response = {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": [
+                    {"metric": {"project_id": "scope_a", "code": "200"},
+                     "value": [samples.FIRST_PERIOD_END, "7"]},
+                    {"metric": {"project_id": "scope_b", "code": "200"},
+                     "value": [samples.FIRST_PERIOD_END, "42"]},
+                    {"metric": {"project_id": "scope_a", "code": "500"},
+                     "value": [samples.FIRST_PERIOD_END, "1"]},
+                    {"metric": {"project_id": "scope_c", "code": "200"},
+                     "value": [samples.FIRST_PERIOD_END, "3"]},
+                ],
+            },
+        }
+
+        with mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+            return_value=iter(response['data']['result']),
+        ):
+            name, data = self.collector_mandatory.retrieve_all_scopes(
+                metric_name='http_requests_total',
+                start=samples.FIRST_PERIOD_BEGIN,
+                end=samples.FIRST_PERIOD_END,
+                scope_ids=['scope_a', 'scope_b', 'scope_d'],
+            )
+
+        self.assertEqual('http_requests_total', name)
+        self.assertEqual(['scope_a', 'scope_b'], sorted(data.keys()))
+        self.assertEqual(['7', '1'],
+                         [str(point.qty) for point in data['scope_a']])
+        self.assertEqual(['42'],
+                         [str(point.qty) for point in data['scope_b']])
+        for scope_id, points in data.items():
+            for point in points:
+                self.assertEqual(scope_id, point.groupby['project_id'])
+
+    def test_fetch_all_periods(self):
+        start = tzutils.dt_from_ts(samples.INITIAL_TIMESTAMP)
+        second = tzutils.add_delta(start, datetime.timedelta(hours=1))
+        end = tzutils.add_delta(start, datetime.timedelta(hours=3))
+        first_end_ts = samples.INITIAL_TIMESTAMP + 3600
+        response = {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": [
+                    {"metric": {"foo": "a", "code": "200"},
+                     "values": [[first_end_ts, "7"],
+                                [first_end_ts + 3600, "8"]]},
+                    {"metric": {"foo": "b", "code": "500"},
+                     "values": [[first_end_ts, "42"]]},
+                ],
+            },
+        }
+
+        with mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_range',
+            return_value=iter(response['data']['result']),
+        ) as mock_get:
+            name, data = self.collector_mandatory.retrieve_periods(
+                'http_requests_total', start, end, self._tenant_id)
+
+        mock_get.assert_called_once_with(
+            'avg(avg_over_time(http_requests_total'
+            '{project_id="f266f30b11f246b589fd266f85eeec39"}[3600s]'
+            ')) by (foo, bar, project_id, code, instance)',
+            tzutils.add_delta(start, datetime.timedelta(hours=1)).isoformat(),
+            end.isoformat(),
+            '3600s',
+        )
+        self.assertEqual('http_requests_total', name)
+        self.assertEqual([start, second], sorted(data.keys()))
+        self.assertEqual([Decimal('7'), Decimal('42')],
+                         [point.qty for point in data[start]])
+        self.assertEqual([Decimal('8')],
+                         [point.qty for point in data[second]])
+        self.assertEqual('a', data[second][0].groupby['foo'])
+
     def test_format_retrieve_raise_NoDataCollected(self):
-        no_response = mock.patch(
-            'cloudkitty.common.prometheus_client.PrometheusClient.get_instant',
-            return_value=samples.PROMETHEUS_EMPTY_RESP_INSTANT_QUERY,
+        no_response = mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+            return_value=iter(
+                samples.PROMETHEUS_EMPTY_RESP_INSTANT_QUERY['data']['result']),
         )
 
         with no_response:
@@ -304,8 +434,8 @@ class PrometheusCollectorTest(tests.TestCase):
             )
 
     def test_format_retrieve_all_raises_exception(self):
-        invalid_response = mock.patch(
-            'cloudkitty.common.prometheus_client.PrometheusClient.get_instant',
+        invalid_response = mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
             side_effect=PrometheusResponseError,
         )
 
@@ -319,3 +449,137 @@ class PrometheusCollectorTest(tests.TestCase):
                 project_id=samples.TENANT,
                 q_filter=None,
             )
+
+    def test_client_session(self):
+        client = self.collector_mandatory._conn
+        for adapter in client._session.adapters.values():
+            self.assertEqual(self.conf.orchestrator.max_threads,
+                             adapter._pool_maxsize)
+        self.assertEqual('gzip', client._session.headers['Accept-Encoding'])
+
+        res = mock.Mock()
+        res.json.return_value = {'status': 'success'}
+        with mock.patch.object(client._session, 'get',
+                               return_value=res) as get_mock:
+            for _ in range(2):
+                client.get_instant('up', time='2019-01-01T00:00:00')
+        self.assertEqual(2, get_mock.call_count)
+        get_mock.assert_called_with(
+            '{}/query'.format(client.url),
+            params={'query': 'up', 'time': '2019-01-01T00:00:00',
+                    'timeout': None},
+            auth=None,
+            verify=True,
+            timeout=60,
+            stream=False,
+        )
+
+    def _mock_streamed_response(self, body, chunk_size=7):
+        res = mock.Mock(url='http://localhost:9090/api/v1/query')
+        body = json.dumps(body, default=str).encode()
+        res.iter_content.return_value = iter(
+            [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)])
+        return res
+
+    def test_client_iter_instant(self):
+        client = self.collector_mandatory._conn
+        body = json.loads(json.dumps(
+            samples.PROMETHEUS_RESP_INSTANT_QUERY, default=str))
+        res = self._mock_streamed_response(body)
+        with mock.patch.object(client._session, 'get',
+                               return_value=res) as get_mock:
+            items = list(client.iter_instant('up'))
+
+        self.assertEqual(body['data']['result'], items)
+        self.assertTrue(get_mock.call_args[1]['stream'])
+        res.close.assert_called_once_with()
+
+    def test_client_iter_instant_empty_result(self):
+        client = self.collector_mandatory._conn
+        res = self._mock_streamed_response(
+            samples.PROMETHEUS_EMPTY_RESP_INSTANT_QUERY)
+        with mock.patch.object(client._session, 'get', return_value=res):
+            self.assertEqual([], list(client.iter_instant('up')))
+
+    def test_client_iter_instant_error_status(self):
+        client = self.collector_mandatory._conn
+        res = self._mock_streamed_response({
+            'status': 'error',
+            'errorType': 'bad_data',
+            'error': 'invalid PromQL',
+        })
+        with mock.patch.object(client._session, 'get', return_value=res):
+            self.assertRaisesRegex(
+                PrometheusResponseError, 'bad_data: invalid PromQL',
+                list, client.iter_instant('up'))
+        res.close.assert_called_once_with()
+
+    def test_client_iter_instant_unsupported_result_type(self):
+        client = self.collector_mandatory._conn
+        for result_type, result in (('scalar', [1546300800, '1']),
+                                    ('string', [1546300800, 'up'])):
+            for data in ({'resultType': result_type, 'result': result},
+                         {'result': result, 'resultType': result_type}):
+                res = self._mock_streamed_response(
+                    {'status': 'success', 'data': data})
+                with mock.patch.object(client._session, 'get',
+                                       return_value=res):
+                    self.assertRaises(PrometheusResponseError,
+                                      list, client.iter_instant('up'))
+
+    def test_client_iter_instant_result_type_after_result(self):
+        client = self.collector_mandatory._conn
+        result = samples.PROMETHEUS_RESP_INSTANT_QUERY['data']['result']
+        body = json.loads(json.dumps(result, default=str))
+        for result_type, raised in (('vector', False), ('scalar', True)):
+            res = self._mock_streamed_response({
+                'status': 'success',
+                'data': {'result': body, 'resultType': result_type}})
+            with mock.patch.object(client._session, 'get', return_value=res):
+                if raised:
+                    self.assertRaises(PrometheusResponseError,
+                                      list, client.iter_instant('up'))
+                else:
+                    self.assertEqual(body, list(client.iter_instant('up')))
+
+    def test_client_iter_instant_truncated_response(self):
+        client = self.collector_mandatory._conn
+        res = self._mock_streamed_response(
+            samples.PROMETHEUS_RESP_INSTANT_QUERY)
+        res.iter_content.return_value = list(
+            res.iter_content.return_value)[:-5]
+        with mock.patch.object(client._session, 'get', return_value=res):
+            self.assertRaises(PrometheusResponseError,
+                              list, client.iter_instant('up'))
+
+    def test_fetch_all_converts_quantities_in_batches(self):
+        result = [{'metric': {'code': str(i)},
+                   'value': [samples.FIRST_PERIOD_END, str(i)]}
+                  for i in range(5)]
+        self.collector_mandatory.CONVERT_BATCH_SIZE = 2
+        with mock.patch.object(
+            prometheus.prometheus_client.PrometheusClient, 'iter_instant',
+            return_value=iter(result),
+        ), mock.patch.object(
+            self.collector_mandatory, '_convert_quantities',
+            wraps=self.collector_mandatory._convert_quantities,
+        ) as convert_mock:
+            points = self.collector_mandatory.fetch_all(
+                'http_requests_total',
+                samples.FIRST_PERIOD_BEGIN,
+                samples.FIRST_PERIOD_END,
+                self._tenant_id,
+            )
+
+        self.assertEqual(3, convert_mock.call_count)
+        self.assertEqual([Decimal(i) for i in range(5)],
+                         [point.qty for point in points])
+        self.assertEqual([str(i) for i in range(5)],
+                         [point.metadata['code'] for point in points])
+
+    def test_client_session_no_compression(self):
+        self.conf.set_override(
+            'response_compression', False, 'collector_prometheus')
+        collector = prometheus.PrometheusCollector(**self._collector_args)
+        self.assertEqual('identity',
+                         collector._conn._session.headers['Accept-Encoding'])
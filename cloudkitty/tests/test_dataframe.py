@@ -132,6 +132,31 @@ class TestDataPoint(unittest.TestCase):
         }
         self.assertRaises(ValueError, dataframe.DataPoint.from_dict, invalid)
 
+    def test_from_dict_trusted(self):
+        dict_ = {
+            "vol": {"unit": "amazing_unit", "qty": 0.1},
+            "rating": {"price": decimal.Decimal('1.10')},
+            "groupby": {"g_one": "one"},
+            "metadata": {"m_one": "one"},
+        }
+        self.assertEqual(
+            dataframe.DataPoint.from_dict(copy.deepcopy(dict_)),
+            dataframe.DataPoint.from_dict(dict_, validate=False))
+
+    def test_from_dict_trusted_legacy_without_rating(self):
+        point = dataframe.DataPoint.from_dict({
+            "vol": {"unit": "amazing_unit", "qty": 3},
+            "desc": {"g_one": "one"},
+        }, legacy=True, validate=False)
+        self.assertEqual(decimal.Decimal(0), point.price)
+        self.assertEqual({"g_one": "one"}, point.groupby)
+        self.assertEqual({}, point.metadata)
+
+    def test_from_dict_trusted_invalid(self):
+        self.assertRaises(ValueError, dataframe.DataPoint.from_dict,
+                          {"vol": {}, "groupby": {}, "metadata": {}},
+                          validate=False)
+
     def test_set_price(self):
         point = dataframe.DataPoint(**self.default_params)
         self.assertEqual(point.price, decimal.Decimal(0))
@@ -151,6 +176,45 @@ class TestDataPoint(unittest.TestCase):
         })
 
 
+class TestMappingInterner(unittest.TestCase):
+
+    def test_intern_equal_mappings(self):
+        interner = dataframe.MappingInterner()
+        first = interner.intern({'a': 'x', 'b': 'y'})
+        second = interner.intern({'a': 'x', 'b': 'y'})
+        other = interner.intern({'a': 'x', 'b': 'z'})
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertIsInstance(first, datastructures.ImmutableDict)
+        self.assertEqual({'a': 'x', 'b': 'z'}, other)
+        self.assertEqual(2, len(interner))
+
+    def test_intern_types_are_not_merged(self):
+        interner = dataframe.MappingInterner()
+        self.assertIs(interner.intern({'a': True})['a'], True)
+        self.assertIs(int, type(interner.intern({'a': 1})['a']))
+
+    def test_intern_empty_and_unhashable(self):
+        interner = dataframe.MappingInterner()
+        self.assertIs(interner.intern(None), interner.intern({}))
+        unhashable = interner.intern({'a': ['x']})
+        self.assertEqual({'a': ['x']}, unhashable)
+        self.assertIsNot(unhashable, interner.intern({'a': ['x']}))
+
+    def test_intern_maxsize(self):
+        interner = dataframe.MappingInterner(maxsize=2)
+        for i in range(3):
+            interner.intern({'a': i})
+        self.assertEqual(1, len(interner))
+
+    def test_datapoint_keeps_immutable_dicts(self):
+        mapping = dataframe.MappingInterner().intern({'a': 'x'})
+        point = dataframe.DataPoint('unit', 1, 0, mapping, mapping)
+        self.assertIs(mapping, point.groupby)
+        self.assertIs(mapping, point.metadata)
+
+
 class TestDataFrame(unittest.TestCase):
 
     def test_dataframe_add_points(self):
@@ -250,6 +314,28 @@ class TestDataFrame(unittest.TestCase):
         self.assertRaises(
             ValueError, dataframe.DataFrame.from_dict, {'usage': None})
 
+    def test_from_dict_trusted(self):
+        start = datetime.datetime(2019, 1, 2, 12, tzinfo=tz.tzutc())
+        end = datetime.datetime(2019, 1, 2, 13, tzinfo=tz.tzutc())
+        point = dataframe.DataPoint(
+            'unit', '0.5', 2, {'g_one': 'one'}, {'m_two': 'two'})
+        usage = {'metric_x': [point]}
+        for begin_, end_ in ((start, end),
+                             (start.isoformat(), end.isoformat())):
+            dict_usage = {'metric_x': [point.as_dict(mutable=True)]}
+            self.assertEqual(
+                dataframe.DataFrame(start, end, usage).as_dict(),
+                dataframe.DataFrame.from_dict({
+                    'period': {'begin': begin_, 'end': end_},
+                    'usage': dict_usage,
+                }, validate=False).as_dict(),
+            )
+
+    def test_from_dict_trusted_invalid_dict(self):
+        self.assertRaises(
+            ValueError, dataframe.DataFrame.from_dict, {'usage': None},
+            validate=False)
+
     def test_repr(self):
         start = datetime.datetime(2019, 3, 4, 1, tzinfo=tz.tzutc())
         end = datetime.datetime(2019, 3, 4, 2, tzinfo=tz.tzutc())
@@ -272,3 +358,51 @@ class TestDataFrame(unittest.TestCase):
             ('metric_x', dataframe.DataPoint(**TestDataPoint.default_params))
             for _ in range(4)]
         self.assertEqual(list(df.iterpoints()), expected)
+
+    def test_copy_shares_points(self):
+        start = datetime.datetime(2019, 3, 4, 1, tzinfo=tz.tzutc())
+        end = datetime.datetime(2019, 3, 4, 2, tzinfo=tz.tzutc())
+        df = dataframe.DataFrame(start=start, end=end)
+        points = [dataframe.DataPoint(**TestDataPoint.default_params)
+                  for _ in range(4)]
+        df.add_points(points, 'metric_x')
+
+        copy_ = df.copy()
+        self.assertEqual(df.as_dict(), copy_.as_dict())
+        for (_, orig), (_, copied) in zip(df.iterpoints(),
+                                          copy_.iterpoints()):
+            self.assertIs(orig, copied)
+
+    def test_copy_on_write(self):
+        start = datetime.datetime(2019, 3, 4, 1, tzinfo=tz.tzutc())
+        end = datetime.datetime(2019, 3, 4, 2, tzinfo=tz.tzutc())
+        df = dataframe.DataFrame(start=start, end=end)
+        point = dataframe.DataPoint(**TestDataPoint.default_params)
+        df.add_points([point, point], 'metric_x')
+
+        copy_ = df.copy()
+        copy_.add_point(point, 'metric_x')
+        copy_.add_point(point, 'metric_y')
+        df.add_points([point, point], 'metric_x')
+
+        self.assertEqual(3, len(list(copy_.itertypes())[0][1]))
+        self.assertEqual(4, len(list(df.itertypes())[0][1]))
+        self.assertEqual(str(df), "DataFrame(metrics=[metric_x])")
+        self.assertEqual(str(copy_), "DataFrame(metrics=[metric_x,metric_y])")
+
+    def test_replace_points_and_drop_type(self):
+        start = datetime.datetime(2019, 3, 4, 1, tzinfo=tz.tzutc())
+        end = datetime.datetime(2019, 3, 4, 2, tzinfo=tz.tzutc())
+        df = dataframe.DataFrame(start=start, end=end)
+        point = dataframe.DataPoint(**TestDataPoint.default_params)
+        df.add_points([point, point], 'metric_x')
+        df.add_points([point], 'metric_y')
+        copy_ = df.copy()
+
+        df.replace_points([point], 'metric_x')
+        df.add_point(point, 'metric_x')
+        df.drop_type('metric_y')
+        df.drop_type('metric_z')
+
+        self.assertEqual([('metric_x', point)] * 2, list(df.iterpoints()))
+        self.assertEqual(3, len(list(copy_.iterpoints())))
@@ -16,11 +16,14 @@
 import copy
 import datetime
 import decimal
+import random
 from unittest import mock
 
 from oslo_utils import uuidutils
+import sqlalchemy
 
 from cloudkitty import dataframe
+from cloudkitty import db
 from cloudkitty.rating import hash
 from cloudkitty.rating.hash.db import api
 from cloudkitty import tests
@@ -105,6 +108,9 @@ class HashMapRatingTest(tests.TestCase):
         self._tenant_id = 'f266f30b11f246b589fd266f85eeec39'
         self._db_api = hash.HashMap.db_api
         self._db_api.get_migration().upgrade('head')
+        # NOTE: Each test has its own database, where the rules version
+        # starts again from 0.
+        hash.HashMap.global_rules.clear()
         self._hash = hash.HashMap(self._tenant_id)
 
     # Group tests
@@ -475,6 +481,50 @@ class HashMapRatingTest(tests.TestCase):
         mappings = self._db_api.list_mappings(field_uuid=field_db.field_id)
         self.assertEqual([], mappings)
 
+    def test_writes_bump_rules_version(self):
+        self.assertEqual(0, self._hash.rules_version)
+        service_db = self._db_api.create_service('compute')
+        field_db = self._db_api.create_field(service_db.service_id,
+                                             'flavor')
+        mapping_db = self._db_api.create_mapping(
+            name=uuidutils.generate_uuid(False),
+            created_by='1',
+            value='m1.tiny',
+            cost='1.337',
+            map_type='flat',
+            field_id=field_db.field_id)
+        self._db_api.update_mapping(mapping_db.mapping_id, cost='2')
+        self._db_api.delete_mapping(mapping_db.mapping_id)
+        self.assertEqual(5, self._hash.rules_version)
+        # Reads and failed writes don't change the version
+        self._db_api.list_mappings(field_uuid=field_db.field_id)
+        self.assertRaises(api.ServiceAlreadyExists,
+                          self._db_api.create_service,
+                          'compute')
+        self.assertEqual(5, self._hash.rules_version)
+
+    def test_get_validity_boundaries(self):
+        service_db = self._db_api.create_service('compute')
+        dates = [datetime.datetime(2019, 1, day) for day in (1, 10, 20)]
+        self._db_api.create_mapping(
+            name='mapping1',
+            created_by='1',
+            cost='1',
+            map_type='flat',
+            service_id=service_db.service_id,
+            start=dates[1],
+            end=dates[2])
+        deleted_db = self._db_api.create_mapping(
+            name='mapping2',
+            created_by='1',
+            cost='1',
+            map_type='flat',
+            service_id=service_db.service_id,
+            tenant_id=self._tenant_id,
+            start=dates[0])
+        self._db_api.delete_mapping(deleted_db.mapping_id)
+        self.assertEqual(dates[1:], self._hash.get_validity_boundaries())
+
     def test_create_per_tenant_mapping(self):
         service_db = self._db_api.create_service('compute')
         field_db = self._db_api.create_field(
@@ -852,6 +902,133 @@ class HashMapRatingTest(tests.TestCase):
         self.assertEqual(expect,
                          self._hash._entries)
 
+    def _get_queries(self, func, *args):
+        with db.session_for_read() as session:
+            engine = session.get_bind()
+        statements = []
+
+        def _before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('SELECT'):
+                statements.append(statement)
+
+        sqlalchemy.event.listen(
+            engine, 'before_cursor_execute', _before_cursor_execute)
+        try:
+            func(*args)
+        finally:
+            sqlalchemy.event.remove(
+                engine, 'before_cursor_execute', _before_cursor_execute)
+        return statements
+
+    def test_load_rates_query_count(self):
+        self._generate_hashmap_rules()
+        base_count = len(self._get_queries(self._hash.reload_config))
+
+        service_db = self._db_api.get_service(name='compute')
+        for i in range(10):
+            field_db = self._db_api.create_field(
+                service_db.service_id, 'field{}'.format(i))
+            for j in range(20):
+                for tenant_id in (None, self._tenant_id):
+                    self._db_api.create_mapping(
+                        name=uuidutils.generate_uuid(False),
+                        created_by='1',
+                        value='value{}'.format(j),
+                        cost='1',
+                        map_type='flat',
+                        field_id=field_db.field_id,
+                        tenant_id=tenant_id)
+                self._db_api.create_threshold(
+                    level=str(j),
+                    cost='1',
+                    map_type='flat',
+                    field_id=field_db.field_id)
+        count = len(self._get_queries(self._hash.reload_config))
+
+        # The same queries, whatever the number of rules
+        self.assertEqual(base_count, count)
+        self.assertEqual(12, len(self._hash._entries['compute']['fields']))
+
+    def test_global_rules_shared(self):
+        self._generate_hashmap_rules()
+        self._hash.reload_config()
+
+        other_hash = hash.HashMap()
+        statements = self._get_queries(
+            hash.HashMap, 'other_tenant')
+        # Only the rules version and the rules of the tenant are fetched
+        self.assertEqual(3, len(statements))
+        for statement in statements:
+            self.assertNotIn('hashmap_services', statement)
+            self.assertNotIn('hashmap_fields', statement)
+
+        self.assertIs(other_hash._entries, hash.HashMap('other')._entries)
+        self.assertIs(other_hash._index, hash.HashMap('other')._index)
+        self.assertIsNot(other_hash._entries, self._hash._entries)
+        self.assertIsNot(other_hash._index, self._hash._index)
+
+    def test_tenant_overlay_does_not_modify_global_rules(self):
+        self._generate_hashmap_rules()
+        global_hash = hash.HashMap()
+        global_entries = copy.deepcopy(global_hash._entries)
+        self._hash.reload_config()
+        self.assertEqual(
+            decimal.Decimal('2'),
+            self._hash._entries['compute']['fields']['flavor']['mappings'][
+                '_DEFAULT_']['m1.tiny']['cost'])
+        self.assertEqual(
+            decimal.Decimal('1.337'),
+            round(global_hash._entries['compute']['fields']['flavor'][
+                'mappings']['_DEFAULT_']['m1.tiny']['cost'], 3))
+        self.assertEqual(global_entries, hash.HashMap()._entries)
+
+    def test_global_rules_reloaded_on_rules_change(self):
+        self._generate_hashmap_rules()
+        self._hash.reload_config()
+        self.assertNotIn('volume', hash.HashMap('other')._entries)
+        self._db_api.create_service('volume')
+        other_hash = hash.HashMap('other')
+        self.assertIn('volume', other_hash._entries)
+        self.assertIn('volume', other_hash._index)
+
+    def test_get_rating_rules(self):
+        self._generate_hashmap_rules()
+        service_db = self._db_api.get_service(name='compute')
+        self._db_api.create_mapping(
+            name=uuidutils.generate_uuid(False),
+            created_by='1',
+            cost='3',
+            map_type='flat',
+            service_id=service_db.service_id,
+            tenant_id='other_tenant')
+        self._db_api.create_mapping(
+            name=uuidutils.generate_uuid(False),
+            created_by='1',
+            cost='4',
+            map_type='flat',
+            service_id=service_db.service_id,
+            tenant_id=self._tenant_id,
+            start=datetime.datetime.now() + datetime.timedelta(days=1))
+
+        rules = self._db_api.get_rating_rules(self._tenant_id)
+        self.assertEqual([(service_db.id, 'compute')], rules['services'])
+        self.assertEqual(['flavor', 'memory'],
+                         [field.name for field in rules['fields']])
+        self.assertEqual(
+            [None, None, None, self._tenant_id],
+            [mapping.tenant_id for mapping in rules['mappings']])
+        self.assertEqual(
+            [None, None, 'test_group', None],
+            [mapping.group_name for mapping in rules['mappings']])
+        self.assertEqual(
+            [None, None, self._tenant_id],
+            [threshold.tenant_id for threshold in rules['thresholds']])
+
+        rules = self._db_api.get_rating_rules()
+        self.assertEqual(
+            [None, None, None],
+            [mapping.tenant_id for mapping in rules['mappings']])
+
     def test_load_mappings(self):
         mapping_list = []
         service_db = self._db_api.create_service('compute')
@@ -875,8 +1052,9 @@ class HashMapRatingTest(tests.TestCase):
                 map_type='rate',
                 field_id=field_db.field_id,
                 group_id=group_db.group_id))
-        mappings_uuid = [mapping.mapping_id for mapping in mapping_list]
-        result = self._hash._load_mappings(mappings_uuid)
+        rules = self._db_api.get_rating_rules()
+        self.assertEqual(len(mapping_list), len(rules['mappings']))
+        result = self._hash._load_mappings(rules['mappings'])
         expected_result = {
             '_DEFAULT_': {
                 'm1.tiny': {
@@ -901,9 +1079,9 @@ class HashMapRatingTest(tests.TestCase):
                 map_type='flat',
                 field_id=field_db.field_id,
                 group_id=group_db.group_id))
-        thresholds_uuid = [threshold.threshold_id
-                           for threshold in threshold_list]
-        result = self._hash._load_thresholds(thresholds_uuid)
+        rules = self._db_api.get_rating_rules()
+        self.assertEqual(len(threshold_list), len(rules['thresholds']))
+        result = self._hash._load_thresholds(rules['thresholds'])
         expected_result = {
             'test_group': {
                 1000: {
@@ -1289,3 +1467,295 @@ class HashMapRatingTest(tests.TestCase):
         actual_data = [self._hash.process(d) for d in expected_data]
         self.assertEqual(df_dicts, [d.as_dict(mutable=True)
                                     for d in actual_data])
+
+
+class LegacyHashMap(hash.HashMap):
+    """HashMap evaluating every rule for each point, without an index.
+
+    This is the reference implementation used by the differential tests.
+    """
+
+    def process_mappings(self,
+                         mapping_groups,
+                         cmp_value):
+        for group_name, mappings in mapping_groups.items():
+            for mapping_value, mapping in mappings.items():
+                if str(cmp_value) == mapping_value:
+                    self.update_result(
+                        group_name,
+                        mapping['type'],
+                        mapping['cost'])
+
+    def process_thresholds(self,
+                           threshold_groups,
+                           cmp_level,
+                           threshold_type):
+        for group_name, thresholds in threshold_groups.items():
+            for threshold_level, threshold in thresholds.items():
+                if cmp_level >= threshold_level:
+                    self.update_result(
+                        group_name,
+                        threshold['type'],
+                        threshold['cost'],
+                        threshold_level,
+                        True,
+                        threshold_type)
+
+    def process_services(self, service_name, point):
+        if service_name not in self._entries:
+            return
+        service_mappings = self._entries[service_name]['mappings']
+        for group_name, mapping in service_mappings.items():
+            self.update_result(group_name,
+                               mapping['type'],
+                               mapping['cost'])
+        service_thresholds = self._entries[service_name]['thresholds']
+        self.process_thresholds(service_thresholds,
+                                point.qty,
+                                'service')
+
+    def process_fields(self, service_name, point):
+        if service_name not in self._entries:
+            return
+        if 'fields' not in self._entries[service_name]:
+            return
+        desc_data = point.desc
+        field_mappings = self._entries[service_name]['fields']
+        for field_name, group_mappings in field_mappings.items():
+            if field_name not in desc_data:
+                continue
+            cmp_value = desc_data[field_name]
+            self.process_mappings(group_mappings['mappings'],
+                                  cmp_value)
+            if group_mappings['thresholds']:
+                self.process_thresholds(group_mappings['thresholds'],
+                                        decimal.Decimal(cmp_value),
+                                        'field')
+
+    def process(self, data):
+        output = dataframe.DataFrame(start=data.start, end=data.end)
+        for service_name, point in data.iterpoints():
+            self._res = {}
+            self.process_services(service_name, point)
+            self.process_fields(service_name, point)
+            output.add_point(self.add_rating_informations(point), service_name)
+        return output
+
+
+class HashMapIndexTest(tests.TestCase):
+    """Compares the indexed evaluation to the reference one."""
+
+    GROUPS = ['_DEFAULT_', 'instance_uptime', 'storage', 'network']
+    FLAVORS = ['m1.tiny', 'm1.small', 'm1.large', 'm1.xlarge']
+
+    def setUp(self):
+        super(HashMapIndexTest, self).setUp()
+        self._random = random.Random(1337)
+        hash.HashMap.db_api.get_migration().upgrade('head')
+        hash.HashMap.global_rules.clear()
+        self._hash = hash.HashMap()
+        self._legacy = LegacyHashMap()
+
+    def _cost(self):
+        return decimal.Decimal(self._random.randint(1, 10 ** 6)) / 10 ** 4
+
+    def _groups(self):
+        return self._random.sample(self.GROUPS,
+                                   self._random.randint(0, len(self.GROUPS)))
+
+    def _mapping(self):
+        return {'type': self._random.choice(['flat', 'rate']),
+                'cost': self._cost()}
+
+    def _thresholds(self):
+        thresholds = {}
+        for group_name in self._groups():
+            levels = self._random.sample(range(-2, 64),
+                                         self._random.randint(1, 6))
+            thresholds[group_name] = {decimal.Decimal(level): self._mapping()
+                                      for level in levels}
+        return thresholds
+
+    def _field_mappings(self, values):
+        mappings = {}
+        for group_name in self._groups():
+            group_values = self._random.sample(
+                values, self._random.randint(1, len(values)))
+            mappings[group_name] = {value: self._mapping()
+                                    for value in group_values}
+        return mappings
+
+    def _generate_entries(self):
+        return {
+            service_name: {
+                'mappings': {group_name: self._mapping()
+                             for group_name in self._groups()},
+                'thresholds': self._thresholds(),
+                'fields': {
+                    'flavor': {
+                        'mappings': self._field_mappings(self.FLAVORS),
+                        'thresholds': {}},
+                    'vcpus': {
+                        'mappings': self._field_mappings(
+                            [str(i) for i in range(1, 9)]),
+                        'thresholds': self._thresholds()},
+                    'memory': {
+                        'mappings': {},
+                        'thresholds': self._thresholds()}},
+            } for service_name in ('compute', 'volume')}
+
+    def _generate_frame(self, points):
+        usage = {}
+        for _ in range(points):
+            metadata = {}
+            if self._random.random() < 0.9:
+                metadata['flavor'] = self._random.choice(
+                    self.FLAVORS + ['m1.unknown'])
+            if self._random.random() < 0.9:
+                metadata['vcpus'] = self._random.choice(
+                    [1, 2, 4, 8, '3', 2.0, 16])
+            if self._random.random() < 0.9:
+                metadata['memory'] = str(self._random.randint(-4, 80))
+            point = dataframe.DataPoint(
+                'instance',
+                decimal.Decimal(self._random.randint(0, 100)) / 4,
+                0,
+                {'id': str(self._random.random())},
+                metadata)
+            usage.setdefault(
+                self._random.choice(['compute', 'volume', 'image']),
+                []).append(point)
+        return dataframe.DataFrame(
+            start=datetime.datetime(2019, 1, 1),
+            end=datetime.datetime(2019, 1, 1, 1),
+            usage=usage)
+
+    def _assert_same_rating(self, frame):
+        expected = self._legacy.process(frame)
+        actual = self._hash.process(frame)
+        self.assertEqual(expected.as_dict(mutable=True),
+                         actual.as_dict(mutable=True))
+
+    def test_random_rules(self):
+        for _ in range(50):
+            entries = self._generate_entries()
+            self._legacy._entries = entries
+            self._hash._entries = copy.deepcopy(entries)
+            self._hash._compile_entries()
+            self._assert_same_rating(self._generate_frame(50))
+
+    def test_random_rules_memoized(self):
+        for memoization_size in (5, 10000):
+            self.conf.set_override(
+                'memoization_size', memoization_size, 'hashmap')
+            for _ in range(20):
+                entries = self._generate_entries()
+                self._legacy._entries = entries
+                self._hash._entries = copy.deepcopy(entries)
+                self._hash._compile_entries()
+                # Memoized results are reused from one frame to another
+                for _ in range(3):
+                    self._assert_same_rating(self._generate_frame(50))
+                self.assertLessEqual(len(self._hash._memo), memoization_size)
+
+    def test_memoization_hit_ratio(self):
+        self._hash._entries = self._generate_entries()
+        self._hash._compile_entries()
+        frame = self._generate_frame(200)
+        # Points of services without rules are not rated
+        rated = len([service_name
+                     for service_name, point in frame.iterpoints()
+                     if service_name != 'image'])
+        self._hash.process(frame)
+        misses = self._hash.memo_misses
+        self.assertEqual(rated, self._hash.memo_hits + misses)
+        self.assertLess(misses, rated)
+
+        self._hash.process(frame)
+        self.assertEqual(misses, self._hash.memo_misses)
+        self.assertEqual(2 * rated - misses, self._hash.memo_hits)
+
+    def test_memoization_reset_on_bind_scope(self):
+        self._hash._entries = self._generate_entries()
+        self._hash._compile_entries()
+        self._hash.process(self._generate_frame(50))
+        self.assertGreater(len(self._hash._memo), 0)
+
+        self._hash.bind_scope(self._hash._tenant_id)
+        self.assertGreater(len(self._hash._memo), 0)
+        self._hash.bind_scope('other_scope')
+        self.assertEqual(0, len(self._hash._memo))
+        self.assertIsNone(self._hash._loaded_rules)
+
+    def test_memoization_disabled(self):
+        self.conf.set_override('memoization_size', 0, 'hashmap')
+        entries = self._generate_entries()
+        self._legacy._entries = entries
+        self._hash._entries = copy.deepcopy(entries)
+        self._hash._compile_entries()
+        self._assert_same_rating(self._generate_frame(100))
+        self.assertEqual(0, self._hash.memo_hits)
+        self.assertEqual(0, len(self._hash._memo))
+
+    def test_memoization_reset_on_reload(self):
+        db_api = hash.HashMap.db_api
+        service_db = db_api.create_service('compute')
+        flavor_db = db_api.create_field(service_db.service_id, 'flavor')
+        mapping_db = db_api.create_mapping(
+            name=uuidutils.generate_uuid(False),
+            created_by='1',
+            value='m1.tiny',
+            cost='1',
+            map_type='flat',
+            field_id=flavor_db.field_id)
+        self._hash.reload_config()
+        self._legacy.reload_config()
+        frame = self._generate_frame(50)
+        self._assert_same_rating(frame)
+
+        db_api.update_mapping(mapping_db.mapping_id, cost='2')
+        self._hash.reload_config()
+        self._legacy.reload_config()
+        self._assert_same_rating(frame)
+
+    def test_rules_from_db(self):
+        db_api = hash.HashMap.db_api
+        service_db = db_api.create_service('compute')
+        flavor_db = db_api.create_field(service_db.service_id, 'flavor')
+        memory_db = db_api.create_field(service_db.service_id, 'memory')
+        groups = [db_api.create_group(name).group_id
+                  for name in self.GROUPS[1:]] + [None]
+        for group_id in groups:
+            db_api.create_mapping(
+                name=uuidutils.generate_uuid(False),
+                created_by='1',
+                cost=self._cost(),
+                map_type=self._random.choice(['flat', 'rate']),
+                service_id=service_db.service_id,
+                group_id=group_id)
+            for flavor in self._random.sample(self.FLAVORS, 2):
+                db_api.create_mapping(
+                    name=uuidutils.generate_uuid(False),
+                    created_by='1',
+                    value=flavor,
+                    cost=self._cost(),
+                    map_type=self._random.choice(['flat', 'rate']),
+                    field_id=flavor_db.field_id,
+                    group_id=group_id)
+            for level in self._random.sample(range(64), 4):
+                db_api.create_threshold(
+                    level=level,
+                    cost=self._cost(),
+                    map_type=self._random.choice(['flat', 'rate']),
+                    field_id=memory_db.field_id,
+                    group_id=group_id)
+            db_api.create_threshold(
+                level=self._random.randint(0, 20),
+                cost=self._cost(),
+                map_type=self._random.choice(['flat', 'rate']),
+                service_id=service_db.service_id,
+                group_id=group_id)
+        self._hash.reload_config()
+        self._legacy.reload_config()
+
+        self._assert_same_rating(self._generate_frame(200))
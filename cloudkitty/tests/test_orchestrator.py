@@ -14,13 +14,17 @@
 #    under the License.
 #
 import datetime
+import os
 import re
 from typing import Callable
+from urllib import parse
 
 from unittest import mock
 
+import fixtures
 from oslo_messaging import conffixture
 from stevedore import extension
+import tooz
 from tooz import coordination
 from tooz.drivers import file
 
@@ -30,6 +34,7 @@ from cloudkitty import orchestrator
 from cloudkitty.storage.v2 import influx
 from cloudkitty import storage_state
 from cloudkitty import tests
+from cloudkitty import utils as ck_utils
 from cloudkitty.utils import tz as tzutils
 
 
@@ -116,6 +121,61 @@ class ScopeEndpointTest(tests.TestCase):
                     fetcher='gnocchi')], any_order=True)
 
 
+class RatingEndpointTest(tests.TestCase):
+    QUOTE_DATA = {'usage': {'instance': [
+        {'vol': {'unit': 'instance', 'qty': 2},
+         'desc': {'metadata': {'flavor_name': 'm1.tiny'}}}]}}
+
+    def setUp(self):
+        super(RatingEndpointTest, self).setUp()
+        self._processor = mock.Mock(priority=1)
+        self._processor.quote.side_effect = lambda frame: frame
+        ext_manager_patch = mock.patch.object(
+            orchestrator.extension_manager, 'EnabledExtensionManager',
+            return_value=[extension.Extension(
+                'fake', None, None, self._processor)])
+        self._ext_manager = ext_manager_patch.start()
+        self.addCleanup(ext_manager_patch.stop)
+        self._endpoint = orchestrator.RatingEndpoint(None)
+
+    def test_quote_reuses_processors(self):
+        for _ in range(3):
+            self.assertEqual('0', self._endpoint.quote({}, self.QUOTE_DATA))
+        self._ext_manager.assert_called_once()
+        self.assertEqual(3, self._processor.quote.call_count)
+        self.assertEqual(3, self._processor.refresh_config.call_count)
+
+    def test_quote_processors_reloaded_on_module_change(self):
+        self._endpoint.quote({}, self.QUOTE_DATA)
+        for method in (self._endpoint.enable_module,
+                       self._endpoint.disable_module,
+                       self._endpoint.reload_module):
+            method({}, 'fake')
+            self._endpoint.quote({}, self.QUOTE_DATA)
+        self._endpoint.reload_modules({})
+        self._endpoint.quote({}, self.QUOTE_DATA)
+        self.assertEqual(5, self._ext_manager.call_count)
+
+    def test_quote_batch(self):
+        def _quote(frame):
+            for metric_type, points in frame.itertypes():
+                frame.replace_points(
+                    [p.set_price(p.qty) for p in points], metric_type)
+            return frame
+
+        self._processor.quote.side_effect = _quote
+        volume_data = {'usage': {'volume': [
+            {'vol': {'unit': 'GiB', 'qty': 10}},
+            {'vol': {'unit': 'GiB', 'qty': 5}}]}}
+        self.assertEqual(
+            ['2', '15', '2'],
+            self._endpoint.quote_batch(
+                {}, [self.QUOTE_DATA, volume_data, self.QUOTE_DATA]))
+        self.assertEqual(3, self._processor.quote.call_count)
+        self._processor.refresh_config.assert_called_once()
+        self.assertEqual([], self._endpoint.quote_batch({}, []))
+
+
 class OrchestratorTest(tests.TestCase):
     def setUp(self):
         super(OrchestratorTest, self).setUp()
@@ -173,6 +233,77 @@ class OrchestratorTest(tests.TestCase):
             self.assertEqual(1, worker._processors[2].obj.priority)
 
 
+class WorkerContextTest(tests.TestCase):
+
+    def setUp(self):
+        super(WorkerContextTest, self).setUp()
+        self.conf_path = self.useFixture(
+            fixtures.TempDir()).join('metrics.yml')
+        self.write_metrics_conf('cpu')
+        self.conf.set_override('metrics_conf', self.conf_path, 'collect')
+        self.context = orchestrator.WorkerContext(1)
+        self.addCleanup(self.context.close)
+
+    def write_metrics_conf(self, metric_name, mtime=None):
+        with open(self.conf_path, 'w') as conf_file:
+            conf_file.write('metrics:\n  {}:\n    unit: instance\n'
+                            '    alt_name: alt_{}\n'.format(
+                                metric_name, metric_name))
+        if mtime is not None:
+            os.utime(self.conf_path, (mtime, mtime))
+
+    def test_conf_reloaded_when_modified(self):
+        self.write_metrics_conf('cpu', mtime=1000)
+        with mock.patch('cloudkitty.utils.load_conf',
+                        wraps=ck_utils.load_conf) as load_conf_mock:
+            for _ in range(3):
+                orchestrator.Worker(mock.Mock(), mock.Mock(), 'scope', 1,
+                                    context=self.context)
+            self.assertEqual(1, load_conf_mock.call_count)
+            self.assertEqual(['alt_cpu'], list(
+                self.context.map_metric_definition_by_alt_name))
+
+            self.write_metrics_conf('ram', mtime=2000)
+            worker = orchestrator.Worker(mock.Mock(), mock.Mock(), 'scope',
+                                         1, context=self.context)
+            self.assertEqual(2, load_conf_mock.call_count)
+            self.assertEqual(['ram'], list(worker._conf['metrics']))
+            self.assertEqual(['alt_ram'], list(
+                worker.map_metric_definition_by_alt_name))
+
+    def test_workers_share_executor(self):
+        workers = [orchestrator.Worker(mock.Mock(), mock.Mock(), scope, 1,
+                                       context=self.context)
+                   for scope in ('scope1', 'scope2')]
+        self.assertIs(self.context.thread_executor,
+                      workers[0].thread_executor)
+        self.assertIs(self.context.thread_executor,
+                      workers[1].thread_executor)
+
+    def test_rating_processors_loaded_once(self):
+        module = tests.FakeRatingModule()
+        fake_mgr = extension.ExtensionManager.make_test_instance(
+            [extension.Extension('fake', None, None, module)],
+            'cloudkitty.rating.processors')
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        with mock.patch(ck_ext_mgr, return_value=fake_mgr) as stevemock:
+            worker = orchestrator.Worker(mock.Mock(), mock.Mock(), 'scope1',
+                                         1, context=self.context)
+            self.assertEqual('scope1', module._tenant_id)
+            worker = orchestrator.Worker(mock.Mock(), mock.Mock(), 'scope2',
+                                         1, context=self.context)
+            stevemock.assert_called_once_with(
+                'cloudkitty.rating.processors',
+                invoke_kwds={'tenant_id': None})
+            self.assertIs(module, worker._processors[0].obj)
+            self.assertEqual('scope2', module._tenant_id)
+
+            self.context.invalidate_rating_processors()
+            orchestrator.Worker(mock.Mock(), mock.Mock(), 'scope1', 1,
+                                context=self.context)
+            self.assertEqual(2, stevemock.call_count)
+
+
 class WorkerTest(tests.TestCase):
 
     def setUp(self):
@@ -285,19 +416,13 @@ class WorkerTest(tests.TestCase):
             mock.call(start=start_time, end=end_time, usage={})
         ])
 
-    @mock.patch('cloudkitty.dataframe.DataFrame.from_dict')
-    def test_persist_rating_data(self, dataframe_from_dict_mock):
+    def test_persist_rating_data(self):
         start_time = tzutils.localized_now()
         end_time = start_time + datetime.timedelta(hours=1)
 
-        frame = mock.Mock()
-        frame.start = start_time
-        frame.end = end_time
-
-        dataframe_from_dict_mock.return_value = frame
-
         metric_name = 'metric-one'
-        frame.as_dict.return_value = {
+        frame = dataframe.DataFrame.from_dict({
+            'period': {'begin': start_time, 'end': end_time},
             'usage': {metric_name: [{
                 "vol": {
                     "unit": "GiB",
@@ -314,7 +439,8 @@ class WorkerTest(tests.TestCase):
                     "attr_one": "one",
                     "attr_two": "two",
                 },
-            }]}}
+            }]}})
+        expected = frame.as_dict()
 
         self.worker.map_metric_definition_by_alt_name[metric_name] = {}
 
@@ -325,14 +451,22 @@ class WorkerTest(tests.TestCase):
                                    'execute_datapoints_filtering',
                                    wraps=self.get_actual_filtering_for_spy()
                                    ) as wrapped_object2:
-                self.worker.persist_rating_data(end_time, frame, start_time)
+                with mock.patch.object(dataframe.DataFrame,
+                                       'from_dict') as from_dict_mock:
+                    self.worker.persist_rating_data(
+                        end_time, frame, start_time)
+
+                    from_dict_mock.assert_not_called()
 
                 self.assertEqual(wrapped_object1.call_count, 1)
-                self.assertEqual(wrapped_object2.call_count, 1)
+                # NOTE: the default expression is always false, the
+                # filtering loop is skipped.
+                self.assertEqual(wrapped_object2.call_count, 0)
 
         self.storage_mock.push.assert_has_calls([
             mock.call([frame], self.worker._tenant_id)
         ])
+        self.assertEqual(expected, frame.as_dict())
 
     def get_actual_filtering_for_spy(self) -> Callable[..., None]:
         return self.worker.execute_datapoints_filtering
@@ -386,7 +520,9 @@ class WorkerTest(tests.TestCase):
                                    wraps=self.get_actual_filtering_for_spy()
                                    ) as wrapped_object2:
                 with mock.patch.object(
-                        orchestrator.LOG, 'debug') as log_debug_mock:
+                        orchestrator.LOG, 'debug') as log_debug_mock, \
+                        mock.patch.object(orchestrator.LOG, 'isEnabledFor',
+                                          return_value=True):
                     self.worker.persist_rating_data(
                         end_time, frame, start_time)
 
@@ -482,12 +618,14 @@ class WorkerTest(tests.TestCase):
                     wraps=self.get_actual_filtering_for_spy()
             ) as wrapped_object2:
                 with mock.patch.object(
-                        orchestrator.LOG, 'debug') as log_debug_mock:
+                        orchestrator.LOG, 'debug') as log_debug_mock, \
+                        mock.patch.object(orchestrator.LOG, 'isEnabledFor',
+                                          return_value=True):
                     self.worker.persist_rating_data(
                         end_time, frame, start_time)
 
                     self.assertEqual(wrapped_object1.call_count, 2)
-                    self.assertEqual(wrapped_object2.call_count, 2)
+                    self.assertEqual(wrapped_object2.call_count, 1)
                     log_debug_mock.assert_has_calls(
                         [mock.call(
                             "Persisting processed frames [%s] for scope [%s] "
@@ -561,7 +699,9 @@ class WorkerTest(tests.TestCase):
                     wraps=self.get_actual_filtering_for_spy()
             ) as wrapped_object2:
                 with mock.patch.object(
-                        orchestrator.LOG, 'debug') as log_debug_mock:
+                        orchestrator.LOG, 'debug') as log_debug_mock, \
+                        mock.patch.object(orchestrator.LOG, 'isEnabledFor',
+                                          return_value=True):
                     self.worker.persist_rating_data(
                         end_time, frame, start_time)
 
@@ -658,12 +798,14 @@ class WorkerTest(tests.TestCase):
                     wraps=self.get_actual_filtering_for_spy()
             ) as wrapped_object2:
                 with mock.patch.object(
-                        orchestrator.LOG, 'debug') as log_debug_mock:
+                        orchestrator.LOG, 'debug') as log_debug_mock, \
+                        mock.patch.object(orchestrator.LOG, 'isEnabledFor',
+                                          return_value=True):
                     self.worker.persist_rating_data(
                         end_time, frame, start_time)
 
                     self.assertEqual(wrapped_object1.call_count, 2)
-                    self.assertEqual(wrapped_object2.call_count, 2)
+                    self.assertEqual(wrapped_object2.call_count, 1)
                     log_debug_mock.assert_has_calls([
                         mock.call(
                             "Persisting processed frames [%s] for scope [%s] "
@@ -678,6 +820,92 @@ class WorkerTest(tests.TestCase):
                         self.storage_mock.push.call_args_list[0][
                             0][0][0].as_dict())
 
+    def test_skip_datapoints_predicate_is_cached_by_expression(self):
+        self.worker.map_metric_definition_by_alt_name['metric-one'] = {
+            "skip_datapoints_expression": 'datapoint["qty"] == 0'}
+        self.worker.map_metric_definition_by_alt_name['metric-two'] = {
+            "skip_datapoints_expression": 'datapoint["qty"] == 0'}
+
+        self.assertIs(
+            self.worker.get_skip_datapoints_predicate('metric-one'),
+            self.worker.get_skip_datapoints_predicate('metric-two'))
+
+    @staticmethod
+    def _make_points(quantities):
+        return [dataframe.DataPoint('unit', qty, 0, {}, {})
+                for qty in quantities]
+
+    def _make_frame(self, usage):
+        start = tzutils.localized_now()
+        return dataframe.DataFrame(
+            start=start, end=start + datetime.timedelta(hours=1),
+            usage=usage)
+
+    def test_skip_datapoints_predicate_compiled_once(self):
+        orchestrator.get_skip_datapoints_predicate.cache_clear()
+        self.worker.map_metric_definition_by_alt_name['metric-one'] = {
+            "skip_datapoints_expression": 'point.qty > 1'}
+
+        with mock.patch.object(orchestrator, 'compile',
+                               wraps=compile, create=True) as compile_mock:
+            for _ in range(3):
+                frame = self._make_frame(
+                    {'metric-one': self._make_points(range(100))})
+                self.worker.persist_rating_data(
+                    frame.end, frame, frame.start)
+                self.assertEqual(self._make_points([0, 1]),
+                                 list(frame.itertypes())[0][1])
+
+        self.assertEqual(1, compile_mock.call_count)
+
+    def test_skip_datapoints_predicate_constant(self):
+        false_predicate = orchestrator.SkipDatapointsPredicate("1 == 0")
+        true_predicate = orchestrator.SkipDatapointsPredicate("True")
+        datapoints = self._make_points([1, 2])
+
+        self.assertTrue(false_predicate.always_false)
+        self.assertFalse(true_predicate.always_false)
+        self.assertEqual((datapoints, []), false_predicate.split(datapoints))
+        self.assertEqual(([], datapoints), true_predicate.split(datapoints))
+
+    def test_skip_datapoints_predicate_split(self):
+        predicate = orchestrator.SkipDatapointsPredicate(
+            'datapoint.get("vol", {}).get("qty", 0) == 0')
+        datapoints = self._make_points([0, 2, 0])
+
+        self.assertIsNone(predicate.constant)
+        self.assertEqual(
+            (self._make_points([2]), self._make_points([0, 0])),
+            predicate.split(datapoints))
+
+    def test_skip_datapoints_predicate_split_context(self):
+        predicate = orchestrator.SkipDatapointsPredicate(
+            'usage_data_metric_name == "metric-one" and '
+            '(point.qty == 0 or len(filtered_datapoints) > 0)')
+        datapoints = self._make_points([0, 2, 3])
+
+        self.assertEqual(
+            (self._make_points([2]), self._make_points([0, 3])),
+            predicate.split(datapoints, 'metric-one'))
+        self.assertEqual((datapoints, []),
+                         predicate.split(datapoints, 'metric-two'))
+
+    def test_skip_datapoints_predicate_nested_names(self):
+        lambda_predicate = orchestrator.SkipDatapointsPredicate(
+            '(lambda: datapoint["vol"]["qty"] == 0)()')
+        comprehension_predicate = orchestrator.SkipDatapointsPredicate(
+            'any(datapoint["vol"]["qty"] == qty for qty in (0, 3))')
+        datapoints = self._make_points([0, 2, 3])
+
+        for predicate in (lambda_predicate, comprehension_predicate):
+            self.assertIsNone(predicate.constant)
+        self.assertEqual(
+            (self._make_points([2, 3]), self._make_points([0])),
+            lambda_predicate.split(datapoints))
+        self.assertEqual(
+            (self._make_points([2]), self._make_points([0, 3])),
+            comprehension_predicate.split(datapoints))
+
     @mock.patch("cloudkitty.orchestrator.Worker._do_collection")
     @mock.patch("cloudkitty.orchestrator.Worker.execute_measurements_rating")
     @mock.patch("cloudkitty.orchestrator.Worker.persist_rating_data")
@@ -748,6 +976,106 @@ class WorkerTest(tests.TestCase):
         ])
         self.assertTrue(update_scope_processing_state_db_mock.called)
 
+    def _get_late_timestamp(self, periods):
+        # Start of a period for which the given number of periods can be
+        # processed, waiting periods excluded.
+        period = datetime.timedelta(seconds=self.worker._period)
+        now = tzutils.localized_now()
+        return tzutils.substract_delta(
+            now, period * (periods + orchestrator.CONF.collect.wait_periods)
+            - datetime.timedelta(seconds=1))
+
+    def test_get_catch_up_timestamps_disabled(self):
+        timestamp = self._get_late_timestamp(100)
+        self.assertEqual(
+            [timestamp], self.worker.get_catch_up_timestamps(timestamp))
+
+    def test_get_catch_up_timestamps_below_threshold(self):
+        self.conf.set_override('catch_up_threshold', 5, 'orchestrator')
+        timestamp = self._get_late_timestamp(5)
+        self.assertEqual(
+            [timestamp], self.worker.get_catch_up_timestamps(timestamp))
+
+    def test_get_catch_up_timestamps(self):
+        self.conf.set_override('catch_up_threshold', 5, 'orchestrator')
+        timestamp = self._get_late_timestamp(6)
+        timestamps = self.worker.get_catch_up_timestamps(timestamp)
+
+        period = datetime.timedelta(seconds=self.worker._period)
+        self.assertEqual(
+            [tzutils.add_delta(timestamp, period * i) for i in range(6)],
+            timestamps)
+
+    def test_get_catch_up_timestamps_max_periods(self):
+        self.conf.set_override('catch_up_threshold', 2, 'orchestrator')
+        self.conf.set_override('catch_up_max_periods', 4, 'orchestrator')
+        timestamp = self._get_late_timestamp(100)
+        timestamps = self.worker.get_catch_up_timestamps(timestamp)
+
+        self.assertEqual(4, len(timestamps))
+        self.assertEqual(timestamp, timestamps[0])
+
+    @mock.patch("cloudkitty.orchestrator.Worker.do_execute_scope_processing")
+    @mock.patch("cloudkitty.orchestrator.Worker"
+                ".do_execute_catch_up_processing")
+    def test_execute_worker_processing_catch_up(
+            self, do_execute_catch_up_processing_mock,
+            do_execute_scope_processing_mock):
+        self.conf.set_override('catch_up_threshold', 2, 'orchestrator')
+        self.conf.set_override('catch_up_max_periods', 3, 'orchestrator')
+        timestamp = self._get_late_timestamp(10)
+        self.worker.next_timestamp_to_process = mock.Mock(
+            return_value=timestamp)
+        self.worker._state = mock.Mock()
+        self.worker._state.get_last_processed_timestamp.return_value = None
+
+        self.assertTrue(self.worker.execute_worker_processing())
+
+        period = datetime.timedelta(seconds=self.worker._period)
+        do_execute_catch_up_processing_mock.assert_called_once_with(
+            [timestamp, tzutils.add_delta(timestamp, period),
+             tzutils.add_delta(timestamp, period * 2)])
+        self.assertFalse(do_execute_scope_processing_mock.called)
+
+    @mock.patch("cloudkitty.orchestrator.Worker.refresh_rating_rules")
+    @mock.patch("cloudkitty.orchestrator.Worker.execute_measurements_rating")
+    @mock.patch("cloudkitty.orchestrator.Worker"
+                ".update_scope_processing_state_db")
+    def test_do_execute_catch_up_processing(
+            self, update_scope_processing_state_db_mock,
+            execute_measurements_rating_mock, refresh_rating_rules_mock):
+        period = datetime.timedelta(seconds=self.worker._period)
+        timestamps = [tzutils.add_delta(tests.samples.FIRST_PERIOD_BEGIN,
+                                        period * i) for i in range(3)]
+        end = tzutils.add_delta(timestamps[-1], period)
+        self.collector_mock.conf = {'metric_b': {}, 'metric_a': {}}
+        self.collector_mock.retrieve_periods.side_effect = [
+            ('metric_a', {timestamps[0]: ['a0'], timestamps[2]: ['a2']}),
+            ('metric_b', {timestamps[0]: ['b0']}),
+        ]
+        frames = [dataframe.DataFrame(start=t, end=t) for t in timestamps]
+        execute_measurements_rating_mock.side_effect = [
+            frames[0], frames[2]]
+
+        self.worker.do_execute_catch_up_processing(timestamps)
+
+        self.collector_mock.retrieve_periods.assert_has_calls([
+            mock.call('metric_a', timestamps[0], end, self._tenant_id),
+            mock.call('metric_b', timestamps[0], end, self._tenant_id),
+        ])
+        # The second period has no data, nothing is rated for it
+        execute_measurements_rating_mock.assert_has_calls([
+            mock.call(timestamps[1], timestamps[0],
+                      {'metric_a': ['a0'], 'metric_b': ['b0']}),
+            mock.call(end, timestamps[2], {'metric_a': ['a2']}),
+        ])
+        refresh_rating_rules_mock.assert_has_calls([
+            mock.call(timestamps[0]), mock.call(timestamps[2])])
+        self.storage_mock.push.assert_called_once_with(
+            [frames[0], frames[2]], self._tenant_id)
+        update_scope_processing_state_db_mock.assert_called_once_with(
+            timestamps[-1])
+
     @mock.patch("cloudkitty.storage_state.StateManager"
                 ".get_last_processed_timestamp")
     @mock.patch("cloudkitty.storage_state.StateManager"
@@ -1076,6 +1404,12 @@ class CloudKittyProcessorTest(tests.TestCase):
         self.addCleanup(get_collector_manager.stop)
         self.get_collector_mock = get_collector_manager.start()
 
+        patcher_get_coordinator = mock.patch(
+            "tooz.coordination.get_coordinator")
+        self.addCleanup(patcher_get_coordinator.stop)
+        self.get_coordinator_mock = patcher_get_coordinator.start()
+
+        self.conf.set_override('scope_sharding', True, 'orchestrator')
         self.worker_id = 1
         self.cloudkitty_processor = orchestrator.CloudKittyProcessor(
             self.worker_id)
@@ -1100,19 +1434,26 @@ class CloudKittyProcessorTest(tests.TestCase):
                 self.cloudkitty_processor._scope_endpoint])])
 
     @mock.patch("time.sleep")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "get_scopes_next_timestamps")
     @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
                 "load_scopes_to_process")
     @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
                 "process_scope")
     @mock.patch("cloudkitty.orchestrator.get_lock")
     def test_internal_run(self, get_lock_mock, process_scope_mock,
-                          load_scopes_to_process_mock, sleep_mock):
+                          load_scopes_to_process_mock,
+                          get_scopes_next_timestamps_mock, sleep_mock):
 
         lock_mock = mock.Mock()
         lock_mock.acquire.return_value = True
         get_lock_mock.return_value = ("lock_name", lock_mock)
 
-        self.cloudkitty_processor.tenants = ["tenant1"]
+        self.cloudkitty_processor.tenants = ["tenant1", "tenant2"]
+        get_scopes_next_timestamps_mock.side_effect = [
+            {"tenant1": tzutils.localized_now(), "tenant2": None},
+            {"tenant1": None, "tenant2": None},
+        ]
 
         self.cloudkitty_processor.internal_run()
 
@@ -1123,9 +1464,145 @@ class CloudKittyProcessorTest(tests.TestCase):
             [mock.call(self.cloudkitty_processor.coord, "tenant1")])
 
         sleep_mock.assert_called_once()
-        process_scope_mock.assert_called_once()
+        process_scope_mock.assert_called_once_with("tenant1")
         load_scopes_to_process_mock.assert_called_once()
 
+        stats = self.cloudkitty_processor.scheduler_stats
+        self.assertEqual(1, stats.cycles)
+        self.assertEqual(1, stats.queue_depth)
+        self.assertEqual(1, stats.processed_scopes)
+        self.assertEqual(0, stats.failed_scopes)
+
+    @mock.patch("time.sleep")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "get_scopes_next_timestamps")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "load_scopes_to_process")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "process_scope")
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_internal_run_most_late_scope_first(
+            self, get_lock_mock, process_scope_mock,
+            load_scopes_to_process_mock, get_scopes_next_timestamps_mock,
+            sleep_mock):
+        lock_mock = mock.Mock()
+        lock_mock.acquire.return_value = True
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+        process_scope_mock.side_effect = [None, Exception, None]
+
+        now = tzutils.localized_now()
+        self.cloudkitty_processor.tenants = ["s1", "s2", "s3", "s4"]
+        next_timestamps = {
+            "s1": tzutils.substract_delta(now, datetime.timedelta(hours=1)),
+            "s2": tzutils.substract_delta(now, datetime.timedelta(days=2)),
+            "s3": None,
+            "s4": tzutils.substract_delta(now, datetime.timedelta(days=1)),
+        }
+        # Periods are still pending after the cycle
+        get_scopes_next_timestamps_mock.return_value = next_timestamps
+
+        self.cloudkitty_processor.internal_run()
+
+        process_scope_mock.assert_has_calls([
+            mock.call("s2"), mock.call("s4"), mock.call("s1")])
+        self.assertFalse(sleep_mock.called)
+
+        stats = self.cloudkitty_processor.scheduler_stats
+        self.assertEqual(3, stats.queue_depth)
+        self.assertEqual(2, stats.processed_scopes)
+        self.assertEqual(1, stats.failed_scopes)
+        self.assertEqual(0, stats.next_cycle_delay)
+        self.assertGreaterEqual(stats.max_lag, 2 * 86400)
+
+    @mock.patch("time.sleep")
+    @mock.patch("cloudkitty.orchestrator.LOG")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "get_scopes_next_timestamps")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "load_scopes_to_process")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "process_scope")
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_internal_run_logs_cycle_summary(
+            self, get_lock_mock, process_scope_mock,
+            load_scopes_to_process_mock, get_scopes_next_timestamps_mock,
+            log_mock, sleep_mock):
+        lock_mock = mock.Mock()
+        lock_mock.acquire.return_value = True
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+
+        now = tzutils.localized_now()
+        self.cloudkitty_processor.tenants = ["s1"]
+        get_scopes_next_timestamps_mock.return_value = {
+            "s1": tzutils.substract_delta(now, datetime.timedelta(hours=1))}
+
+        self.cloudkitty_processor.internal_run()
+
+        stats = self.cloudkitty_processor.scheduler_stats
+        summary = stats.summary()
+        log_mock.info.assert_called_with(
+            "[Worker: %s] Scheduling cycle %s finished, %s.",
+            self.cloudkitty_processor._worker_id, 1, summary)
+        self.assertIn("queue depth: 1 scopes", summary)
+        self.assertIn("max lag: {}s".format(stats.max_lag), summary)
+        self.assertIn("processed scopes: 1, failed scopes: 0", summary)
+        self.assertIn("next cycle in: 0.000s", summary)
+
+    @mock.patch("time.time")
+    def test_get_next_cycle_delay(self, time_mock):
+        period = orchestrator.CONF.collect.period
+        time_mock.return_value = 1000 * period + 42
+        self.cloudkitty_processor.tenants = ["s1"]
+        with mock.patch.object(
+                self.cloudkitty_processor, 'get_scopes_next_timestamps',
+                return_value={"s1": tzutils.localized_now()}):
+            self.assertEqual(
+                0, self.cloudkitty_processor.get_next_cycle_delay(True))
+            # Scopes pending, but no progress: scopes are probably locked
+            # by other processors, or failing.
+            self.assertEqual(
+                period - 41,
+                self.cloudkitty_processor.get_next_cycle_delay(False))
+
+        with mock.patch.object(
+                self.cloudkitty_processor, 'get_scopes_next_timestamps',
+                return_value={"s1": None}):
+            self.assertEqual(
+                period - 41,
+                self.cloudkitty_processor.get_next_cycle_delay(True))
+
+    def test_get_scopes_next_timestamps(self):
+        now = tzutils.localized_now()
+        last_processed = tzutils.substract_delta(
+            now, datetime.timedelta(days=1))
+        processor = self.cloudkitty_processor
+        processor._state = mock.Mock()
+        processor._state.get_all.return_value = [
+            mock.Mock(identifier="s1", active=True,
+                      last_processed_timestamp=last_processed),
+            mock.Mock(identifier="s2", active=False,
+                      last_processed_timestamp=last_processed),
+            mock.Mock(identifier="s3", active=True,
+                      last_processed_timestamp=now),
+        ]
+        processor.next_timestamp_to_process = mock.Mock(return_value="ts")
+
+        actual = processor.get_scopes_next_timestamps(
+            ["s1", "s2", "s3", "s4"])
+
+        processor._state.get_all.assert_called_once_with(
+            fetcher=orchestrator.CONF.fetcher.backend,
+            collector=orchestrator.CONF.collect.collector,
+            scope_key=orchestrator.CONF.collect.scope_key,
+            active=None, limit=None)
+        processor.next_timestamp_to_process.assert_called_once_with("s4")
+        self.assertEqual(
+            {"s1": tzutils.add_delta(last_processed, datetime.timedelta(
+                seconds=orchestrator.CONF.collect.period)),
+             "s3": None,
+             "s4": "ts"},
+            actual)
+
     @mock.patch("cloudkitty.orchestrator.Worker")
     def test_process_scope_no_next_timestamp(self, worker_class_mock):
 
@@ -1174,7 +1651,8 @@ class CloudKittyProcessorTest(tests.TestCase):
             worker_class_mock.assert_has_calls(
                 [mock.call(self.cloudkitty_processor.collector,
                            self.cloudkitty_processor.storage, scope_mock,
-                           self.cloudkitty_processor._worker_id)])
+                           self.cloudkitty_processor._worker_id,
+                           context=self.cloudkitty_processor.worker_context)])
 
             worker_mock.run.assert_called_once()
         finally:
@@ -1188,6 +1666,191 @@ class CloudKittyProcessorTest(tests.TestCase):
 
         self.assertEqual("scope_id", generated_lock_name)
 
+    def test_is_fleet_collection_enabled(self):
+        self.cloudkitty_processor.collector.supports_fleet_collection = True
+        self.assertFalse(
+            self.cloudkitty_processor.is_fleet_collection_enabled())
+
+        self.conf.set_override('fleet_collection', True, 'orchestrator')
+        self.assertTrue(
+            self.cloudkitty_processor.is_fleet_collection_enabled())
+
+        self.cloudkitty_processor.collector.supports_fleet_collection = False
+        self.assertFalse(
+            self.cloudkitty_processor.is_fleet_collection_enabled())
+
+    def test_get_fleet_pending_scopes(self):
+        timestamp = tzutils.localized_now()
+        next_timestamps = {"scope1": timestamp, "scope2": None,
+                           "scope3": timestamp, "scope4": timestamp}
+        self.cloudkitty_processor.tenants = list(next_timestamps.keys())
+        self.cloudkitty_processor.next_timestamp_to_process = mock.Mock(
+            side_effect=next_timestamps.get)
+
+        self.assertEqual(
+            {timestamp: ["scope1", "scope4"]},
+            self.cloudkitty_processor.get_fleet_pending_scopes(
+                excluded={"scope3"}))
+
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_process_fleet_batch(self, get_lock_mock):
+        timestamp = tzutils.localized_now()
+        processor = self.cloudkitty_processor
+        lock_mock = mock.Mock()
+        lock_mock.acquire.side_effect = [True, True, False]
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+        processor.next_timestamp_to_process = mock.Mock(
+            return_value=timestamp)
+        processor._state = mock.Mock()
+        processor._state.get_last_processed_timestamp.return_value = None
+        processor.collector.conf = {'metric_a': {}, 'metric_b': {}}
+        processor.collector.retrieve_all_scopes.side_effect = [
+            ('metric_a', {'scope1': ['a1'], 'scope2': ['a2']}),
+            ('metric_b', {'scope1': ['b1']}),
+        ]
+        processor.worker_class = mock.Mock()
+        worker_mock = processor.worker_class.return_value
+
+        processed = processor.process_fleet_batch(
+            timestamp, ['scope1', 'scope2', 'scope3'])
+
+        self.assertEqual(['scope1', 'scope2'], processed)
+        self.assertEqual(2, lock_mock.release.call_count)
+        end = tzutils.add_delta(
+            timestamp, datetime.timedelta(
+                seconds=orchestrator.CONF.collect.period))
+        processor.collector.retrieve_all_scopes.assert_has_calls([
+            mock.call('metric_a', timestamp, end,
+                      scope_ids=['scope1', 'scope2']),
+            mock.call('metric_b', timestamp, end,
+                      scope_ids=['scope1', 'scope2']),
+        ])
+        processor.worker_class.assert_has_calls([
+            mock.call(processor.collector, processor.storage, 'scope1',
+                      processor._worker_id, context=processor.worker_context),
+            mock.call(processor.collector, processor.storage, 'scope2',
+                      processor._worker_id, context=processor.worker_context),
+        ], any_order=True)
+        worker_mock.process_usage_data.assert_has_calls([
+            mock.call(timestamp, {'metric_a': ['a1'], 'metric_b': ['b1']}),
+            mock.call(timestamp, {'metric_a': ['a2']}),
+        ])
+
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_process_fleet_batch_skips_already_processed_scope(
+            self, get_lock_mock):
+        timestamp = tzutils.localized_now()
+        processor = self.cloudkitty_processor
+        lock_mock = mock.Mock()
+        lock_mock.acquire.return_value = True
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+        processor.next_timestamp_to_process = mock.Mock(
+            return_value=tzutils.add_delta(
+                timestamp, datetime.timedelta(seconds=3600)))
+        processor.worker_class = mock.Mock()
+
+        self.assertEqual(
+            [], processor.process_fleet_batch(timestamp, ['scope1']))
+
+        lock_mock.release.assert_called_once()
+        self.assertFalse(processor.collector.retrieve_all_scopes.called)
+        self.assertFalse(processor.worker_class.called)
+
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_process_fleet_batch_collection_error(self, get_lock_mock):
+        timestamp = tzutils.localized_now()
+        processor = self.cloudkitty_processor
+        lock_mock = mock.Mock()
+        lock_mock.acquire.return_value = True
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+        processor.next_timestamp_to_process = mock.Mock(
+            return_value=timestamp)
+        processor._state = mock.Mock()
+        processor.collector.conf = {'metric_a': {}}
+        processor.collector.retrieve_all_scopes.side_effect = Exception
+        processor.worker_class = mock.Mock()
+
+        self.assertEqual(
+            [], processor.process_fleet_batch(timestamp, ['s1', 's2']))
+
+        self.assertEqual(2, lock_mock.release.call_count)
+        self.assertFalse(processor.worker_class.called)
+
+    def test_process_fleet(self):
+        timestamp = tzutils.localized_now()
+        next_timestamp = tzutils.add_delta(
+            timestamp, datetime.timedelta(seconds=3600))
+        processor = self.cloudkitty_processor
+        self.conf.set_override(
+            'fleet_collection_batch_size', 2, 'orchestrator')
+        state = {"scope1": timestamp, "scope2": timestamp,
+                 "scope3": timestamp}
+        processor.tenants = sorted(state.keys())
+        processor.next_timestamp_to_process = mock.Mock(
+            side_effect=state.get)
+
+        def _process_batch(batch_timestamp, batch):
+            # scope3 fails, the others are processed up to the current time
+            processed = [scope for scope in batch if scope != "scope3"]
+            for scope in processed:
+                state[scope] = (next_timestamp
+                                if batch_timestamp == timestamp else None)
+            return processed
+
+        with mock.patch.object(processor, 'process_fleet_batch',
+                               side_effect=_process_batch) as batch_mock:
+            processor.process_fleet()
+
+        batch_mock.assert_has_calls([
+            mock.call(timestamp, ["scope1", "scope2"]),
+            mock.call(timestamp, ["scope3"]),
+            mock.call(next_timestamp, ["scope1", "scope2"]),
+        ])
+        self.assertEqual(3, batch_mock.call_count)
+
+    def test_get_fleet_pending_scopes_leaves_late_scopes(self):
+        self.conf.set_override('catch_up_threshold', 3, 'orchestrator')
+        now = tzutils.localized_now()
+        late = tzutils.substract_delta(now, datetime.timedelta(days=1))
+        next_timestamps = {"scope1": now, "scope2": late}
+        self.cloudkitty_processor.tenants = list(next_timestamps.keys())
+        self.cloudkitty_processor.next_timestamp_to_process = mock.Mock(
+            side_effect=next_timestamps.get)
+
+        self.assertEqual(
+            {now: ["scope1"]},
+            self.cloudkitty_processor.get_fleet_pending_scopes())
+
+    @mock.patch("time.sleep")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "get_next_cycle_delay", return_value=0)
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "load_scopes_to_process")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor.process_fleet")
+    @mock.patch("cloudkitty.orchestrator.CloudKittyProcessor."
+                "process_scope")
+    @mock.patch("cloudkitty.orchestrator.get_lock")
+    def test_internal_run_fleet_collection(
+            self, get_lock_mock, process_scope_mock, process_fleet_mock,
+            load_scopes_to_process_mock, get_next_cycle_delay_mock,
+            sleep_mock):
+        lock_mock = mock.Mock()
+        lock_mock.acquire.return_value = True
+        get_lock_mock.return_value = ("lock_name", lock_mock)
+        self.cloudkitty_processor.tenants = ["tenant1"]
+        self.cloudkitty_processor.get_scopes_next_timestamps = mock.Mock(
+            return_value={"tenant1": tzutils.localized_now()})
+        self.cloudkitty_processor.collector.supports_fleet_collection = True
+
+        self.cloudkitty_processor.internal_run()
+        self.assertFalse(process_fleet_mock.called)
+
+        self.conf.set_override('fleet_collection', True, 'orchestrator')
+        self.cloudkitty_processor.internal_run()
+        process_fleet_mock.assert_called_once()
+        # Scopes left behind are still processed one by one
+        self.assertEqual(2, process_scope_mock.call_count)
+
     def test_load_scopes_to_process(self):
         fetcher_mock = mock.Mock()
         self.cloudkitty_processor.fetcher = fetcher_mock
@@ -1202,11 +1865,80 @@ class CloudKittyProcessorTest(tests.TestCase):
     def test_terminate(self):
         coordinator_mock = mock.Mock()
         self.cloudkitty_processor.coord = coordinator_mock
+        partitioner = self.cloudkitty_processor.partitioner
 
         self.cloudkitty_processor.terminate()
 
+        coordinator_mock.leave_partitioned_group.assert_called_once_with(
+            partitioner)
         coordinator_mock.stop.assert_called_once()
 
+    def test_join_scopes_group(self):
+        coord = self.get_coordinator_mock.return_value
+        coord.join_partitioned_group.assert_called_once_with(
+            b'cloudkitty-processor-gnocchi-keystone-project_id')
+        self.assertEqual(coord.join_partitioned_group.return_value,
+                         self.cloudkitty_processor.partitioner)
+
+    def test_join_scopes_group_disabled(self):
+        self.conf.set_override('scope_sharding', False, 'orchestrator')
+        self.assertIsNone(self.cloudkitty_processor._join_scopes_group())
+        scopes = ["scope1", "scope2"]
+        self.cloudkitty_processor.partitioner = None
+        self.assertEqual(
+            scopes, self.cloudkitty_processor.filter_owned_scopes(scopes))
+
+    def test_join_scopes_group_not_supported(self):
+        coord = self.get_coordinator_mock.return_value
+        coord.join_partitioned_group.side_effect = tooz.NotImplemented
+        self.assertIsNone(self.cloudkitty_processor._join_scopes_group())
+
+    def test_filter_owned_scopes(self):
+        lock_dir = self.useFixture(fixtures.TempDir()).path
+        processors = [self.cloudkitty_processor,
+                      orchestrator.CloudKittyProcessor(2)]
+        coordinators = []
+        for processor in processors:
+            # NOTE: get_coordinator is mocked in setUp
+            coord = file.FileDriver(
+                processor._member_id,
+                parse.urlsplit('file://' + lock_dir), {})
+            coord.start()
+            self.addCleanup(coord.stop)
+            coordinators.append(coord)
+            processor.coord = coord
+            processor.partitioner = processor._join_scopes_group()
+
+        scopes = ['scope{}'.format(i) for i in range(100)]
+        owned = [set(processor.filter_owned_scopes(scopes))
+                 for processor in processors]
+
+        self.assertEqual(set(), owned[0] & owned[1])
+        self.assertEqual(set(scopes), owned[0] | owned[1])
+        self.assertTrue(owned[0])
+        self.assertTrue(owned[1])
+
+        # Scopes of a leaving worker are redistributed
+        coordinators[1].leave_partitioned_group(processors[1].partitioner)
+        self.assertEqual(
+            scopes, processors[0].filter_owned_scopes(scopes))
+
+    def test_filter_owned_scopes_rejoins_group(self):
+        processor = self.cloudkitty_processor
+        coord = self.get_coordinator_mock.return_value
+        old_partitioner = mock.Mock()
+        old_partitioner.ring.nodes = {b'other-member': 1}
+        new_partitioner = mock.Mock()
+        new_partitioner.belongs_to_self.side_effect = [True, False]
+        coord.join_partitioned_group.return_value = new_partitioner
+        processor.partitioner = old_partitioner
+
+        self.assertEqual(
+            ["scope1"], processor.filter_owned_scopes(["scope1", "scope2"]))
+
+        old_partitioner.stop.assert_called_once()
+        self.assertIs(new_partitioner, processor.partitioner)
+
 
 class ReprocessingWorkerTest(tests.TestCase):
 
@@ -1392,6 +2124,38 @@ class ReprocessingWorkerTest(tests.TestCase):
         do_execute_scope_processing_mock_from_worker.assert_has_calls([
             mock.call(now_timestamp)])
 
+    @mock.patch("cloudkitty.orchestrator.Worker"
+                ".do_execute_catch_up_processing")
+    def test_do_execute_catch_up_processing(
+            self, do_execute_catch_up_processing_mock_from_worker):
+        now_timestamp = tzutils.localized_now()
+        timestamps = [now_timestamp, tzutils.add_delta(
+            now_timestamp, datetime.timedelta(hours=1))]
+        self.reprocessing_worker.scope.start_reprocess_time = now_timestamp
+        self.reprocessing_worker.do_execute_catch_up_processing(timestamps)
+
+        self.storage_mock.delete.assert_called_once_with(
+            begin=self.reprocessing_worker.scope.start_reprocess_time,
+            end=self.reprocessing_worker.scope.end_reprocess_time,
+            filters={
+                self.reprocessing_worker.scope_key:
+                    self.reprocessing_worker._tenant_id})
+        do_execute_catch_up_processing_mock_from_worker.assert_has_calls([
+            mock.call(timestamps)])
+
+    def test_get_catch_up_timestamps_bounded_by_reprocessing_end(self):
+        self.conf.set_override('catch_up_threshold', 1, 'orchestrator')
+        start = tzutils.local_to_utc(datetime.datetime(2024, 1, 1))
+        self.reprocessing_worker.scope.end_reprocess_time = \
+            datetime.datetime(2024, 1, 1, 3)
+
+        timestamps = self.reprocessing_worker.get_catch_up_timestamps(start)
+
+        self.assertEqual(
+            [tzutils.add_delta(start, datetime.timedelta(hours=i))
+             for i in range(4)],
+            timestamps)
+
     @mock.patch("cloudkitty.storage_state.ReprocessingSchedulerDb"
                 ".update_reprocessing_time")
     def test_update_scope_processing_state_db(
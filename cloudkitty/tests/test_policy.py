@@ -63,6 +63,21 @@ class PolicyFileTestCase(tests.TestCase):
                               policy.authorize,
                               self.context, action, self.target)
 
+    def test_v2_quote_follows_v1_quote_rule(self):
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+            self.fixture.config(policy_file=tmpfilename, group='oslo_policy')
+            policy.reset()
+            policy.init()
+            policy.authorize(self.context, 'v2_rating:quote', self.target)
+
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"rating:quote": "role:admin"}')
+            policy._ENFORCER.load_rules(True)
+            self.assertRaises(policy.PolicyNotAuthorized,
+                              policy.authorize,
+                              self.context, 'v2_rating:quote', self.target)
+
 
 class PolicyTestCase(tests.TestCase):
 
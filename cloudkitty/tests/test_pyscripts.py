@@ -24,6 +24,8 @@ from oslo_utils import uuidutils
 from cloudkitty import dataframe
 from cloudkitty.rating import pyscripts
 from cloudkitty.rating.pyscripts.db import api
+from cloudkitty.rating.pyscripts import executor
+from cloudkitty.rating.pyscripts import runner
 from cloudkitty import tests
 
 from dateutil import parser
@@ -196,6 +198,81 @@ def process(data):
 data = process(data)
 """.encode('utf-8')
 
+FRAME_POLICY = """
+import decimal
+
+
+def process(frame):
+    rated = [point.set_price(decimal.Decimal(2.0))
+             if point.groupby.get('flavor') == 'm1.nano' else point
+             for metric_type, point in frame.iterpoints()
+             if metric_type == 'compute']
+    frame.replace_points(rated, 'compute')
+    return frame
+""".encode('utf-8')
+
+POINT_POLICY = """
+import decimal
+
+prices = {'compute': decimal.Decimal(2.0)}
+
+
+def rate_point(metric_type, point):
+    if metric_type in prices:
+        return point.set_price(point.qty * prices[metric_type])
+    return point
+""".encode('utf-8')
+
+GLOBAL_DATA_POLICY = """
+import decimal
+
+
+def process():
+    for point in data['usage'].get('compute', []):
+        point['rating'] = {'price': decimal.Decimal(3.0)}
+
+
+process()
+""".encode('utf-8')
+
+DATA_ATTRIBUTE_POLICY = """
+import decimal
+
+
+def process(frame):
+    prices = Prices()
+    rated = [point.set_price(prices.data[point.groupby.get('flavor')])
+             if point.groupby.get('flavor') in prices.data else point
+             for metric_type, point in frame.iterpoints()
+             if metric_type == 'compute']
+    frame.replace_points(rated, 'compute')
+    return frame
+
+
+class Prices(object):
+    def __init__(self, data=None):
+        self.data = data or {'m1.nano': decimal.Decimal(2.0)}
+""".encode('utf-8')
+
+
+PROCESS_ATTRIBUTE_POLICY = """
+import decimal
+
+
+class Prices(object):
+    def process(self, point):
+        return point.set_price(point.qty * decimal.Decimal(2.0))
+
+
+prices = Prices()
+
+
+def rate_point(metric_type, point):
+    if metric_type == 'compute':
+        return prices.process(point)
+    return point
+""".encode('utf-8')
+
 
 class PyScriptsRatingTest(tests.TestCase):
     def setUp(self):
@@ -203,6 +280,7 @@ class PyScriptsRatingTest(tests.TestCase):
         self._tenant_id = 'f266f30b11f246b589fd266f85eeec39'
         self._db_api = pyscripts.PyScripts.db_api
         self._db_api.get_migration().upgrade('head')
+        pyscripts.PyScripts.code_cache.clear()
         self._pyscripts = pyscripts.PyScripts(self._tenant_id)
 
         self.dataframe_for_tests = dataframe.DataFrame(
@@ -286,6 +364,14 @@ class PyScriptsRatingTest(tests.TestCase):
         actual = self._db_api.get_script(uuid=script_db.script_id)
         self.assertEqual(TEST_CODE2, actual.data)
 
+    def test_writes_bump_rules_version(self):
+        self.assertEqual(0, self._pyscripts.rules_version)
+        script_db = self._db_api.create_script('policy1', TEST_CODE1,
+                                               created_by='')
+        self._db_api.update_script(script_db.script_id, data=TEST_CODE2)
+        self._db_api.delete_script(uuid=script_db.script_id)
+        self.assertEqual(3, self._pyscripts.rules_version)
+
     def test_update_script_uuid_disabled(self):
         expected = self._db_api.create_script('policy1', TEST_CODE1,
                                               created_by='')
@@ -399,7 +485,8 @@ class PyScriptsRatingTest(tests.TestCase):
                     '<PyScripts: {name}>'.format(name='policy1'),
                     'exec'),
                 'checksum': TEST_CODE1_CHECKSUM,
-                'name': 'policy1'
+                'name': 'policy1',
+                'contract': runner.DATA_CONTRACT,
             }}
         self.assertEqual(expected, self._pyscripts._scripts)
         context = {'a': 0}
@@ -416,6 +503,40 @@ class PyScriptsRatingTest(tests.TestCase):
             TEST_CODE2_CHECKSUM,
             self._pyscripts._scripts[policy_db.script_id]['checksum'])
 
+    def test_scripts_compiled_once(self):
+        policy1_db = self._db_api.create_script('policy1', TEST_CODE1,
+                                                created_by='')
+        self._db_api.create_script('policy2', TEST_CODE2, created_by='')
+        with mock.patch('cloudkitty.rating.pyscripts.compile',
+                        side_effect=compile, create=True) as compile_mock:
+            self._pyscripts.reload_config()
+            self.assertEqual(2, compile_mock.call_count)
+
+            # Scripts are not compiled again when unchanged, nor by the
+            # instances rating other scopes
+            self._pyscripts.reload_config()
+            other_pyscripts = pyscripts.PyScripts('other_tenant')
+            other_pyscripts.reload_config()
+            self.assertEqual(2, compile_mock.call_count)
+            self.assertIs(
+                self._pyscripts._scripts[policy1_db.script_id]['code'],
+                other_pyscripts._scripts[policy1_db.script_id]['code'])
+
+            self._db_api.update_script(policy1_db.script_id, data=TEST_CODE3)
+            self._pyscripts.reload_config()
+            other_pyscripts.reload_config()
+            self.assertEqual(3, compile_mock.call_count)
+
+    def test_scripts_fetched_at_once(self):
+        self._db_api.create_script('policy1', TEST_CODE1, created_by='')
+        self._db_api.create_script('policy2', TEST_CODE2, created_by='')
+        with mock.patch.object(self._db_api, 'get_script') as get_mock:
+            self._pyscripts.reload_config()
+        get_mock.assert_not_called()
+        self.assertEqual(['policy1', 'policy2'],
+                         [script['name']
+                          for script in self._pyscripts._scripts.values()])
+
     def test_exec_code_isolation(self):
         self._db_api.create_script('policy1', TEST_CODE1,
                                    created_by='')
@@ -427,6 +548,90 @@ class PyScriptsRatingTest(tests.TestCase):
         self.assertRaises(NameError, self._pyscripts.process,
                           self.dataframe_for_tests)
 
+    def test_get_contract(self):
+        for script, contract in (
+                (TEST_CODE1, runner.DATA_CONTRACT),
+                (COMPLEX_POLICY1, runner.DATA_CONTRACT),
+                (DOCUMENTATION_RATING_POLICY, runner.DATA_CONTRACT),
+                (GLOBAL_DATA_POLICY, runner.DATA_CONTRACT),
+                (FRAME_POLICY, runner.FRAME_CONTRACT),
+                (DATA_ATTRIBUTE_POLICY, runner.FRAME_CONTRACT),
+                (POINT_POLICY, runner.POINT_CONTRACT),
+                (PROCESS_ATTRIBUTE_POLICY, runner.POINT_CONTRACT),
+                (b'import os\nos.process(1)\n', runner.DATA_CONTRACT)):
+            self.assertEqual(
+                contract,
+                runner.get_contract(compile(script, '<test>', 'exec')))
+
+    def _assert_compute_prices(self, data_output, nano_price):
+        self.assertIsInstance(data_output, dataframe.DataFrame)
+        for point in data_output.as_dict()['usage']['compute']:
+            if point['groupby'].get('flavor') == 'm1.nano':
+                self.assertEqual(nano_price, point['rating']['price'])
+            else:
+                self.assertEqual(
+                    decimal.Decimal('0'), point['rating']['price'])
+
+    def test_process_rating_frame_contract(self):
+        self._db_api.create_script('policy1', FRAME_POLICY, created_by='')
+        self._pyscripts.reload_config()
+
+        with mock.patch.object(dataframe.DataFrame, 'as_dict') as as_dict:
+            data_output = self._pyscripts.process(self.dataframe_for_tests)
+        as_dict.assert_not_called()
+        self._assert_compute_prices(data_output, decimal.Decimal('2'))
+
+    def test_process_rating_frame_contract_data_attribute(self):
+        self._db_api.create_script('policy1', DATA_ATTRIBUTE_POLICY,
+                                   created_by='')
+        self._pyscripts.reload_config()
+
+        with mock.patch.object(dataframe.DataFrame, 'as_dict') as as_dict:
+            data_output = self._pyscripts.process(self.dataframe_for_tests)
+        as_dict.assert_not_called()
+        self._assert_compute_prices(data_output, decimal.Decimal('2'))
+
+    def test_process_rating_point_contract_process_attribute(self):
+        self._db_api.create_script('policy1', PROCESS_ATTRIBUTE_POLICY,
+                                   created_by='')
+        self._pyscripts.reload_config()
+
+        data_output = self._pyscripts.process(self.dataframe_for_tests)
+        for point in data_output.as_dict()['usage']['compute']:
+            self.assertEqual(decimal.Decimal('2') * point['vol']['qty'],
+                             point['rating']['price'])
+
+    def test_process_rating_point_contract(self):
+        self._db_api.create_script('policy1', POINT_POLICY, created_by='')
+        self._pyscripts.reload_config()
+
+        with mock.patch.object(dataframe.DataFrame, 'as_dict') as as_dict:
+            data_output = self._pyscripts.process(self.dataframe_for_tests)
+        as_dict.assert_not_called()
+        self.assertEqual(
+            self.dataframe_for_tests.as_dict()['usage'].keys(),
+            data_output.as_dict()['usage'].keys())
+        for point in data_output.as_dict()['usage']['compute']:
+            self.assertEqual(decimal.Decimal('2') * point['vol']['qty'],
+                             point['rating']['price'])
+        for point in data_output.as_dict()['usage']['instance_status']:
+            self.assertEqual(decimal.Decimal('0'), point['rating']['price'])
+
+    def test_process_rating_mixed_contracts(self):
+        self._db_api.create_script('policy1', GLOBAL_DATA_POLICY,
+                                   created_by='')
+        self._db_api.create_script('policy2', FRAME_POLICY, created_by='')
+        self._pyscripts.reload_config()
+
+        data_output = self._pyscripts.process(self.dataframe_for_tests)
+        for point in data_output.as_dict()['usage']['compute']:
+            if point['groupby'].get('flavor') == 'm1.nano':
+                self.assertEqual(decimal.Decimal('2'),
+                                 point['rating']['price'])
+            else:
+                self.assertEqual(decimal.Decimal('3'),
+                                 point['rating']['price'])
+
     # Processing
     def test_process_rating(self):
         self._db_api.create_script('policy1', COMPLEX_POLICY1,
@@ -508,3 +713,88 @@ class PyScriptsRatingTest(tests.TestCase):
                 self.assertEqual(
                     decimal.Decimal('27.99999999999999822364316060'),
                     point['rating']['price'])
+
+
+class PyScriptsExecutorTest(tests.TestCase):
+    def setUp(self):
+        super(PyScriptsExecutorTest, self).setUp()
+        self.conf.set_override('executor', 'process', 'pyscripts')
+        self.conf.set_override('process_workers', 1, 'pyscripts')
+        self._db_api = pyscripts.PyScripts.db_api
+        self._db_api.get_migration().upgrade('head')
+        pyscripts.PyScripts.code_cache.clear()
+        self._pyscripts = pyscripts.PyScripts()
+        self.addCleanup(pyscripts.PyScripts.script_executor.shutdown)
+        self.dataframe_for_tests = dataframe.DataFrame(
+            parser.parse(CK_RESOURCES_DATA['period']['begin']),
+            parser.parse(CK_RESOURCES_DATA['period']['end']),
+            CK_RESOURCES_DATA['usage'])
+
+    def _process_inline_and_in_pool(self):
+        self._pyscripts.reload_config()
+        data_output = self._pyscripts.process(self.dataframe_for_tests)
+        self.conf.set_override('executor', 'inline', 'pyscripts')
+        expected = self._pyscripts.process(self.dataframe_for_tests)
+        return expected, data_output
+
+    def test_process_rating(self):
+        self._db_api.create_script('policy1', COMPLEX_POLICY1,
+                                   created_by='')
+        self._db_api.create_script('policy2', POINT_POLICY, created_by='')
+        expected, data_output = self._process_inline_and_in_pool()
+        self.assertIsInstance(data_output, dataframe.DataFrame)
+        self.assertEqual(expected.as_dict(), data_output.as_dict())
+
+    def test_script_error(self):
+        self._db_api.create_script('policy1', TEST_CODE3, created_by='')
+        self._pyscripts.reload_config()
+        self.assertRaises(NameError, self._pyscripts.process,
+                          self.dataframe_for_tests)
+
+    def test_wall_clock_timeout(self):
+        self.conf.set_override('script_timeout', 1, 'pyscripts')
+        self._db_api.create_script(
+            'policy1', 'import time; time.sleep(30)'.encode('utf-8'),
+            created_by='')
+        self._pyscripts.reload_config()
+        self.assertRaises(executor.ScriptTimeout, self._pyscripts.process,
+                          self.dataframe_for_tests)
+
+        # The worker process interrupted the script and is reused
+        self.conf.set_override('script_timeout', 60, 'pyscripts')
+        self._db_api.update_script(
+            self._db_api.get_script('policy1').script_id, data=POINT_POLICY)
+        self._pyscripts.reload_config()
+        data_output = self._pyscripts.process(self.dataframe_for_tests)
+        self.assertIsInstance(data_output, dataframe.DataFrame)
+
+    def test_stuck_worker_replaced(self):
+        self.conf.set_override('script_timeout', 1, 'pyscripts')
+        # NOTE: SIGALRM is blocked, the worker process cannot interrupt
+        # the script.
+        self._db_api.create_script(
+            'policy1',
+            'import signal, time\n'
+            'signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})\n'
+            'time.sleep(5)\n'.encode('utf-8'),
+            created_by='')
+        self._pyscripts.reload_config()
+        pool = self._pyscripts.script_executor._get_pool()
+        with mock.patch.object(executor, 'WORKER_TIMEOUT_MARGIN', 0):
+            self.assertRaises(executor.ScriptTimeout, self._pyscripts.process,
+                              self.dataframe_for_tests)
+
+        self.assertIsNot(pool, self._pyscripts.script_executor._get_pool())
+        self._db_api.update_script(
+            self._db_api.get_script('policy1').script_id, data=POINT_POLICY)
+        self._pyscripts.reload_config()
+        data_output = self._pyscripts.process(self.dataframe_for_tests)
+        self.assertIsInstance(data_output, dataframe.DataFrame)
+
+    def test_cpu_time_limit(self):
+        self.conf.set_override('script_cpu_time', 1, 'pyscripts')
+        self._db_api.create_script(
+            'policy1', 'while True: pass'.encode('utf-8'), created_by='')
+        self._pyscripts.reload_config()
+        self.assertRaises(executor.ScriptTimeout, self._pyscripts.process,
+                          self.dataframe_for_tests)
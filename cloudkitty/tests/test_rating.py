@@ -13,10 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import datetime
 from unittest import mock
 
 from cloudkitty.db import api as ck_db_api
+from cloudkitty import rating
 from cloudkitty import tests
+from cloudkitty.utils import tz as tzutils
 
 
 class FakeRPCClient(object):
@@ -109,3 +112,89 @@ class RatingTest(tests.TestCase):
         self._module.set_priority(10)
         new_prio = self._module.priority
         self.assertNotEqual(old_prio, new_prio)
+
+    def test_notify_reload_bumps_rules_version(self):
+        # NOTE: FakeRatingModule disables notify_reload
+        self.assertEqual(0, self._module.rules_version)
+        with mock.patch('cloudkitty.messaging.get_client') as rpcmock:
+            rpcmock.return_value = self._fake_rpc
+            rating.RatingProcessorBase.notify_reload(self._module)
+            rating.RatingProcessorBase.notify_reload(self._module)
+        self.assertEqual(2, self._module.rules_version)
+        self.assertTrue(self._fake_rpc._fanout)
+        self.assertEqual(
+            [{'ctx': {}, 'data': 'reload_module', 'name': 'fake'}] * 2,
+            self._fake_rpc._queue)
+
+
+class RefreshConfigTest(tests.TestCase):
+    def setUp(self):
+        super(RefreshConfigTest, self).setUp()
+        self._module = tests.FakeRatingModule('tenant_a')
+        self._module.reload_config = mock.Mock()
+        self._module.get_validity_boundaries = mock.Mock(return_value=[
+            datetime.datetime(2019, 1, 1), datetime.datetime(2019, 2, 1)])
+        self._module_db = ck_db_api.get_instance().get_module_info()
+
+    def _date(self, *args):
+        return tzutils.local_to_utc(datetime.datetime(*args))
+
+    def test_refresh_config_within_validity_window(self):
+        start = self._date(2019, 1, 10)
+        self.assertTrue(self._module.refresh_config(start))
+        for day in range(11, 32):
+            self.assertFalse(self._module.refresh_config(
+                self._date(2019, 1, day)))
+        self._module.reload_config.assert_called_once_with(start)
+
+    def test_refresh_config_crossing_boundary(self):
+        self._module.refresh_config(self._date(2019, 1, 31, 23))
+        self.assertTrue(self._module.refresh_config(self._date(2019, 2, 1)))
+        self.assertTrue(self._module.refresh_config(self._date(2018, 12, 1)))
+        self.assertFalse(self._module.refresh_config(
+            self._date(2018, 12, 31)))
+        self.assertEqual(3, self._module.reload_config.call_count)
+
+    def test_refresh_config_rules_version_changed(self):
+        self._module.refresh_config(self._date(2019, 1, 10))
+        self._module_db.bump_rules_version('fake')
+        self.assertTrue(self._module.refresh_config(self._date(2019, 1, 10)))
+        self.assertFalse(self._module.refresh_config(
+            self._date(2019, 1, 10)))
+
+    def test_refresh_config_state_and_priority_changed(self):
+        self._module_db.set_state('fake', True)
+        self._module.refresh_config(self._date(2019, 1, 10))
+        version = self._module_db.get_modules_version()
+        self._module_db.set_state('fake', True)
+        self._module_db.set_priority('fake', 1)
+        self.assertEqual(version, self._module_db.get_modules_version())
+        self.assertFalse(self._module.refresh_config(
+            self._date(2019, 1, 10)))
+
+        self._module_db.set_priority('fake', 2)
+        self.assertTrue(self._module.refresh_config(self._date(2019, 1, 10)))
+        self._module_db.set_state('fake', False)
+        self._module_db.set_state('other', True)
+        self.assertEqual(version + 3, self._module_db.get_modules_version())
+
+    def test_refresh_config_other_scope(self):
+        self._module.refresh_config(self._date(2019, 1, 10))
+        self._module.bind_scope('tenant_b')
+        self.assertIsNone(self._module._loaded_rules)
+        self.assertTrue(self._module.refresh_config(self._date(2019, 1, 10)))
+
+    def test_bind_same_scope(self):
+        self._module.bind_scope('tenant_a')
+        self._module.refresh_config(self._date(2019, 1, 10))
+        self._module.bind_scope('tenant_a')
+        self.assertFalse(self._module.refresh_config(
+            self._date(2019, 1, 10)))
+
+    def test_refresh_config_unknown_boundaries(self):
+        self._module.get_validity_boundaries.return_value = None
+        for _ in range(3):
+            self.assertTrue(self._module.refresh_config(
+                self._date(2019, 1, 10)))
+        self.assertTrue(self._module.refresh_config())
+        self.assertEqual(4, self._module.reload_config.call_count)
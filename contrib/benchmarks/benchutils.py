@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Helpers shared by the benchmark scripts."""
+import multiprocessing
+import resource
+import time
+
+
+def _run(queue, func, args):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    extra = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, baseline, peak, extra))
+
+
+def measure(func, *args):
+    """Runs func(*args) in a child process.
+
+    Returns a dict with the elapsed time in seconds, the peak RSS of the
+    child process in KiB (as reported by getrusage), the RSS growth caused
+    by the call, and whatever func returned.
+    """
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(queue, func, args))
+    proc.start()
+    elapsed, baseline, peak, extra = queue.get()
+    proc.join()
+    return {
+        'time': elapsed,
+        'peak_rss_kib': peak,
+        'rss_growth_kib': peak - baseline,
+        'extra': extra,
+    }
+
+
+def print_results(title, results):
+    """Prints a table of {scenario: measure() output} results."""
+    print(title)
+    print('{:<28} {:>12} {:>16} {:>16}'.format(
+        'scenario', 'time (s)', 'peak RSS (KiB)', 'RSS growth (KiB)'))
+    for name, res in results.items():
+        print('{:<28} {:>12.4f} {:>16} {:>16}'.format(
+            name, res['time'], res['peak_rss_kib'], res['rss_growth_kib']))
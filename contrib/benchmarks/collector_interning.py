@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Memory used by a synthetic frame built by a collector.
+
+"legacy" reproduces the former BaseCollector._create_data_point (four
+strftime calls and two new ImmutableDicts per point), "interned" goes
+through the current implementation, which caches the calendar attributes
+of the period and deduplicates groupby and metadata mappings.
+"""
+import argparse
+import datetime
+
+import benchutils
+
+from cloudkitty import collector
+from cloudkitty import dataframe
+
+
+class _Collector(collector.BaseCollector):
+    collector_name = 'benchmark'
+
+    def __init__(self):
+        self._interner = dataframe.MappingInterner()
+
+    def fetch_all(self, *args, **kwargs):
+        pass
+
+
+def _legacy_data_point(metric, qty, price, groupby, metadata, start):
+    groupby['week_of_the_year'] = start.strftime("%U")
+    groupby['day_of_the_year'] = start.strftime("%-j")
+    groupby['month'] = start.strftime("%-m")
+    groupby['year'] = start.strftime("%Y")
+    return dataframe.DataPoint(metric['unit'], qty, price, groupby, metadata,
+                               metric.get('description'))
+
+
+def build_frame(mode, points, resources):
+    start = datetime.datetime(2026, 1, 1)
+    metric = {'unit': 'instance'}
+    create = (_legacy_data_point if mode == 'legacy'
+              else _Collector()._create_data_point)
+    frame = dataframe.DataFrame(start=start, end=start)
+    for i in range(points):
+        # NOTE: new str objects on each iteration, as a JSON decoder would
+        # produce them
+        resource_id = 'resource-{}'.format(i % resources)
+        frame.add_point(create(
+            metric, 1, 0,
+            {'id': resource_id, 'project_id': 'project-{}'.format(0)},
+            {'flavor_name': 'm1.{}'.format('small'),
+             'flavor_id': str(i % resources % 10)},
+            start), 'instance')
+    return sum(len(points) for _, points in frame.itertypes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=1000000,
+                        help='Points in the frame')
+    parser.add_argument('--resources', type=int, default=1000,
+                        help='Distinct resources among the points')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('legacy', 'interned'):
+        results[mode] = benchutils.measure(
+            build_frame, mode, args.points, args.resources)
+    benchutils.print_results(
+        'Building a frame of {} points for {} resources'.format(
+            args.points, args.resources), results)
+
+
+if __name__ == '__main__':
+    main()
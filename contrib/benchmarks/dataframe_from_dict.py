@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Validated vs trusted DataFrame.from_dict.
+
+Serializes a typical frame with as_dict(mutable=True), as PyScripts does,
+and times DataFrame.from_dict with and without schema validation.
+"""
+import argparse
+import datetime
+import timeit
+
+from cloudkitty import dataframe
+
+
+def build_frame_dict(points, types, legacy):
+    start = datetime.datetime(2026, 1, 1)
+    end = datetime.datetime(2026, 1, 1, 1)
+    frame = dataframe.DataFrame(start=start, end=end)
+    for type_idx in range(types):
+        frame.add_points([
+            dataframe.DataPoint(
+                'instance', 1, '0.42',
+                {'id': str(i), 'project_id': 'p', 'user_id': 'u'},
+                {'flavor_name': 'm1.small', 'flavor_id': str(i % 10)})
+            for i in range(points)], 'metric{}'.format(type_idx))
+    return frame.as_dict(mutable=True, legacy=legacy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=1000,
+                        help='Points per metric type')
+    parser.add_argument('--types', type=int, default=5,
+                        help='Metric types per frame')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of conversions to time')
+    args = parser.parse_args()
+
+    print('DataFrame.from_dict, {} points (ms per frame)'.format(
+        args.points * args.types))
+    for legacy in (False, True):
+        timings = {}
+        for validate in (True, False):
+            # NOTE: legacy conversion modifies the dicts in place
+            dicts = [build_frame_dict(args.points, args.types, legacy)
+                     for _ in range(args.repeat)]
+            it = iter(dicts)
+            timings[validate] = timeit.timeit(
+                lambda: dataframe.DataFrame.from_dict(
+                    next(it), legacy=legacy, validate=validate),
+                number=args.repeat) / args.repeat * 1000
+        print('legacy={:<6} validated={:>9.2f} trusted={:>9.2f} '
+              'speedup={:.1f}x'.format(
+                  str(legacy), timings[True], timings[False],
+                  timings[True] / timings[False]))
+
+
+if __name__ == '__main__':
+    main()
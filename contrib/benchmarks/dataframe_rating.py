@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Cost of the frame snapshots taken in Worker.execute_measurements_rating.
+
+"deepcopy" reproduces the former behaviour (one copy.deepcopy of the frame
+before each rating processor), "cow" snapshots the frame with
+DataFrame.copy() and "no-snapshot" is what happens when debug logging is
+disabled.
+"""
+import argparse
+import copy
+import datetime
+import decimal
+import time
+
+import benchutils
+
+from cloudkitty import dataframe
+
+
+def build_frame(points_per_type, types):
+    start = datetime.datetime(2026, 1, 1)
+    end = datetime.datetime(2026, 1, 1, 1)
+    frame = dataframe.DataFrame(start=start, end=end)
+    for type_idx in range(types):
+        frame.add_points([
+            dataframe.DataPoint(
+                'instance', 1, 0,
+                {'id': str(i), 'project_id': 'p', 'type': type_idx},
+                {'flavor_name': 'm1.small', 'flavor_id': str(i % 10)})
+            for i in range(points_per_type)], 'metric{}'.format(type_idx))
+    return frame
+
+
+def reprice(frame):
+    """A rating processor repricing every point, as HashMap does."""
+    output = dataframe.DataFrame(start=frame.start, end=frame.end)
+    rate = decimal.Decimal('0.5')
+    for type_, point in frame.iterpoints():
+        output.add_point(point.set_price(point.price + rate * point.qty),
+                         type_)
+    return output
+
+
+def noop(frame):
+    return frame
+
+
+def rate(mode, points_per_type, types, frames):
+    frame_list = [build_frame(points_per_type, types) for _ in range(frames)]
+    processors = [reprice, noop, reprice]
+    snapshots = []
+    start = time.perf_counter()
+    for frame in frame_list:
+        for processor in processors:
+            if mode == 'deepcopy':
+                snapshots.append(copy.deepcopy(frame))
+            elif mode == 'cow':
+                snapshots.append(frame.copy())
+            frame = processor(frame)
+            # NOTE: snapshots only live as long as the log call
+            snapshots = []
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=100000,
+                        help='Points per metric type')
+    parser.add_argument('--types', type=int, default=3,
+                        help='Metric types per frame')
+    parser.add_argument('--frames', type=int, default=3,
+                        help='Number of frames to rate')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('deepcopy', 'cow', 'no-snapshot'):
+        res = benchutils.measure(
+            rate, mode, args.points, args.types, args.frames)
+        # NOTE: only account for the rating, not for building the frames
+        res['time'] = res['extra'] / args.frames
+        results[mode] = res
+    benchutils.print_results(
+        'Rating {} frames of {} points (time is per frame)'.format(
+            args.frames, args.points * args.types), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""HashMap rating of several periods, with and without memoization.
+
+The same resources are rated for several consecutive periods, as a
+processor does for a scope. The rules are a service rate and flavor
+mappings in a few groups, plus memory thresholds. They are built in memory,
+no database is needed.
+"""
+import argparse
+import datetime
+import decimal
+import random
+import time
+
+import benchutils
+from oslo_config import cfg
+
+from cloudkitty import dataframe
+from cloudkitty.rating import hash
+
+CONF = cfg.CONF
+
+GROUPS = ['_DEFAULT_', 'instance_uptime', 'storage']
+
+
+class _HashMap(hash.HashMap):
+    flavors = 0
+
+    def _load_rates(self, start=None):
+        rand = random.Random(42)
+        self._entries = {'instance': {
+            'mappings': {'_DEFAULT_': {'type': 'rate',
+                                       'cost': decimal.Decimal('1.5')}},
+            'thresholds': {},
+            'fields': {
+                'flavor_name': {
+                    'mappings': {group: {
+                        'm{}'.format(i): {
+                            'type': rand.choice(['flat', 'rate']),
+                            'cost': decimal.Decimal(rand.randint(1, 1000))}
+                        for i in range(self.flavors)} for group in GROUPS},
+                    'thresholds': {}},
+                'memory': {
+                    'mappings': {},
+                    'thresholds': {group: {
+                        decimal.Decimal(level): {
+                            'type': 'flat',
+                            'cost': decimal.Decimal(level)}
+                        for level in (512, 2048, 8192)}
+                        for group in GROUPS}}}}}
+        self._compile_entries()
+
+
+def build_frames(args):
+    rand = random.Random(1337)
+    resources = [
+        {'flavor_name': 'm{}'.format(rand.randrange(args.flavors)),
+         'memory': str(rand.choice([512, 1024, 2048, 4096, 8192]))}
+        for _ in range(args.resources)]
+    start = datetime.datetime(2026, 1, 1)
+    frames = []
+    for period in range(args.periods):
+        begin = start + datetime.timedelta(hours=period)
+        frames.append(dataframe.DataFrame(
+            start=begin,
+            end=begin + datetime.timedelta(hours=1),
+            usage={'instance': [
+                dataframe.DataPoint(
+                    'instance', 1, 0, {'id': str(i)}, metadata)
+                for i, metadata in enumerate(resources)]}))
+    return frames
+
+
+def rate(args, memoization_size):
+    CONF.set_override('memoization_size', memoization_size, 'hashmap')
+    _HashMap.flavors = args.flavors
+    module = _HashMap()
+    frames = build_frames(args)
+    start = time.perf_counter()
+    for frame in frames:
+        module.process(frame)
+    elapsed = time.perf_counter() - start
+    total = module.memo_hits + module.memo_misses
+    hit_ratio = 100. * module.memo_hits / total if total else 0
+    return elapsed, hit_ratio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--resources', type=int, default=5000,
+                        help='Rated resources per period')
+    parser.add_argument('--periods', type=int, default=12,
+                        help='Number of rated periods')
+    parser.add_argument('--flavors', type=int, default=50,
+                        help='Number of flavors')
+    args = parser.parse_args()
+    CONF([], project='cloudkitty')
+
+    results = {}
+    for name, memoization_size in (('no memoization', 0),
+                                   ('memoization', 10000)):
+        res = benchutils.measure(rate, args, memoization_size)
+        # NOTE: only account for the rating, not for building the frames
+        res['time'], res['extra'] = res['extra']
+        results[name] = res
+    benchutils.print_results(
+        'Rating {} periods of {} resources'.format(
+            args.periods, args.resources), results)
+    for name, res in results.items():
+        print('{}: {:.1f}% hit ratio'.format(name, res['extra']))
+
+
+if __name__ == '__main__':
+    main()
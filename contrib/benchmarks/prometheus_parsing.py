@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Memory used by the Prometheus collector to fetch a large vector result.
+
+A local server stands for Prometheus and answers the query of the collector
+with a vector of --series series. "parsed response" reproduces the former
+PrometheusCollectorBase._fetch_points, which decoded the whole response with
+res.json() and converted every value in its own decimal context. "streamed
+response" goes through the current implementation, which decodes the result
+items as the response is read and converts their values in batches.
+"""
+import argparse
+import datetime
+
+import benchutils
+from oslo_config import cfg
+import prometheus_session
+
+from cloudkitty.collector import prometheus
+from cloudkitty.common import prometheus_client
+
+
+class _LegacyCollector(prometheus.PrometheusCollector):
+
+    def _fetch_points(self, metric_name, start, end, scope_id=None):
+        scope_key = cfg.CONF.collect.scope_key
+        query = self._build_metric_query(metric_name, start, end, scope_id)
+        res = self._conn.get_instant(query, end.isoformat())
+        output = []
+        for item in res['data']['result']:
+            item_scope_id = item['metric'].get(scope_key, '')
+            metadata, groupby, qty = self._format_data(
+                metric_name, scope_key, item_scope_id, start, end, item)
+            output.append((item_scope_id, self._create_data_point(
+                self.conf[metric_name], qty, 0, groupby, metadata, start)))
+        return output
+
+
+def fetch(collector_class, url):
+    collector = collector_class(
+        period=3600,
+        conf={'metrics': {'instance': {
+            'unit': 'instance',
+            'groupby': ['instance'],
+            'metadata': ['flavor_name'],
+            'extra_args': {'aggregation_method': 'max'},
+        }}})
+    collector._conn = prometheus_client.PrometheusClient(url)
+    start = datetime.datetime(2026, 1, 1)
+    data = collector.fetch_all_scopes(
+        'instance', start, start + datetime.timedelta(hours=1))
+    return sum(len(points) for points in data.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, default=200000,
+                        help='Number of series in the query result')
+    args = parser.parse_args()
+
+    server = prometheus_session.start_server(args.series)
+    url = 'http://127.0.0.1:{}/api/v1'.format(server.server_port)
+    results = {}
+    for name, collector_class in (
+            ('parsed response', _LegacyCollector),
+            ('streamed response', prometheus.PrometheusCollector)):
+        results[name] = benchutils.measure(fetch, collector_class, url)
+    server.shutdown()
+
+    benchutils.print_results(
+        'Fetching {} series ({} bytes response)'.format(
+            args.series, len(prometheus_session._Handler.body)),
+        results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Prometheus queries per second, with and without a pooled HTTP session.
+
+Queries are sent by several threads, as the collector does for the metrics
+of a scope, to a local HTTP/1.1 server standing for Prometheus. The server
+answers every query with the same vector result, gzip-compressed when the
+client accepts it, as Prometheus does.
+
+"requests.get per query" opens a new connection for each query, as
+PrometheusClient used to. "pooled session" keeps the connections alive,
+and "pooled session, no gzip" also asks for uncompressed responses, as
+with the response_compression option disabled. The
+server is local: the cost of a TLS handshake or of a slow network is not
+included, and would widen the gap.
+"""
+import argparse
+from concurrent import futures
+import gzip
+import http.server
+import json
+import socket
+import threading
+
+import benchutils
+import requests
+
+from cloudkitty.common import prometheus_client
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = b''
+    gzip_body = b''
+
+    def setup(self):
+        super(_Handler, self).setup()
+        # NOTE: As done by Prometheus, otherwise the body written after the
+        # headers waits for a delayed ACK.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        body = self.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = self.gzip_body
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _RequestsGetClient(prometheus_client.PrometheusClient):
+
+    def _get(self, endpoint, params, stream=False):
+        return requests.get(
+            '{}/{}'.format(self.url, endpoint),
+            params=params,
+            auth=self.auth,
+            verify=self.verify,
+            timeout=self.timeout,
+            stream=stream,
+        )
+
+
+def start_server(series):
+    result = [{'metric': {'project_id': 'project{}'.format(i % 10),
+                          'instance': 'instance-{}'.format(i),
+                          'flavor_name': 'm1.small'},
+               'value': [1546300800, '1']} for i in range(series)]
+    _Handler.body = json.dumps({
+        'status': 'success',
+        'data': {'resultType': 'vector', 'result': result},
+    }).encode()
+    _Handler.gzip_body = gzip.compress(_Handler.body)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_queries(client, queries, threads):
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(
+            lambda _: client.get_instant('up'), range(queries))
+        return sum(len(res['data']['result']) for res in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--queries', type=int, default=2000,
+                        help='Number of queries per scenario')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Number of threads sending queries')
+    parser.add_argument('--series', type=int, default=100,
+                        help='Number of series per query result')
+    args = parser.parse_args()
+
+    server = start_server(args.series)
+    url = 'http://127.0.0.1:{}/api/v1'.format(server.server_port)
+    results = {}
+    for name, client in (
+            ('requests.get per query', _RequestsGetClient(url)),
+            ('pooled session', prometheus_client.PrometheusClient(
+                url, pool_size=args.threads)),
+            ('pooled session, no gzip', prometheus_client.PrometheusClient(
+                url, pool_size=args.threads, compression=False))):
+        results[name] = benchutils.measure(
+            run_queries, client, args.queries, args.threads)
+    server.shutdown()
+
+    benchutils.print_results(
+        '{} queries, {} threads, {} series per result ({} bytes, {} '
+        'gzipped)'.format(args.queries, args.threads, args.series,
+                          len(_Handler.body), len(_Handler.gzip_body)),
+        results)
+    for name, res in results.items():
+        print('{}: {:.0f} queries/s'.format(
+            name, args.queries / res['time']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Latency of quote requests, with a worker per quote or a quote engine.
+
+Quotes are answered by RatingEndpoint.quote, as they are by a processor
+receiving the RPC call, with the HashMap module enabled. The rules are
+flavor mappings stored in an in-memory SQLite database. "worker per quote"
+builds an APIWorker for each quote, as RatingEndpoint.quote used to.
+"""
+import argparse
+import datetime
+import time
+
+import benchutils
+from oslo_config import cfg
+
+from cloudkitty.db import api as ck_db_api
+from cloudkitty import orchestrator
+from cloudkitty.rating import hash
+
+CONF = cfg.CONF
+
+QUOTE_DATA = {'usage': {'instance': [
+    {'vol': {'unit': 'instance', 'qty': 1},
+     'desc': {'metadata': {'flavor': 'm1.flavor7'}}}]}}
+
+
+def setup_rules(rules):
+    CONF.set_override('connection', 'sqlite://', 'database')
+    conn = ck_db_api.get_instance()
+    conn.get_migration().upgrade('head')
+    conn.get_module_info().set_state('hashmap', True)
+
+    db_api = hash.HashMap.db_api
+    db_api.get_migration().upgrade('head')
+    service_db = db_api.create_service('instance')
+    field_db = db_api.create_field(service_db.service_id, 'flavor')
+    # NOTE: Quotes start at the current second, rules must be valid by then
+    start = datetime.datetime.now() - datetime.timedelta(days=1)
+    for i in range(rules):
+        db_api.create_mapping(
+            name='mapping{}'.format(i),
+            created_by='benchmark',
+            value='m1.flavor{}'.format(i),
+            cost='1.5',
+            map_type='flat',
+            field_id=field_db.field_id,
+            start=start)
+
+
+class _WorkerPerQuoteEndpoint(orchestrator.RatingEndpoint):
+    """The quote engine is replaced by a new APIWorker for each quote."""
+
+    class _Engine(object):
+
+        def quote(self, frame):
+            return orchestrator.APIWorker().quote(frame)
+
+        def invalidate(self):
+            pass
+
+    def __init__(self, orchestrator):
+        super(_WorkerPerQuoteEndpoint, self).__init__(orchestrator)
+        self._quote_engine = self._Engine()
+
+
+def run_quotes(endpoint_class, rules, quotes):
+    setup_rules(rules)
+    endpoint = endpoint_class(None)
+    # NOTE: The first quote warms up the engine
+    price = endpoint.quote({}, QUOTE_DATA)
+    start = time.perf_counter()
+    for _ in range(quotes):
+        endpoint.quote({}, QUOTE_DATA)
+    return time.perf_counter() - start, price
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, nargs='+',
+                        default=[10, 1000, 5000],
+                        help='Numbers of HashMap mappings to test')
+    parser.add_argument('--quotes', type=int, default=200,
+                        help='Number of quotes per scenario')
+    args = parser.parse_args()
+    CONF([], project='cloudkitty')
+
+    for rules in args.rules:
+        results = {}
+        for name, endpoint_class in (
+                ('worker per quote', _WorkerPerQuoteEndpoint),
+                ('quote engine', orchestrator.RatingEndpoint)):
+            res = benchutils.measure(
+                run_quotes, endpoint_class, rules, args.quotes)
+            res['time'], price = res['extra']
+            results[name] = res
+        benchutils.print_results(
+            '{} quotes with {} HashMap mappings (price: {})'.format(
+                args.quotes, rules, price), results)
+        for name, res in results.items():
+            print('{}: {:.2f} ms per quote, {:.0f} quotes/s'.format(
+                name, res['time'] / args.quotes * 1e3,
+                args.quotes / res['time']))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Lock attempts per processed scope, with and without scope sharding.
+
+N processor workers run one processing cycle over the same scopes. Time is
+simulated in steps: at each step, every idle worker tries to lock the next
+scope of its list. Processing a scope keeps its lock for a few steps, and a
+scope already processed during the cycle is released immediately, as the
+worker finds nothing to do.
+
+Without sharding, every worker goes through the whole shuffled list of
+scopes. With sharding, workers join a tooz group (file driver) and each one
+only goes through the scopes it owns on the hash ring.
+"""
+import argparse
+import random
+import tempfile
+
+from tooz import coordination
+
+
+def run_cycle(workers_scopes, cost):
+    """Simulates a cycle, returns (lock attempts, failed, processed)."""
+    held = {}
+    processed = set()
+    attempts = failed = 0
+    positions = [0] * len(workers_scopes)
+    busy = [None] * len(workers_scopes)
+    while True:
+        active = False
+        for worker, scopes in enumerate(workers_scopes):
+            if busy[worker] is not None:
+                scope, remaining = busy[worker]
+                if remaining > 1:
+                    busy[worker] = (scope, remaining - 1)
+                    active = True
+                    continue
+                del held[scope]
+                processed.add(scope)
+                busy[worker] = None
+            if positions[worker] >= len(scopes):
+                continue
+            active = True
+            scope = scopes[positions[worker]]
+            positions[worker] += 1
+            attempts += 1
+            if scope in held:
+                failed += 1
+            elif scope not in processed:
+                held[scope] = worker
+                busy[worker] = (scope, cost)
+        if not active:
+            return attempts, failed, len(processed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Number of processor workers')
+    parser.add_argument('--scopes', type=int, default=5000,
+                        help='Number of scopes')
+    parser.add_argument('--cost', type=int, default=5,
+                        help='Steps needed to process a scope')
+    args = parser.parse_args()
+
+    scopes = ['scope-{}'.format(i) for i in range(args.scopes)]
+
+    unsharded = []
+    for _ in range(args.workers):
+        worker_scopes = list(scopes)
+        random.shuffle(worker_scopes)
+        unsharded.append(worker_scopes)
+
+    with tempfile.TemporaryDirectory() as lock_dir:
+        coordinators = []
+        partitioners = []
+        for i in range(args.workers):
+            coord = coordination.get_coordinator(
+                'file://' + lock_dir, 'worker-{}'.format(i).encode('ascii'))
+            coord.start()
+            coordinators.append(coord)
+            partitioners.append(
+                coord.join_partitioned_group(b'cloudkitty-benchmark'))
+        sharded = []
+        for coord, partitioner in zip(coordinators, partitioners):
+            coord.run_watchers()
+            sharded.append([scope for scope in scopes
+                            if partitioner.belongs_to_self(scope)])
+        for coord in coordinators:
+            coord.stop()
+
+    owned = [len(s) for s in sharded]
+    print('{} workers, {} scopes (owned per worker: min {}, max {})'.format(
+        args.workers, args.scopes, min(owned), max(owned)))
+    print('{:<12} {:>14} {:>14} {:>10} {:>22}'.format(
+        'scenario', 'lock attempts', 'failed locks', 'processed',
+        'attempts per processed'))
+    for name, workers_scopes in (('unsharded', unsharded),
+                                 ('sharded', sharded)):
+        attempts, failed, processed = run_cycle(workers_scopes, args.cost)
+        print('{:<12} {:>14} {:>14} {:>10} {:>22.2f}'.format(
+            name, attempts, failed, processed, attempts / processed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Backfill of a late scope, period by period vs in catch-up mode.
+
+A Worker processes a scope which is several days behind. The collector,
+the storage backend and the state database are replaced by in-memory fakes
+adding a fixed latency to each call (one query, one push, one state
+update), which is where most of the time goes in a real deployment.
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import benchutils
+from oslo_config import cfg
+import yaml
+
+from cloudkitty import collector
+from cloudkitty import orchestrator
+from cloudkitty.utils import tz as tzutils
+
+CONF = cfg.CONF
+
+
+class _Collector(collector.BaseCollector):
+    collector_name = 'benchmark'
+
+    def __init__(self, latency, resources, **kwargs):
+        super(_Collector, self).__init__(**kwargs)
+        self.latency = latency
+        self.resources = resources
+
+    def _points(self, metric_name, start):
+        return [self._create_data_point(
+            self.conf[metric_name], 1, 0,
+            {'id': str(i), 'project_id': 'scope'},
+            {'flavor_name': 'm1.small'}, start)
+            for i in range(self.resources)]
+
+    def fetch_all(self, metric_name, start, end, project_id=None,
+                  q_filter=None):
+        time.sleep(self.latency)
+        return self._points(metric_name, start)
+
+    def fetch_all_periods(self, metric_name, start, end, scope_id,
+                          q_filter=None):
+        # One range query for the whole window
+        time.sleep(self.latency)
+        return {period_start: self._points(metric_name, period_start)
+                for period_start in self._iter_periods(start, end)}
+
+
+class _Storage(object):
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.frames = 0
+
+    def push(self, dataframes, scope_id=None):
+        time.sleep(self.latency)
+        self.frames += len(dataframes)
+
+
+class _State(object):
+
+    def __init__(self, latency, timestamp):
+        self.latency = latency
+        self.timestamp = timestamp
+
+    def get_last_processed_timestamp(self, identifier):
+        time.sleep(self.latency)
+        return self.timestamp
+
+    def set_last_processed_timestamp(self, identifier, timestamp):
+        time.sleep(self.latency)
+        self.timestamp = timestamp
+
+    def is_storage_scope_active(self, identifier):
+        time.sleep(self.latency)
+        return True
+
+
+class _Worker(orchestrator.Worker):
+
+    def _load_rating_processors(self):
+        self._processors = []
+
+
+def backfill(args, threshold):
+    CONF.set_override('catch_up_threshold', threshold, 'orchestrator')
+    period = CONF.collect.period
+    now = tzutils.localized_now().replace(minute=0, second=0)
+    last_processed = tzutils.substract_delta(
+        now, datetime.timedelta(
+            seconds=period * (args.periods + CONF.collect.wait_periods + 1)))
+
+    conf = {'metrics': {
+        'metric{}'.format(i): {'unit': 'instance',
+                               'groupby': ['id', 'project_id'],
+                               'metadata': ['flavor_name']}
+        for i in range(args.metrics)}}
+    with tempfile.NamedTemporaryFile('w', suffix='.yml',
+                                     delete=False) as conf_file:
+        yaml.safe_dump(conf, conf_file)
+    CONF.set_override('metrics_conf', conf_file.name, 'collect')
+    try:
+        storage = _Storage(args.latency)
+        worker = _Worker(
+            _Collector(args.latency, args.resources,
+                       period=period, conf=conf),
+            storage, 'scope', 0)
+        worker._state = _State(args.latency, last_processed)
+        worker.run()
+    finally:
+        os.unlink(conf_file.name)
+    return storage.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--periods', type=int, default=168,
+                        help='Number of late periods')
+    parser.add_argument('--metrics', type=int, default=5,
+                        help='Number of collected metrics')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Points per metric and period')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Latency of a query, push or state update, in '
+                             'seconds')
+    args = parser.parse_args()
+    CONF([], project='cloudkitty')
+
+    results = {}
+    for name, threshold in (('period by period', 0), ('catch-up', 2)):
+        results[name] = benchutils.measure(backfill, args, threshold)
+    benchutils.print_results(
+        'Backfilling {} periods of {} metrics ({} s latency per call)'.format(
+            args.periods, args.metrics, args.latency), results)
+    for name, res in results.items():
+        print('{}: {} frames stored'.format(name, res['extra']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Per-scope overhead of building a Worker, with and without a context.
+
+A Worker is built for each scope, as CloudKittyProcessor.process_scope
+does, without processing anything. The metrics configuration shipped in
+etc/cloudkitty/metrics.yml is used. Rating modules are fakes whose
+"enabled" check adds a fixed latency, standing for the database query
+made by the extension manager for each loaded module.
+"""
+import argparse
+import os
+import time
+
+import benchutils
+from oslo_config import cfg
+from stevedore import extension
+
+from cloudkitty import orchestrator
+from cloudkitty import rating
+
+CONF = cfg.CONF
+
+METRICS_CONF = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                            'etc', 'cloudkitty', 'metrics.yml')
+
+
+class _RatingModule(rating.RatingProcessorBase):
+    module_name = 'benchmark'
+    latency = 0
+
+    @property
+    def enabled(self):
+        time.sleep(self.latency)
+        return True
+
+    @property
+    def priority(self):
+        return 1
+
+    def process(self, data):
+        return data
+
+    def reload_config(self, start=None):
+        pass
+
+
+def _extension_manager(namespace, invoke_kwds):
+    extensions = []
+    for i in range(_RatingModule.modules):
+        module = _RatingModule(**invoke_kwds)
+        # Done by the extension manager for each module
+        if not module.enabled:
+            continue
+        extensions.append(extension.Extension(
+            'module{}'.format(i), None, None, module))
+    return extension.ExtensionManager.make_test_instance(
+        extensions, namespace)
+
+
+def build_workers(scopes, shared):
+    context = orchestrator.WorkerContext(0) if shared else None
+    for i in range(scopes):
+        worker = orchestrator.Worker(None, None, 'scope{}'.format(i), 0,
+                                     context=context)
+        if not shared:
+            worker.thread_executor.shutdown()
+    if context is not None:
+        context.close()
+    return scopes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scopes', type=int, default=10000,
+                        help='Number of scopes')
+    parser.add_argument('--modules', type=int, default=2,
+                        help='Number of enabled rating modules')
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='Latency of a module "enabled" check, in '
+                             'seconds')
+    args = parser.parse_args()
+    CONF([], project='cloudkitty')
+    CONF.set_override('metrics_conf', os.path.abspath(METRICS_CONF),
+                      'collect')
+    _RatingModule.modules = args.modules
+    _RatingModule.latency = args.latency
+    orchestrator.extension_manager.EnabledExtensionManager = \
+        _extension_manager
+
+    results = {}
+    for name, shared in (('worker per scope', False),
+                         ('shared worker context', True)):
+        results[name] = benchutils.measure(build_workers, args.scopes, shared)
+    benchutils.print_results(
+        'Building Workers for {} scopes ({} rating modules)'.format(
+            args.scopes, args.modules), results)
+    for name, res in results.items():
+        print('{}: {:.1f} us per scope'.format(
+            name, res['time'] / res['extra'] * 1e6))
+
+
+if __name__ == '__main__':
+    main()